@@ -0,0 +1,243 @@
+# 借阅分析
+# 把借阅记录(含已归档的记录)连同图书分类批量读入 NumPy 数组(列式快照)，以向量化方式计算:
+#   - 借阅时长分位数
+#   - 各分类的借出数、利用率(借出 / 总册数)和借阅量
+#   - 按星期 / 小时统计的借阅量
+#   - 按应还月份统计的逾期率趋势
+# 快照按记录 id 增量更新：只读取 id 大于快照最大 id 的记录。PostgreSQL 在插入时分配 id，
+# 较小 id 的记录可能晚于较大 id 的记录提交，因此每次回读最大 id 之前 ID_OVERLAP 个 id 的范围，补上晚提交的记录；
+# 已有记录唯一会变化的是归还日期，只需复查快照中仍未归还的少量记录。
+# 图书后来修改分类不会反映到已读入的记录上，需要时调用 reset() 重新读取。
+#
+# 需要 numpy。
+
+import datetime
+import threading
+import time
+
+import numpy as np
+from sqlalchemy import select, func, type_coerce, String
+from models import Book, BorrowRecord
+from logger_config import logger
+import loan_archive
+
+LOAD_CHUNK_SIZE = 100000
+# 增量读取时回读的 id 范围：借还事务很短，晚提交的记录 id 不会落后这么多。
+# SQLite 的写事务串行执行，id 按提交顺序分配，不需要回读
+ID_OVERLAP = 1000
+UNCATEGORIZED = "(未分类)"
+
+
+def _timestamps(values):
+    # SQLite 中的日期时间是文本，直接交给 NumPy 解析，比逐行转换为 datetime 快得多；None 解析为 NaT
+    return np.array(values, dtype="datetime64[us]").astype("datetime64[s]")
+
+
+class LoanSnapshot:
+    """借阅记录的列式快照，各数组按 id 升序排列"""
+
+    def __init__(self):
+        self.ids = np.empty(0, dtype=np.int64)
+        self.category = np.empty(0, dtype=np.int32)       # 分类编号，对应 categories
+        self.borrowed = np.empty(0, dtype="datetime64[s]")
+        self.due = np.empty(0, dtype="datetime64[s]")
+        self.returned = np.empty(0, dtype="datetime64[s]")  # 未归还为 NaT
+        self.categories = []
+        self.category_codes = {}    # 数据库中的分类值(可能为 None) -> 编号
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def max_id(self):
+        return int(self.ids[-1]) if len(self.ids) else 0
+
+    def _codes(self, categories):
+        for category in set(categories) - set(self.category_codes):
+            self.category_codes[category] = len(self.categories)
+            self.categories.append(category or UNCATEGORIZED)
+        return np.fromiter(map(self.category_codes.__getitem__, categories), dtype=np.int32, count=len(categories))
+
+    def refresh(self, db):
+        """增量更新，返回 (新增记录数, 更新归还日期的记录数)"""
+        return self._load_new(db), self._update_returns(db)
+
+    def _load_new(self, db):
+        books = Book.__table__
+        overlap = 0 if db.get_bind().dialect.name == "sqlite" else ID_OVERLAP
+        after_id = max(self.max_id - overlap, 0)
+        loans = loan_archive.loans(include_archive=True, where=lambda t: t.c.id > after_id)
+        stmt = select(
+            loans.c.id, books.c.category, type_coerce(loans.c.borrow_date, String),
+            type_coerce(loans.c.due_date, String), type_coerce(loans.c.return_date, String),
+        ).select_from(loans.outerjoin(books, books.c.id == loans.c.book_id))
+
+        parts = []
+        # 只用 Core 读取元组，不经过 ORM 的结果处理
+        result = db.connection().execute(stmt.execution_options(stream_results=True))
+        for rows in result.partitions(LOAD_CHUNK_SIZE):
+            ids, categories, borrowed, due, returned = zip(*rows)
+            parts.append((
+                np.array(ids, dtype=np.int64),
+                self._codes(categories),
+                _timestamps(borrowed), _timestamps(due), _timestamps(returned),
+            ))
+        if not parts:
+            return 0
+
+        columns = [np.concatenate(arrays) for arrays in zip(*parts)]
+        # 回读范围内已在快照中的记录跳过
+        known = self.ids[np.searchsorted(self.ids, after_id, side="right"):]
+        if len(known):
+            new = ~np.isin(columns[0], known)
+            columns = [column[new] for column in columns]
+        if not len(columns[0]):
+            return 0
+
+        # 冷热两张表的记录交错，晚提交的记录 id 可能小于快照最大 id：
+        # 只把快照中 id 大于新记录最小 id 的一段与新记录合并排序，其余部分不动
+        old = (self.ids, self.category, self.borrowed, self.due, self.returned)
+        split = int(np.searchsorted(self.ids, columns[0].min()))
+        tails = [np.concatenate((column[split:], added)) for column, added in zip(old, columns)]
+        order = np.argsort(tails[0], kind="stable")
+        self.ids, self.category, self.borrowed, self.due, self.returned = [
+            np.concatenate((column[:split], tail[order])) for column, tail in zip(old, tails)
+        ]
+        return len(columns[0])
+
+    def _update_returns(self, db):
+        open_ids = self.ids[np.isnat(self.returned)]
+        if not len(open_ids):
+            return 0
+        # 当前未归还的记录走部分索引，数量很少
+        still_open = np.fromiter(
+            (record_id for (record_id,) in db.query(BorrowRecord.id).filter(BorrowRecord.return_date == None)),
+            dtype=np.int64,
+        )
+        closed = open_ids[~np.isin(open_ids, still_open)]
+        if not len(closed):
+            return 0
+
+        found_ids, found_dates = [], []
+        for start in range(0, len(closed), 500):
+            chunk = [int(record_id) for record_id in closed[start:start + 500]]
+            loans = loan_archive.loans(include_archive=True, where=lambda t: t.c.id.in_(chunk))
+            for record_id, returned in db.connection().execute(
+                select(loans.c.id, type_coerce(loans.c.return_date, String))
+            ):
+                found_ids.append(record_id)
+                found_dates.append(returned)
+
+        positions = np.searchsorted(self.ids, np.array(found_ids, dtype=np.int64))
+        self.returned[positions] = _timestamps(found_dates)
+        # 已被删除的记录(例如随图书一起删除)从快照中去掉
+        missing = np.setdiff1d(closed, found_ids)
+        if len(missing):
+            keep = ~np.isin(self.ids, missing)
+            self.ids, self.category, self.borrowed, self.due, self.returned = [
+                column[keep] for column in (self.ids, self.category, self.borrowed, self.due, self.returned)
+            ]
+        return len(found_ids)
+
+
+# ==========================================
+# 指标计算(纯函数，输入快照和当前时间)
+# ==========================================
+def loan_durations(snapshot, window):
+    """已归还记录的借阅时长(天)分位数"""
+    closed = window & ~np.isnat(snapshot.returned)
+    days = (snapshot.returned[closed] - snapshot.borrowed[closed]).astype(np.float64) / 86400.0
+    if not len(days):
+        return {"count": 0}
+    p50, p90, p95, p99 = np.percentile(days, [50, 90, 95, 99])
+    return {
+        "count": int(len(days)), "mean": round(float(days.mean()), 2),
+        "p50": round(float(p50), 2), "p90": round(float(p90), 2),
+        "p95": round(float(p95), 2), "p99": round(float(p99), 2),
+    }
+
+
+def category_utilization(snapshot, window, copies):
+    """各分类: (分类, 总册数, 当前借出, 利用率, 窗口内借阅量)，按借阅量降序；copies 为 {分类: 总册数}"""
+    size = len(snapshot.categories)
+    on_loan = np.bincount(snapshot.category[np.isnat(snapshot.returned)], minlength=size)
+    borrows = np.bincount(snapshot.category[window], minlength=size)
+    rows = []
+    for code, category in enumerate(snapshot.categories):
+        total = copies.get(category, 0)
+        rate = on_loan[code] / total if total else 0.0
+        rows.append((category, int(total), int(on_loan[code]), round(float(rate), 4), int(borrows[code])))
+    rows.sort(key=lambda row: row[4], reverse=True)
+    return rows
+
+
+def borrows_by_time(snapshot, window):
+    """按星期(周一为 0)和小时统计的借阅量"""
+    seconds = snapshot.borrowed[window].astype(np.int64)
+    days = seconds // 86400
+    # 1970-01-01 是星期四
+    weekday = np.bincount((days + 3) % 7, minlength=7)
+    hour = np.bincount((seconds - days * 86400) // 3600, minlength=24)
+    return [int(n) for n in weekday], [int(n) for n in hour]
+
+
+def overdue_trend(snapshot, now, months):
+    """最近 months 个月按应还月份统计: [(月份, 到期数, 逾期数, 逾期率), ...]，只统计已到期的记录"""
+    due_month = snapshot.due.astype("datetime64[M]")
+    first = np.datetime64(now, "M") - (months - 1)
+    offset = (due_month - first).astype(np.int64)
+    matured = ~np.isnat(snapshot.due) & (snapshot.due < now) & (offset >= 0) & (offset < months)
+    # 逾期：归还晚于应还日期，或到期仍未归还
+    late = (snapshot.returned > snapshot.due) | np.isnat(snapshot.returned)
+
+    due_count = np.bincount(offset[matured], minlength=months)
+    late_count = np.bincount(offset[matured & late], minlength=months)
+    trend = []
+    for i in range(months):
+        if due_count[i]:
+            rate = round(float(late_count[i] / due_count[i]), 4)
+            trend.append((str(first + i), int(due_count[i]), int(late_count[i]), rate))
+    return trend
+
+
+# ==========================================
+# 进程内共享的快照
+# ==========================================
+_snapshot = LoanSnapshot()
+_lock = threading.Lock()
+
+
+def reset():
+    global _snapshot
+    with _lock:
+        _snapshot = LoanSnapshot()
+
+
+def compute(db, days=365, months=12):
+    """增量更新快照后计算全部指标；days 为借阅时长、分类借阅量和时段统计的时间窗口"""
+    with _lock:
+        start = time.perf_counter()
+        added, returned = _snapshot.refresh(db)
+        refreshed = time.perf_counter()
+
+        now = np.datetime64(datetime.datetime.now(), "s")
+        window = _snapshot.borrowed >= now - np.timedelta64(days, "D")
+        copies = {
+            category or UNCATEGORIZED: int(total or 0)
+            for category, total in db.query(Book.category, func.sum(Book.total_copies)).group_by(Book.category)
+        }
+        weekday, hour = borrows_by_time(_snapshot, window)
+        result = {
+            "records": len(_snapshot),
+            "window_days": days,
+            "durations": loan_durations(_snapshot, window),
+            "categories": category_utilization(_snapshot, window, copies),
+            "weekday": weekday,
+            "hour": hour,
+            "overdue_trend": overdue_trend(_snapshot, now, months),
+        }
+        elapsed = time.perf_counter() - start
+        result["elapsed_ms"] = round(elapsed * 1000, 1)
+    logger.info(f"Analytics over {len(_snapshot)} loans: +{added} new, {returned} returned, "
+                f"refresh {(refreshed - start) * 1000:.0f} ms, total {elapsed * 1000:.0f} ms")
+    return result
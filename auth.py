@@ -5,7 +5,9 @@ import hashlib
 from sqlalchemy.orm import Session
 from models import User
 from logger_config import logger
+from instrumentation import instrument
 
+@instrument
 class AuthManager:
     
     # 初始对象实例
@@ -46,11 +48,13 @@ class AuthManager:
         user = self.db.query(User).filter(User.username == username).first()
         
         if user and user.password_hash == self.hash_password(password):
+            # 与会话分离：登录后的用户对象只读取已加载的属性，可在之后的其他会话中使用
+            self.db.expunge(user)
             self.current_user = user
-            logger.info(f"User logged in: {username}")
+            logger.info(f"User logged in: {username}", extra={"user": username})
             return True, "登录成功"
         
-        logger.warning(f"Login failed for user: {username}")
+        logger.warning(f"Login failed for user: {username}", extra={"user": username})
         return False, "用户名或密码错误"
 
     # 用户登出
@@ -0,0 +1,184 @@
+# 离线批量识别条码
+# 对图片目录或视频文件中的书籍条码进行识别，多进程并行，无需摄像头和界面。
+# 结果以 JSONL 输出(isbn, source, frame, confidence)，可选直接导入图书库存。
+# 用法:
+#   python batch_scan.py photos/ -o result.jsonl
+#   python batch_scan.py shelf.mp4 --step 5 --import --user admin
+
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+
+from scanner import decode_image, is_valid_isbn13
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp")
+
+# 识别方式对应的置信度：区域定位解码 > 全图兜底解码
+METHOD_CONFIDENCE = {"roi": 1.0, "full": 0.8}
+# 视频中同一 ISBN 被识别到这么多帧即视为完全可信
+VIDEO_FULL_CONFIDENCE_READS = 3
+
+
+def _decode_file(path):
+    gray = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    if gray is None:
+        return path, None
+    return path, decode_image(gray)
+
+
+def _decode_frame(item):
+    frame_index, gray = item
+    return frame_index, decode_image(gray)
+
+
+def list_images(directory):
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                yield os.path.join(root, name)
+
+
+def read_video_frames(path, step):
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise RuntimeError(f"无法打开视频: {path}")
+    index = 0
+    try:
+        while True:
+            ok = cap.grab()
+            if not ok:
+                break
+            # 只解码需要的帧
+            if index % step == 0:
+                ok, frame = cap.retrieve()
+                if ok:
+                    yield index, cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            index += 1
+    finally:
+        cap.release()
+
+
+def bounded_map(pool, fn, items, max_pending):
+    """按顺序返回结果，同时最多只有 max_pending 个任务在途，内存占用不随输入增长"""
+    pending = deque()
+    for item in items:
+        pending.append(pool.submit(fn, item))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def scan_images(directory, workers):
+    """逐条产出图片识别结果"""
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for path, codes in bounded_map(pool, _decode_file, list_images(directory), workers * 4):
+            if codes is None:
+                yield {"error": "无法读取图片", "source": path}
+                continue
+            for code, method in codes:
+                yield {
+                    "isbn": code,
+                    "source": path,
+                    "frame": None,
+                    "confidence": METHOD_CONFIDENCE[method] if is_valid_isbn13(code) else 0.0,
+                }
+
+
+def scan_video(path, workers, step):
+    """按 ISBN 汇总视频识别结果：首次出现的帧号、识别到的帧数和置信度"""
+    seen = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        frames = read_video_frames(path, step)
+        for frame_index, codes in bounded_map(pool, _decode_frame, frames, workers * 4):
+            for code, method in codes:
+                entry = seen.setdefault(code, {"frame": frame_index, "reads": 0, "method_confidence": 0.0})
+                entry["reads"] += 1
+                entry["method_confidence"] = max(entry["method_confidence"], METHOD_CONFIDENCE[method])
+
+    for code, entry in sorted(seen.items(), key=lambda item: item[1]["frame"]):
+        confidence = 0.0
+        if is_valid_isbn13(code):
+            confidence = min(1.0, entry["reads"] / VIDEO_FULL_CONFIDENCE_READS) * entry["method_confidence"]
+        yield {
+            "isbn": code,
+            "source": path,
+            "frame": entry["frame"],
+            "reads": entry["reads"],
+            "confidence": round(confidence, 2),
+        }
+
+
+def import_results(records, username, min_confidence):
+    # 每条识别结果计为一册，交给批量导入；库中不存在的 ISBN 会作为错误报告
+    from getpass import getpass
+    from db import get_db
+    from auth import AuthManager
+    from manager import LibraryManager
+
+    db = next(get_db())
+    auth = AuthManager(db)
+    success, msg = auth.login(username, getpass("密码: "))
+    if not success:
+        print(msg, file=sys.stderr)
+        return False
+
+    rows = [{"isbn": r["isbn"], "copies": 1} for r in records if r.get("confidence", 0) >= min_confidence]
+    success, result = LibraryManager(db, auth.current_user).bulk_add_books(rows)
+    if not success:
+        print(result, file=sys.stderr)
+        return False
+    for index, error in result["errors"]:
+        print(f"导入第 {index} 条: {error}", file=sys.stderr)
+    print(f"导入完成: 增加库存 {result['updated']} 种, 错误 {len(result['errors'])}", file=sys.stderr)
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="离线批量识别图书条码")
+    parser.add_argument("source", help="图片目录或视频文件")
+    parser.add_argument("-o", "--output", help="JSONL 输出文件，默认输出到标准输出")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="进程数，默认使用全部 CPU")
+    parser.add_argument("--step", type=int, default=5, help="视频每隔多少帧识别一次")
+    parser.add_argument("--import", dest="do_import", action="store_true", help="识别完成后导入库存")
+    parser.add_argument("--user", help="导入时使用的管理员账号")
+    parser.add_argument("--min-confidence", type=float, default=0.8, help="导入的最低置信度")
+    args = parser.parse_args(argv)
+
+    if args.do_import and not args.user:
+        parser.error("--import 需要指定 --user")
+
+    if os.path.isdir(args.source):
+        records = scan_images(args.source, args.workers)
+    else:
+        records = scan_video(args.source, args.workers, max(1, args.step))
+
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    start = time.perf_counter()
+    count = 0
+    imported = []
+    try:
+        for record in records:
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            count += 1
+            if args.do_import and "isbn" in record:
+                imported.append(record)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f"识别完成: {count} 条结果, 用时 {time.perf_counter() - start:.2f}s", file=sys.stderr)
+
+    if args.do_import and not import_results(imported, args.user, args.min_confidence):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,141 @@
+# 多终端并发借还压测
+# 在临时数据库上启动 N 个进程(模拟 N 个借还终端)同时借还同一批图书，
+# 统计吞吐量、锁冲突失败数，并检查库存没有被超借。
+# 用法: python bench_concurrency.py --terminals 8 --ops 200
+
+import argparse
+import logging
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+
+def _terminal(db_path, terminal_id, user_id, isbns, ops, barrier, results):
+    import db
+    from manager import LibraryManager
+    from models import User
+    from logger_config import logger
+
+    # 压测时只保留警告(锁冲突重试等)
+    logger.setLevel(logging.WARNING)
+    db.DB_URL = f"sqlite:///{db_path}"
+    db.init_db()
+    session = db.SessionLocal()
+    user = session.get(User, user_id)
+    session.expunge(user)
+    manager = LibraryManager(session, user)
+
+    rng = random.Random(terminal_id)
+    counts = {"borrow_ok": 0, "no_stock": 0, "return_ok": 0, "errors": 0, "locked": 0}
+    borrowed = []
+    barrier.wait()
+    start = time.perf_counter()
+    for _ in range(ops):
+        if borrowed and rng.random() < 0.4:
+            success, msg = manager.return_book(borrowed.pop())
+            key = "return_ok" if success else "errors"
+        else:
+            isbn = rng.choice(isbns)
+            success, msg = manager.borrow_book(isbn)
+            if success:
+                borrowed.append(isbn)
+                key = "borrow_ok"
+            else:
+                key = "no_stock" if msg == "暂无库存" else "errors"
+        counts[key] += 1
+        # 锁冲突应由重试消化，不应返回给调用方
+        if not success and "locked" in msg.lower():
+            counts["locked"] += 1
+    counts["elapsed"] = time.perf_counter() - start
+    results.put(counts)
+    session.close()
+
+
+def run(terminals, ops, books, copies, tmpdir=None):
+    import db
+    from auth import AuthManager
+    from models import Book, BorrowRecord, User
+    from logger_config import logger
+
+    logger.setLevel(logging.WARNING)
+    tmpdir = tmpdir or tempfile.mkdtemp(prefix="library_bench_")
+    db_path = os.path.join(tmpdir, "bench.db")
+    db.DB_URL = f"sqlite:///{db_path}"
+    db.init_db()
+
+    session = db.SessionLocal()
+    auth = AuthManager(session)
+    for i in range(terminals):
+        auth.register(f"terminal{i}", "bench")
+    isbns = [f"97800000{i:05d}" for i in range(books)]
+    session.add_all(Book(isbn=isbn, title=f"Bench {isbn}", author="bench", category="bench",
+                         total_copies=copies, available_copies=copies) for isbn in isbns)
+    session.commit()
+    user_ids = [u.id for u in session.query(User).order_by(User.id)]
+    session.close()
+
+    # 每个终端是全新启动的进程，与真实部署一致(也避免 fork 复制日志线程的锁)
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(terminals)
+    results = context.Queue()
+    procs = [
+        context.Process(target=_terminal, args=(db_path, i, user_ids[i], isbns, ops, barrier, results))
+        for i in range(terminals)
+    ]
+    for p in procs:
+        p.start()
+    totals = {"borrow_ok": 0, "no_stock": 0, "return_ok": 0, "errors": 0, "locked": 0}
+    elapsed = 0.0
+    for _ in procs:
+        counts = results.get()
+        elapsed = max(elapsed, counts.pop("elapsed"))
+        for key, value in counts.items():
+            totals[key] += value
+    for p in procs:
+        p.join()
+
+    # 一致性检查：库存不能为负，且 可借 + 未归还 == 总数
+    session = db.SessionLocal()
+    oversold = 0
+    negative = 0
+    for book in session.query(Book):
+        open_loans = session.query(BorrowRecord).filter(
+            BorrowRecord.book_id == book.id, BorrowRecord.return_date == None
+        ).count()
+        negative += book.available_copies < 0
+        if book.available_copies < 0 or book.available_copies + open_loans != book.total_copies:
+            oversold += 1
+    session.close()
+
+    total_ops = terminals * ops
+    return {
+        "terminals": terminals,
+        "ops": total_ops,
+        "elapsed": round(elapsed, 3),
+        "ops_per_sec": round(total_ops / elapsed, 1) if elapsed else 0.0,
+        "inconsistent_books": oversold,
+        "negative_stock_books": negative,
+        **totals,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="多终端并发借还压测")
+    parser.add_argument("--terminals", type=int, default=4, help="并发终端(进程)数")
+    parser.add_argument("--ops", type=int, default=200, help="每个终端的操作次数")
+    parser.add_argument("--books", type=int, default=5, help="图书种数(越少冲突越激烈)")
+    parser.add_argument("--copies", type=int, default=3, help="每种图书的册数")
+    args = parser.parse_args(argv)
+
+    result = run(args.terminals, args.ops, args.books, args.copies)
+    for key, value in result.items():
+        print(f"{key:>20}: {value}")
+    # 有超借或锁冲突失败时返回非零
+    return 1 if result["inconsistent_books"] or result["errors"] or result["locked"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,295 @@
+# 性能基准测试
+# 对 LibraryManager 的主要操作和登录分别执行若干次，统计 p50/p95/p99 延迟和吞吐量，
+# 结果保存为 JSON，便于不同版本之间对比。
+# 会真实执行借书和还书(每次借书后立即归还同一本书)，建议在 datagen.py 生成的测试库上运行。
+#
+# 用法:
+#   python datagen.py --db bench.db --books 100000 --users 10000 --loans 1000000
+#   python benchmark.py --db bench.db --iterations 200 -o before.json
+#   python benchmark.py --db bench.db --iterations 200 -o after.json --compare before.json
+#   python benchmark.py --db bench.db --only list_books_page --only search --catalog
+
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+# 对比时 p50/p95 变慢超过该比例视为性能回退
+REGRESSION_THRESHOLD = 0.2
+
+SEARCH_KEYWORDS = ["数据", "Python", "历史", "王伟", "设计", "Learning", "物理", "CS", "系统原理", "Smith"]
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(latencies, elapsed):
+    values = sorted(latencies)
+    return {
+        "count": len(values),
+        "mean_ms": round(sum(values) / len(values) * 1000, 3) if values else 0.0,
+        "p50_ms": round(percentile(values, 50) * 1000, 3),
+        "p95_ms": round(percentile(values, 95) * 1000, 3),
+        "p99_ms": round(percentile(values, 99) * 1000, 3),
+        "max_ms": round(values[-1] * 1000, 3) if values else 0.0,
+        "ops_per_sec": round(len(values) / elapsed, 1) if elapsed > 0 else 0.0,
+    }
+
+
+def measure(operation, iterations, warmup):
+    # operation() 执行一次被测操作；返回 (延迟列表, 总耗时)
+    for _ in range(warmup):
+        operation()
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(iterations):
+        t = time.perf_counter()
+        operation()
+        latencies.append(time.perf_counter() - t)
+    return latencies, time.perf_counter() - start
+
+
+class Workload:
+    """准备基准测试需要的账号和样本数据，每个操作使用独立的会话(与界面和服务端一致)"""
+
+    def __init__(self, seed, admin, admin_password, password):
+        import db
+        from auth import AuthManager
+        from models import Book, User
+
+        self.rng = random.Random(seed)
+        self.password = password
+        with db.session_scope() as session:
+            auth = AuthManager(session)
+            success, msg = auth.login(admin, admin_password)
+            if not success:
+                raise SystemExit(f"管理员 {admin} 登录失败: {msg}")
+            self.admin = auth.current_user
+
+            readers = session.query(User.username).filter(User.role == "user").order_by(User.id).limit(1000).all()
+            self.readers = [name for (name,) in readers]
+            reader = AuthManager(session)
+            if not self.readers or not reader.login(self.readers[0], password)[0]:
+                raise SystemExit("没有可用的读者账号(请先运行 datagen.py 或通过 --password 指定读者密码)")
+            self.reader = reader.current_user
+
+            # 从有库存的图书中随机抽样，借书后立即归还，不影响后续迭代
+            max_id = session.query(Book.id).order_by(Book.id.desc()).limit(1).scalar() or 0
+            sample_ids = [self.rng.randint(1, max_id) for _ in range(2000)] if max_id else []
+            self.isbns = [isbn for (isbn,) in session.query(Book.isbn).filter(
+                Book.id.in_(sample_ids), Book.available_copies > 1
+            )]
+            if not self.isbns:
+                raise SystemExit("数据库中没有可借的图书")
+
+    def manager(self, session, user):
+        from manager import LibraryManager
+        return LibraryManager(session, user)
+
+    def operations(self):
+        import db
+        from auth import AuthManager
+
+        def list_page():
+            with db.session_scope() as session:
+                self.manager(session, self.reader).list_books_page(None, self.rng.randint(0, 10000), 100)
+
+        def search():
+            with db.session_scope() as session:
+                self.manager(session, self.reader).list_books_page(self.rng.choice(SEARCH_KEYWORDS), 0, 100)
+
+        pending = []
+
+        def borrow():
+            isbn = self.rng.choice(self.isbns)
+            with db.session_scope() as session:
+                success, msg = self.manager(session, self.reader).borrow_book(isbn)
+            if success:
+                pending.append(isbn)
+
+        def return_book():
+            # 归还上一步借出的书；没有时先借一本(不计入借书的统计)
+            if not pending:
+                borrow()
+            isbn = pending.pop()
+            with db.session_scope() as session:
+                self.manager(session, self.reader).return_book(isbn)
+
+        def also_borrowed():
+            with db.session_scope() as session:
+                self.manager(session, self.reader).also_borrowed(self.rng.choice(self.isbns), 5)
+
+        def stats():
+            with db.session_scope() as session:
+                self.manager(session, self.admin).get_stats()
+
+        def login():
+            with db.session_scope() as session:
+                AuthManager(session).login(self.rng.choice(self.readers), self.password)
+
+        # 借书和还书交替执行，保持库存不变
+        return [
+            ("list_books_page", list_page),
+            ("search", search),
+            ("borrow_book", borrow),
+            ("return_book", return_book),
+            ("also_borrowed", also_borrowed),
+            ("get_stats", stats),
+            ("login", login),
+        ]
+
+    def cleanup(self):
+        # 归还基准测试过程中借出、尚未归还的图书
+        import db
+        from models import Book, BorrowRecord
+        with db.session_scope() as session:
+            isbns = [isbn for (isbn,) in session.query(Book.isbn).join(BorrowRecord).filter(
+                BorrowRecord.user_id == self.reader.id, BorrowRecord.return_date == None
+            )]
+        for isbn in isbns:
+            with db.session_scope() as session:
+                self.manager(session, self.reader).return_book(isbn)
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _dataset_size():
+    import db
+    from models import Book, BorrowRecord, BorrowRecordArchive, User
+    with db.session_scope() as session:
+        return {
+            "books": session.query(Book).count(),
+            "users": session.query(User).count(),
+            "borrow_records": session.query(BorrowRecord).count(),
+            "borrow_records_archive": session.query(BorrowRecordArchive).count(),
+        }
+
+
+def run(iterations, warmup, seed, admin, admin_password, password, use_cache, only=None, use_catalog=False):
+    import cache
+    import catalog
+    import db
+    import sqlalchemy
+
+    cache.enabled = use_cache
+    catalog.enabled = use_catalog
+    if use_catalog:
+        # 先同步加载快照，测量的是内存查询本身
+        with db.session_scope() as session:
+            catalog.load(session)
+    workload = Workload(seed, admin, admin_password, password)
+    results = {}
+    try:
+        for name, operation in workload.operations():
+            if only and name not in only:
+                continue
+            latencies, elapsed = measure(operation, iterations, warmup)
+            results[name] = summarize(latencies, elapsed)
+            print(f"{name:>16}: p50 {results[name]['p50_ms']:8.3f} ms  p95 {results[name]['p95_ms']:8.3f} ms  "
+                  f"p99 {results[name]['p99_ms']:8.3f} ms  {results[name]['ops_per_sec']:9.1f} ops/s",
+                  file=sys.stderr)
+    finally:
+        workload.cleanup()
+
+    return {
+        "meta": {
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "sqlalchemy": sqlalchemy.__version__,
+            "platform": platform.platform(),
+            "iterations": iterations,
+            "warmup": warmup,
+            "seed": seed,
+            "cache": use_cache,
+            "catalog": catalog.stats() if use_catalog else None,
+            "dataset": _dataset_size(),
+        },
+        "results": results,
+    }
+
+
+def compare(baseline, current, threshold=REGRESSION_THRESHOLD):
+    """打印两次结果的对比，返回性能回退的操作列表"""
+    regressions = []
+    print(f"{'operation':>16} {'p50 before':>11} {'p50 after':>10} {'change':>8} "
+          f"{'p95 before':>11} {'p95 after':>10} {'change':>8}")
+    for name, after in current["results"].items():
+        before = baseline["results"].get(name)
+        if not before:
+            print(f"{name:>16}  (基准结果中没有该操作)")
+            continue
+        line = f"{name:>16}"
+        regressed = False
+        for key in ("p50_ms", "p95_ms"):
+            change = (after[key] - before[key]) / before[key] if before[key] else 0.0
+            regressed = regressed or change > threshold
+            line += f" {before[key]:11.3f} {after[key]:10.3f} {change:+8.1%}"
+        if regressed:
+            regressions.append(name)
+            line += "  <-- 回退"
+        print(line)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="LibraryManager 性能基准测试")
+    parser.add_argument("--db", help="SQLite 数据库文件(默认使用 db.DB_URL)")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--admin", default="bench_admin", help="用于统计查询的管理员账号")
+    parser.add_argument("--admin-password", default="password")
+    parser.add_argument("--password", default="password", help="读者账号的密码")
+    parser.add_argument("--cache", action="store_true", help="启用查询缓存(默认关闭，测量数据库本身的性能)")
+    parser.add_argument("--catalog", action="store_true", help="启用内存图书目录(list_books_page 在内存中查询)")
+    parser.add_argument("--only", action="append", help="只运行指定的操作，可重复")
+    parser.add_argument("-o", "--output", help="结果 JSON 文件")
+    parser.add_argument("--compare", help="与之前保存的结果 JSON 对比")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    import db
+    from logger_config import logger
+
+    logger.setLevel(logging.WARNING)
+    if args.db:
+        db.DB_URL = f"sqlite:///{args.db}"
+    db.init_db()
+
+    result = run(args.iterations, args.warmup, args.seed, args.admin, args.admin_password,
+                 args.password, args.cache, args.only, args.catalog)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    else:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if compare(baseline, result, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,242 @@
+# 图书查询缓存
+# 进程内的 LRU/TTL 缓存，缓存按 ISBN 查找图书的结果和图书列表的分页查询结果。
+# LibraryManager 自己的写操作提交后精确失效受影响的条目(对应的 ISBN、包含该书的查询结果)。
+# 其他进程(其他终端、HTTP 服务)的写入通过 catalog_version 表中的版本号发现：
+# 增删改图书、批量导入在同一事务中把版本号加一，本进程最多每隔 VERSION_CHECK_INTERVAL 秒读取一次，
+# 发现版本号不是自己写入的就清空缓存。
+# 借还只改变库存，不更新版本号(否则所有写事务都要更新同一行而互相排队)，
+# 因此缓存的查询结果只用来确定是哪些图书，库存每次按主键从数据库读取(with_stock)。
+
+import threading
+import time
+from collections import OrderedDict
+
+from models import Book, CatalogVersion
+from logger_config import logger
+
+enabled = True
+
+# 其他进程的写入最多在这段时间(秒)后被发现
+VERSION_CHECK_INTERVAL = 1.0
+CATALOG = "catalog"
+
+
+class LRUCache:
+    """线程安全的 LRU 缓存，条目超过 ttl 秒后失效"""
+
+    def __init__(self, maxsize=1024, ttl=60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data = OrderedDict()   # key -> (value, 过期时间)
+        self.lock = threading.Lock()
+        # 每次失效加一：加载期间发生过失效时不写入缓存，避免把失效前读到的旧数据放回去
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.hit_time = 0.0
+        self.miss_time = 0.0
+
+    def get(self, key):
+        """返回 (是否命中, 值)"""
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is None:
+                return False, None
+            if entry[1] < time.monotonic():
+                del self.data[key]
+                return False, None
+            self.data.move_to_end(key)
+            return True, entry[0]
+
+    def put(self, key, value, generation=None):
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+            self.data[key] = (value, time.monotonic() + self.ttl)
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_load(self, key, loader, cache_none=True):
+        start = time.perf_counter()
+        hit, value = self.get(key)
+        if hit:
+            self.hits += 1
+            self.hit_time += time.perf_counter() - start
+            return value
+
+        generation = self.generation
+        value = loader()
+        if value is not None or cache_none:
+            self.put(key, value, generation)
+        self.misses += 1
+        self.miss_time += time.perf_counter() - start
+        return value
+
+    def pop(self, key):
+        with self.lock:
+            self.generation += 1
+            self.data.pop(key, None)
+
+    def invalidate_where(self, predicate):
+        """删除 predicate(key, value) 为真的条目"""
+        with self.lock:
+            self.generation += 1
+            for key in [k for k, (v, _) in self.data.items() if predicate(k, v)]:
+                del self.data[key]
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.data.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "avg_hit_ms": self.hit_time / self.hits * 1000 if self.hits else 0.0,
+            "avg_miss_ms": self.miss_time / self.misses * 1000 if self.misses else 0.0,
+        }
+
+
+# ISBN -> (id, title)，只缓存不随借还变化的字段
+book_cache = LRUCache(maxsize=4096, ttl=300.0)
+# (关键词, after_id, limit) -> (结果行, 结果中的图书 id 集合)，结果行中的库存列在读取时替换为当前值
+search_cache = LRUCache(maxsize=512, ttl=30.0)
+
+_lock = threading.Lock()
+_version = None         # 当前缓存内容对应的版本号
+_checked_at = 0.0
+_seen = None            # 上次读取到的数据库版本号
+_resets = 0             # 因其他进程写入而清空缓存的次数
+
+
+def _clear_all():
+    book_cache.clear()
+    search_cache.clear()
+
+
+def read_version(db):
+    return db.query(CatalogVersion.version).filter(CatalogVersion.name == CATALOG).scalar()
+
+
+def check_version(db):
+    """
+    距上次检查超过 VERSION_CHECK_INTERVAL 时读取版本号，被其他进程修改过则清空缓存。
+    返回 (上次读取到的版本号, 读取时间)，catalog 快照用同一次读取判断是否过期。
+    """
+    global _version, _checked_at, _seen, _resets
+    now = time.monotonic()
+    if now - _checked_at < VERSION_CHECK_INTERVAL:
+        return _seen, _checked_at
+    current = read_version(db)
+    with _lock:
+        _checked_at = now
+        _seen = current
+        if current != _version:
+            if _version is not None:
+                _resets += 1
+                logger.info(f"Catalog version changed ({_version} -> {current}), cache cleared")
+            _clear_all()
+            _version = current
+        return _seen, _checked_at
+
+
+def bump_version(db):
+    """
+    在调用方的事务中把版本号加一，返回新版本号；旧数据库没有版本号记录时返回 None。
+    只在图书目录变化(增删改图书、导入)时调用，借还不调用。
+    """
+    updated = db.query(CatalogVersion).filter(CatalogVersion.name == CATALOG).update(
+        {CatalogVersion.version: CatalogVersion.version + 1}, synchronize_session=False
+    )
+    if not updated:
+        return None
+    return read_version(db)
+
+
+def after_commit(version, isbns=(), catalog_changed=False):
+    """
+    图书目录的变更提交后调用，失效受影响的缓存。
+    catalog_changed 表示增删了图书(任何关键词的查询结果都可能变化)；只改变库存时查询结果不需要失效。
+    """
+    global _version
+    with _lock:
+        if version is None or _version is None or version != _version + 1:
+            # 与上次已知版本之间还有其他进程的写入，无法判断哪些条目仍然有效
+            _clear_all()
+        else:
+            for isbn in isbns:
+                book_cache.pop(isbn)
+            if catalog_changed:
+                search_cache.clear()
+        # 本进程多个线程的提交顺序可能与回调顺序不同，版本号只前进
+        if version is not None and (_version is None or version > _version):
+            _version = version
+
+
+def lookup_book(db, isbn):
+    """按 ISBN 返回 (id, title)，不存在时返回 None(不存在的结果不缓存)"""
+    def load():
+        row = db.query(Book.id, Book.title).filter(Book.isbn == isbn).first()
+        return tuple(row) if row else None
+
+    if not enabled:
+        return load()
+    check_version(db)
+    return book_cache.get_or_load(isbn, load, cache_none=False)
+
+
+def with_stock(db, rows):
+    """
+    把结果行的前 5 列 (id, isbn, title, author, category) 与数据库中当前的 (可借数, 总数) 拼接，
+    一次按主键查询；期间已被删除的图书不返回
+    """
+    if not rows:
+        return []
+    stock = {
+        book_id: (available, total) for book_id, available, total in
+        db.query(Book.id, Book.available_copies, Book.total_copies).filter(Book.id.in_([row[0] for row in rows]))
+    }
+    return [tuple(row[:5]) + stock[row[0]] for row in rows if row[0] in stock]
+
+
+def search_page(db, key, loader):
+    """缓存图书列表分页查询，loader() 返回元组列表 (id, isbn, title, author, category, 可借数, 总数)"""
+    if not enabled:
+        return loader()
+    check_version(db)
+    loaded = False
+
+    def load():
+        nonlocal loaded
+        loaded = True
+        rows = loader()
+        return rows, frozenset(row[0] for row in rows)
+
+    rows = search_cache.get_or_load(key, load)[0]
+    # 刚查询的结果库存是最新的；缓存命中时库存可能已被借还改变
+    if loaded:
+        return list(rows)
+    current = with_stock(db, rows)
+    if len(current) < len(rows):
+        # 缓存的结果中有图书已被删除(其他进程的删除还没发现)，这一页会变短而被调用方当作最后一页；
+        # 丢弃这一条目重新查询，由其后的图书补足
+        search_cache.pop(key)
+        return list(search_cache.get_or_load(key, load)[0])
+    return current
+
+
+def stats():
+    return {
+        "books": book_cache.stats(),
+        "search": search_cache.stats(),
+        "version": _version,
+        "version_resets": _resets,
+    }
@@ -0,0 +1,365 @@
+# 内存图书目录(只读快照)
+# 图书查询远多于写入，每次分页查询都要访问数据库。启用后把全部图书的 id、ISBN、书名、作者和分类
+# 一次性批量读入紧凑的列式结构(id 列用 array，字符串列用 list，重复的作者/分类只保存一份)，
+# list_books_page 直接在内存中匹配关键词，不构造 ORM 对象。
+# 库存随借还频繁变化且借还不更新版本号，不放在快照中：每页结果按主键从数据库读取当前库存(cache.with_stock)。
+#
+# 关键词匹配与全文索引相同：规范化后的关键词是书名、作者或分类的子串，结果按 id 升序。
+# 为此把每本书规范化后的书名/作者/分类用换行符拼接成检索文本，用 str.find 查找，
+# 再按每本书的起始位置二分得到命中的图书。检索文本分块存放(加载时每批一块)，新增图书只追加到
+# 较小的末尾块中，不复制整个检索文本。
+# 查询时在锁内只取得快照当前状态的不可变引用(view)，匹配在锁外进行，不阻塞其他查询和写操作的回调。
+#
+# 本进程增删改图书提交后，按 LibraryManager 发布的事件和 catalog_version 版本号增量修改快照；
+# 发现版本号被其他进程修改过(最多约 2 * VERSION_CHECK_INTERVAL 秒后发现)或批量导入时，
+# 丢弃快照并在后台重新加载，加载完成前查询照常走数据库。
+# 因此适合单进程、图书目录很少变化的场景；多个进程频繁增删图书时快照会经常重新加载。
+#
+# 设置 LIBRARY_CATALOG_SNAPSHOT=1 启用。
+
+import os
+import re
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_right
+
+from sqlalchemy import select
+from models import Book
+from logger_config import logger
+import cache
+import events
+import search_index
+
+enabled = os.environ.get("LIBRARY_CATALOG_SNAPSHOT", "0") == "1"
+
+LOAD_CHUNK_SIZE = 50000
+# 末尾检索文本块小于这个长度(字符)时，新增图书合并进去，否则另起一块
+TAIL_CHUNK_CHARS = 1 << 16
+
+_COLUMNS = ("id", "isbn", "title", "author", "category")
+
+
+# 与 search_index.normalize 相同，但保留换行符(字段分隔符)
+_NON_WORD = re.compile(r"(?:[^\w\n]|_)+")
+
+
+def _search_text(titles, authors, categories):
+    """把一批图书的书名/作者/分类规范化后用换行符拼接，返回 (检索文本, 每本书的文本长度)"""
+    fields = [value or "" for book in zip(titles, authors, categories) for value in book]
+    # 整批只做一次 lower 和正则替换；字段本身含换行符时退回逐个规范化
+    normalized = _NON_WORD.sub("", "\n".join(fields).lower()).split("\n")
+    if len(normalized) != len(fields):
+        normalized = [search_index.normalize(value) for value in fields]
+    # 换行符不会出现在规范化后的关键词中，匹配不会跨越字段或图书
+    lengths = list(map(len, normalized))
+    sizes = [a + b + c + 3 for a, b, c in zip(lengths[0::3], lengths[1::3], lengths[2::3])]
+    return "\n".join(normalized) + "\n", sizes
+
+
+class CatalogSnapshot:
+    """
+    全部图书的列式快照，各列按 id 升序排列，第 i 本书的各字段位于各列的第 i 个位置。
+    各列只在末尾追加；chunks、starts、removed 修改时整体替换，旧的引用保持不变，可在锁外读取。
+    """
+
+    __slots__ = ("ids", "isbns", "titles", "authors", "categories",
+                 "removed", "chunks", "starts", "offsets", "version", "memory_bytes", "_strings")
+
+    def __init__(self, version):
+        self.ids = array("q")
+        self.isbns = []
+        self.titles = []
+        self.authors = []
+        self.categories = []
+        self.removed = frozenset()  # 已删除图书的下标
+        self.chunks = ()            # 规范化后的检索文本块
+        self.starts = ()            # 每块第一本书的下标
+        self.offsets = array("q")   # 每本书的检索文本在所在块中的起始位置
+        self.version = version      # 快照对应的 catalog_version
+        self.memory_bytes = 0
+        self._strings = {}          # 作者、分类去重
+
+    def __len__(self):
+        return len(self.ids) - len(self.removed)
+
+    def load(self, rows):
+        """批量追加按 id 升序排列的行 (id, isbn, title, author, category)"""
+        if not rows:
+            return
+        ids, isbns, titles, authors, categories = zip(*rows)
+        text, sizes = _search_text(titles, authors, categories)
+        first = len(self.ids)
+        if self.chunks and len(self.chunks[-1]) + len(text) <= TAIL_CHUNK_CHARS:
+            # 合并到较小的末尾块，只复制末尾块
+            position = len(self.chunks[-1])
+            chunks = self.chunks[:-1] + (self.chunks[-1] + text,)
+            starts = self.starts
+        else:
+            position = 0
+            chunks = self.chunks + (text,)
+            starts = self.starts + (first,)
+        for size in sizes:
+            self.offsets.append(position)
+            position += size
+
+        self.ids.extend(ids)
+        self.isbns.extend(isbns)
+        self.titles.extend(titles)
+        shared = self._strings.setdefault
+        self.authors.extend(map(shared, authors, authors))
+        self.categories.extend(map(shared, categories, categories))
+        # 各列追加完成后再替换检索文本，view 取得的块总是与图书数量一致
+        self.chunks, self.starts = chunks, starts
+
+    def measure(self):
+        """估算快照占用的内存(字节)，共享的字符串只计一次"""
+        columns = (self.ids, self.isbns, self.titles, self.authors, self.categories,
+                   self.offsets, self.removed, self._strings)
+        size = sum(sys.getsizeof(column) for column in columns)
+        size += sum(sys.getsizeof(chunk) for chunk in self.chunks)
+        size += sum(sys.getsizeof(value) for value in self.isbns)
+        size += sum(sys.getsizeof(value) for value in self.titles)
+        size += sum(sys.getsizeof(value) for value in self._strings)
+        self.memory_bytes = size
+        return size
+
+    def _index(self, book_id):
+        i = bisect_right(self.ids, book_id) - 1
+        if i >= 0 and self.ids[i] == book_id and i not in self.removed:
+            return i
+        return None
+
+    def row(self, i):
+        return (self.ids[i], self.isbns[i], self.titles[i], self.authors[i], self.categories[i])
+
+    def view(self):
+        """当前状态的不可变引用 (图书数, 检索文本块, 块起始下标, 已删除下标)，在持有锁时调用"""
+        return len(self.ids), self.chunks, self.starts, self.removed
+
+    def page(self, view, keyword, after_id, limit):
+        """在 view 上查询，与 LibraryManager.list_books_page 相同的结果(不含库存列)；关键词无法检索时返回 None"""
+        count, chunks, starts, removed = view
+        ids, offsets = self.ids, self.offsets
+        start = bisect_right(ids, after_id, 0, count)
+        rows = []
+        if not keyword:
+            for i in range(start, count):
+                if i not in removed:
+                    rows.append(self.row(i))
+                    if len(rows) == limit:
+                        break
+            return rows
+
+        needle = search_index.normalize(keyword)
+        if not needle:
+            return None
+        if start >= count:
+            return rows
+        for c in range(bisect_right(starts, start) - 1, len(chunks)):
+            text = chunks[c]
+            first = starts[c]
+            end = starts[c + 1] if c + 1 < len(starts) else count
+            position = offsets[max(start, first)]
+            while len(rows) < limit:
+                position = text.find(needle, position)
+                if position < 0:
+                    break
+                i = bisect_right(offsets, position, first, end) - 1
+                if i not in removed:
+                    rows.append(self.row(i))
+                # 同一本书只返回一次，从下一本书继续查找
+                position = offsets[i + 1] if i + 1 < end else len(text)
+            if len(rows) == limit:
+                break
+        return rows
+
+    def apply(self, event):
+        """应用一个变更事件，无法增量处理时返回 False"""
+        if isinstance(event, (events.BookChanged, events.BookAdded)):
+            i = self._index(event.book_id)
+            if i is None:
+                # 新书的 id 总是最大的，追加到末尾即可保持有序
+                if self.ids and event.book_id <= self.ids[-1]:
+                    return False
+                self.load([event[:len(_COLUMNS)]])
+                return True
+            # 库存不在快照中；检索文本变化需要重建检索文本，交给重新加载
+            return (self.titles[i], self.authors[i], self.categories[i]) == (event.title, event.author, event.category)
+        if isinstance(event, events.BookRemoved):
+            i = self._index(event.book_id)
+            if i is not None:
+                self.removed = self.removed | {i}
+            return True
+        if isinstance(event, events.CatalogChanged):
+            return False
+        # 借出/归还记录本身不影响目录
+        return True
+
+
+# ==========================================
+# 进程内共享的快照
+# ==========================================
+_snapshot = None
+_lock = threading.Lock()
+_loading = False
+_pending = {}           # 加载期间提交的变更: 版本号 -> 事件列表
+_checked_at = 0.0       # 已处理过的 cache.check_version 读取时间
+_suspect = None         # 上次检查时与数据库版本号不一致的快照版本
+_reloads = 0
+
+
+def load(db):
+    """从数据库读取全部图书生成快照并替换当前快照，返回新快照"""
+    global _snapshot
+    start = time.perf_counter()
+    # 先读版本号再读数据：期间其他事务的提交只会让数据比版本号新，之后按版本号重放这些变更是幂等的
+    snapshot = CatalogSnapshot(cache.read_version(db))
+    books = Book.__table__
+    stmt = select(*[books.c[name] for name in _COLUMNS]).order_by(books.c.id)
+    result = db.connection().execute(stmt.execution_options(stream_results=True))
+    for rows in result.partitions(LOAD_CHUNK_SIZE):
+        snapshot.load(rows)
+    loaded = time.perf_counter()
+    snapshot.measure()
+
+    with _lock:
+        _snapshot = snapshot
+        _apply_pending()
+    logger.info(f"Catalog snapshot loaded: {len(snapshot)} books, {snapshot.memory_bytes / 2 ** 20:.1f} MB "
+                f"in {loaded - start:.1f}s (version {snapshot.version})")
+    return snapshot
+
+
+def _load_in_background():
+    global _loading
+    import db as database
+    session = database.SessionLocal()
+    try:
+        load(session)
+    except Exception as e:
+        logger.error(f"Catalog snapshot load failed: {e}")
+    finally:
+        session.close()
+        with _lock:
+            _loading = False
+            if _snapshot is None:
+                _pending.clear()
+
+
+def _start_loading():
+    # 调用方持有 _lock
+    global _loading
+    if _loading:
+        return
+    _loading = True
+    threading.Thread(target=_load_in_background, name="catalog-load", daemon=True).start()
+
+
+def _discard(reason):
+    # 调用方持有 _lock
+    global _snapshot, _reloads, _suspect
+    _suspect = None
+    if _snapshot is not None:
+        logger.info(f"Catalog snapshot discarded ({reason}), reloading")
+        _snapshot = None
+        _reloads += 1
+    if not _loading:
+        _pending.clear()
+
+
+def _apply_pending():
+    # 调用方持有 _lock。按版本号顺序应用，缺少中间版本时等待(多个线程的回调顺序可能与提交顺序不同)
+    for version in [v for v in _pending if v <= _snapshot.version]:
+        del _pending[version]
+    while _snapshot.version + 1 in _pending:
+        version = _snapshot.version + 1
+        for event in _pending.pop(version):
+            if not _snapshot.apply(event):
+                _discard(type(event).__name__)
+                return
+        _snapshot.version = version
+
+
+def after_commit(version, published):
+    """LibraryManager 提交图书目录的变更后调用，version 为本次提交写入的版本号"""
+    if not enabled:
+        return
+    published = [event for event in published if event is not None]
+    with _lock:
+        if _snapshot is None:
+            # 加载中的提交留到加载完成后重放
+            if _loading and version is not None:
+                _pending[version] = published
+            return
+        if version is None:
+            # 旧数据库没有版本号，只能按回调顺序应用
+            for event in published:
+                if not _snapshot.apply(event):
+                    _discard(type(event).__name__)
+                    return
+            return
+        _pending[version] = published
+        _apply_pending()
+
+
+def _check_version(db):
+    # 版本号由 cache.check_version 读取(最多每隔 VERSION_CHECK_INTERVAL 秒一次)，每次读取的结果只处理一次。
+    # 本进程其他线程刚提交的变更可能还没有应用到快照，连续两次读取都停在同一版本时才视为其他进程的写入
+    global _checked_at, _suspect
+    current, checked_at = cache.check_version(db)
+    with _lock:
+        if checked_at == _checked_at:
+            return
+        _checked_at = checked_at
+        if _snapshot is None or current == _snapshot.version:
+            _suspect = None
+        elif _suspect == _snapshot.version:
+            _discard(f"version {_snapshot.version} -> {current}")
+        else:
+            _suspect = _snapshot.version
+
+
+def page(db, keyword, after_id, limit):
+    """在快照中分页查询；未启用、快照尚未加载或关键词无法检索时返回 None，由调用方查询数据库"""
+    if not enabled:
+        return None
+    _check_version(db)
+    with _lock:
+        if _snapshot is None:
+            _start_loading()
+            return None
+        snapshot, view = _snapshot, _snapshot.view()
+    # with_stock 去掉数据库中已删除(快照尚未同步)的图书，页面变短时从其后的图书补足：
+    # 调用方(iter_books、图书列表)把不足 limit 行的一页视为最后一页
+    rows = []
+    while len(rows) < limit:
+        need = limit - len(rows)
+        found = snapshot.page(view, keyword, after_id, need)
+        if found is None:
+            return None
+        rows += cache.with_stock(db, found)
+        if len(found) < need:
+            break
+        after_id = found[-1][0]
+    return rows
+
+
+def reset():
+    global _snapshot
+    with _lock:
+        _snapshot = None
+        _pending.clear()
+
+
+def stats():
+    snapshot = _snapshot
+    return {
+        "enabled": enabled,
+        "loaded": snapshot is not None,
+        "books": len(snapshot) if snapshot is not None else 0,
+        "memory_mb": round(snapshot.memory_bytes / 2 ** 20, 1) if snapshot is not None else 0.0,
+        "version": snapshot.version if snapshot is not None else None,
+        "reloads": _reloads,
+    }
@@ -0,0 +1,242 @@
+# 大规模测试数据生成器
+# 向数据库批量写入模拟的图书馆数据，用于性能测试:
+#   - 图书: 书名/作者/分类由词库随机组合，册数 1~10
+#   - 用户: 全部使用同一个密码(DATAGEN_PASSWORD)，另有一个管理员账号 bench_admin
+#   - 借阅记录: 借阅热度服从 Zipf 分布(少数热门书占大部分借阅)，少量记录未归还，其中一部分已逾期
+# 生成后重建全文索引和统计计数，并按未归还数量修正库存。
+#
+# 用法:
+#   python datagen.py --books 1000000 --users 100000 --loans 10000000
+#   python datagen.py --db bench.db --books 10000 --users 1000 --loans 100000
+
+import argparse
+import bisect
+import datetime
+import itertools
+import random
+import sys
+import time
+from array import array
+
+from sqlalchemy import insert, update, bindparam, func
+
+DATAGEN_PASSWORD = "password"
+ADMIN_USERNAME = "bench_admin"
+LOAN_DAYS = 3   # 与 LibraryManager 借阅期限一致
+
+TITLE_WORDS = [
+    "数据", "结构", "算法", "历史", "中国", "世界", "物理", "化学", "经济", "管理", "心理", "哲学",
+    "艺术", "设计", "网络", "系统", "原理", "导论", "实践", "分析", "方法", "文学", "城市", "科学",
+    "Python", "Java", "Linux", "Web", "Deep", "Learning", "Modern", "Introduction", "Data", "Design",
+]
+TITLE_SUFFIXES = ["", "", "", "教程", "基础", "入门", "精要", "（第2版）", "（第3版）", "手册", "研究"]
+SURNAMES = ["王", "李", "张", "刘", "陈", "杨", "赵", "黄", "周", "吴", "Smith", "Brown", "Lee", "Garcia"]
+GIVEN_NAMES = ["伟", "芳", "娜", "敏", "静", "磊", "洋", "勇", "艳", "杰", "John", "Anna", "Mark", "Wei"]
+CATEGORIES = ["CS", "Math", "History", "Literature", "Economics", "Physics", "Art", "Philosophy", "Biology"]
+
+
+def _progress(name, done, total, start):
+    elapsed = time.perf_counter() - start
+    rate = done / elapsed if elapsed > 0 else 0.0
+    print(f"\r{name}: {done}/{total} ({rate:,.0f} rows/s)", end="", file=sys.stderr, flush=True)
+    if done >= total:
+        print(file=sys.stderr)
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def generate_books(db, count, rng, chunk_size, first_id):
+    import search_index
+    from models import Book
+
+    books = Book.__table__
+
+    def rows():
+        for book_id in range(first_id, first_id + count):
+            words = rng.sample(TITLE_WORDS, rng.randint(2, 4))
+            copies = rng.randint(1, 10)
+            yield {
+                "id": book_id,
+                "isbn": f"979{book_id:010d}",
+                "title": "".join(words) + rng.choice(TITLE_SUFFIXES),
+                "author": rng.choice(SURNAMES) + rng.choice(GIVEN_NAMES),
+                "category": rng.choice(CATEGORIES),
+                "total_copies": copies,
+                "available_copies": copies,
+            }
+
+    start = time.perf_counter()
+    done = 0
+    for chunk in _chunks(rows(), chunk_size):
+        db.execute(insert(books), chunk)
+        search_index.index_rows(db, [(r["id"], r["title"], r["author"], r["category"]) for r in chunk])
+        db.commit()
+        done += len(chunk)
+        _progress("books", done, count, start)
+
+
+def generate_users(db, count, chunk_size, first_id):
+    from auth import AuthManager
+    from models import User
+
+    users = User.__table__
+    password_hash = AuthManager(db).hash_password(DATAGEN_PASSWORD)
+    if not db.query(User.id).filter(User.username == ADMIN_USERNAME).first():
+        db.execute(insert(users), [{"username": ADMIN_USERNAME, "password_hash": password_hash, "role": "admin"}])
+
+    def rows():
+        for user_id in range(first_id, first_id + count):
+            yield {"username": f"reader{user_id:07d}", "password_hash": password_hash, "role": "user"}
+
+    start = time.perf_counter()
+    done = 0
+    for chunk in _chunks(rows(), chunk_size):
+        db.execute(insert(users), chunk)
+        db.commit()
+        done += len(chunk)
+        _progress("users", done, count, start)
+
+
+def zipf_cum_weights(count, skew):
+    # 第 k 热门的图书借阅概率正比于 1 / k^skew
+    total = 0.0
+    cum = array("d")
+    for rank in range(1, count + 1):
+        total += 1.0 / rank ** skew
+        cum.append(total)
+    return cum
+
+
+def generate_loans(db, count, book_ids, user_ids, rng, chunk_size,
+                   skew=1.1, open_ratio=0.01, overdue_ratio=0.3, days=730):
+    from models import BorrowRecord
+
+    records = BorrowRecord.__table__
+    # 热度排名与 id 无关：打乱后按排名分配权重
+    ranked = list(book_ids)
+    rng.shuffle(ranked)
+    cum = zipf_cum_weights(len(ranked), skew)
+    total_weight = cum[-1]
+    now = datetime.datetime.now()
+    open_loans = {}
+
+    def rows():
+        for _ in range(count):
+            book_id = ranked[bisect.bisect_left(cum, rng.random() * total_weight)]
+            user_id = user_ids[rng.randrange(len(user_ids))]
+            if rng.random() < open_ratio:
+                # 未归还：逾期的借于期限之前，未逾期的借于最近几天
+                if rng.random() < overdue_ratio:
+                    borrow = now - datetime.timedelta(days=rng.uniform(LOAN_DAYS, 60))
+                else:
+                    borrow = now - datetime.timedelta(days=rng.uniform(0, LOAN_DAYS))
+                returned = None
+                open_loans[book_id] = open_loans.get(book_id, 0) + 1
+            else:
+                borrow = now - datetime.timedelta(days=rng.uniform(LOAN_DAYS + 10, days))
+                returned = borrow + datetime.timedelta(days=rng.uniform(0.1, LOAN_DAYS + 4))
+            yield {
+                "user_id": user_id,
+                "book_id": book_id,
+                "borrow_date": borrow,
+                "due_date": borrow + datetime.timedelta(days=LOAN_DAYS),
+                "return_date": returned,
+            }
+
+    start = time.perf_counter()
+    done = 0
+    for chunk in _chunks(rows(), chunk_size):
+        db.execute(insert(records), chunk)
+        db.commit()
+        done += len(chunk)
+        _progress("borrow_records", done, count, start)
+    return open_loans
+
+
+def fix_stock(db, open_loans, chunk_size):
+    # 未归还的册数从可借数量中扣除，热门书的总册数不足时补足
+    from models import Book
+
+    books = Book.__table__
+    stmt = update(books).where(books.c.id == bindparam("b_id")).values(
+        total_copies=func.max(books.c.total_copies, bindparam("n")),
+        available_copies=func.max(books.c.total_copies, bindparam("n")) - bindparam("n"),
+    )
+    for chunk in _chunks(open_loans.items(), chunk_size):
+        db.execute(stmt, [{"b_id": book_id, "n": n} for book_id, n in chunk])
+        db.commit()
+
+
+def generate(books, users, loans, seed=42, chunk_size=20000, skew=1.1,
+             open_ratio=0.01, overdue_ratio=0.3):
+    import db as database
+    import cache
+    import loan_stats
+    import recommend
+    from models import Book, BorrowRecord, User
+
+    rng = random.Random(seed)
+    database.init_db()
+    if database.engine.dialect.name != "sqlite":
+        # fix_stock 使用了 SQLite 的两参数 max()
+        raise SystemExit("datagen 目前只支持 SQLite")
+    db = database.SessionLocal()
+    start = time.perf_counter()
+    try:
+        first_book = (db.query(func.max(Book.id)).scalar() or 0) + 1
+        first_user = (db.query(func.max(User.id)).scalar() or 0) + 1
+        generate_books(db, books, rng, chunk_size, first_book)
+        generate_users(db, users, chunk_size, first_user)
+
+        # 借阅记录分配给全部已有的图书和普通用户
+        book_ids = [book_id for (book_id,) in db.query(Book.id)]
+        user_ids = array("i", (user_id for (user_id,) in db.query(User.id).filter(User.role == "user")))
+        if loans and book_ids and user_ids:
+            open_loans = generate_loans(db, loans, book_ids, user_ids, rng, chunk_size,
+                                        skew, open_ratio, overdue_ratio)
+            fix_stock(db, open_loans, chunk_size)
+        loan_stats.rebuild(db)
+        pairs_start = time.perf_counter()
+        total_loans = db.query(func.count(BorrowRecord.id)).scalar()
+        recommend.rebuild(db, lambda done: _progress("book_pairs", done, total_loans, pairs_start))
+        # 通知其他进程清空缓存
+        cache.bump_version(db)
+        db.commit()
+    finally:
+        db.close()
+    print(f"done in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="生成大规模图书馆测试数据")
+    parser.add_argument("--db", help="SQLite 数据库文件(默认使用 db.DB_URL)")
+    parser.add_argument("--books", type=int, default=1000000)
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--loans", type=int, default=10000000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--chunk-size", type=int, default=20000)
+    parser.add_argument("--skew", type=float, default=1.1, help="借阅热度的 Zipf 指数，越大越集中")
+    parser.add_argument("--open-ratio", type=float, default=0.01, help="未归还记录的比例")
+    parser.add_argument("--overdue-ratio", type=float, default=0.3, help="未归还记录中逾期的比例")
+    args = parser.parse_args(argv)
+
+    import logging
+    import db
+    from logger_config import logger
+
+    logger.setLevel(logging.WARNING)
+    if args.db:
+        db.DB_URL = f"sqlite:///{args.db}"
+    generate(args.books, args.users, args.loans, args.seed, args.chunk_size,
+             args.skew, args.open_ratio, args.overdue_ratio)
+
+
+if __name__ == "__main__":
+    main()
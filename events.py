@@ -0,0 +1,50 @@
+# 变更通知
+# LibraryManager 在写操作提交成功后发布以下事件，界面等订阅者据此只更新受影响的行和计数，
+# 不必重新加载整个图书列表。事件只在本进程内传递，其他终端的修改仍需手动刷新。
+#
+# 订阅者在发布事件的线程(通常是后台工作线程)中被调用，界面订阅者需自行转到主线程处理。
+
+from collections import namedtuple
+
+from logger_config import logger
+
+_BOOK_FIELDS = "book_id isbn title author category available_copies total_copies"
+
+# 图书库存或信息变化(借还、追加册数)
+BookChanged = namedtuple("BookChanged", _BOOK_FIELDS)
+# 新增图书
+BookAdded = namedtuple("BookAdded", _BOOK_FIELDS)
+# 删除图书
+BookRemoved = namedtuple("BookRemoved", "book_id isbn")
+# 借出 / 归还
+LoanOpened = namedtuple("LoanOpened", "user_id book_id isbn due_date")
+LoanClosed = namedtuple("LoanClosed", "user_id book_id isbn due_date")
+# 批量导入等大范围变化，订阅者应整体刷新
+CatalogChanged = namedtuple("CatalogChanged", "reason count")
+
+_subscribers = []   # (回调, 关注的事件类型元组，空表示全部)
+
+
+def subscribe(callback, *event_types):
+    """订阅事件，不指定事件类型时接收全部事件"""
+    _subscribers.append((callback, event_types))
+
+
+def unsubscribe(callback):
+    _subscribers[:] = [(cb, types) for cb, types in _subscribers if cb != callback]
+
+
+def has_subscribers(event_type):
+    # 没有订阅者时发布方可以跳过构造事件所需的额外查询
+    return any(not types or event_type in types for _, types in _subscribers)
+
+
+def publish(event):
+    for callback, types in list(_subscribers):
+        if types and type(event) not in types:
+            continue
+        try:
+            callback(event)
+        except Exception as e:
+            # 订阅者出错不影响已经提交的业务操作
+            logger.error(f"Event subscriber failed on {type(event).__name__}: {e}")
@@ -0,0 +1,235 @@
+# 数据导出工具
+# 把图书、用户(不含密码哈希)和借阅记录流式导出为 CSV / JSONL / Parquet，供审计和离线分析。
+# 查询结果按 chunk_size 分批读取(PostgreSQL 使用服务器端游标)，逐批写出，内存占用与数据量无关。
+# 借阅记录默认包含已归档的记录(archived 列为 true)，可按借出日期过滤。
+# Parquet 需要安装 pyarrow，每批写为一个 row group。
+#
+# 用法:
+#   python exporter.py books -o books.csv --user admin
+#   python exporter.py loans -o loans.parquet --since 2024-01-01 --until 2025-01-01 --user admin
+#   python exporter.py users --format jsonl --user admin > users.jsonl
+
+import argparse
+import csv
+import datetime
+import getpass
+import json
+import os
+import sys
+import time
+
+from sqlalchemy import select, literal, Boolean
+from models import Book, BorrowRecord, BorrowRecordArchive, User
+
+CHUNK_SIZE = 10000
+FORMATS = ("csv", "jsonl", "parquet")
+
+# 每种导出的列及其 Parquet 类型
+COLUMNS = {
+    "books": [
+        ("id", "int64"), ("isbn", "string"), ("title", "string"), ("author", "string"),
+        ("category", "string"), ("total_copies", "int64"), ("available_copies", "int64"),
+    ],
+    "users": [
+        ("id", "int64"), ("username", "string"), ("role", "string"),
+    ],
+    "loans": [
+        ("id", "int64"), ("user_id", "int64"), ("username", "string"), ("book_id", "int64"),
+        ("isbn", "string"), ("borrow_date", "timestamp"), ("due_date", "timestamp"),
+        ("return_date", "timestamp"), ("archived", "bool"),
+    ],
+}
+
+
+def books_queries(**filters):
+    books = Book.__table__
+    return [select(*[books.c[name] for name, _ in COLUMNS["books"]]).order_by(books.c.id)]
+
+
+def users_queries(**filters):
+    users = User.__table__
+    # 不导出 password_hash
+    return [select(users.c.id, users.c.username, users.c.role).order_by(users.c.id)]
+
+
+def loans_queries(since=None, until=None, include_archive=True):
+    # 冷热两张表分别查询、依次导出，各自使用自己的索引；图书或用户已删除时对应列为空
+    users = User.__table__
+    books = Book.__table__
+    tables = [(BorrowRecord.__table__, False)]
+    if include_archive:
+        tables.append((BorrowRecordArchive.__table__, True))
+
+    queries = []
+    for table, archived in tables:
+        stmt = select(
+            table.c.id, table.c.user_id, users.c.username, table.c.book_id, books.c.isbn,
+            table.c.borrow_date, table.c.due_date, table.c.return_date, literal(archived, Boolean).label("archived"),
+        ).select_from(
+            table.outerjoin(users, users.c.id == table.c.user_id).outerjoin(books, books.c.id == table.c.book_id)
+        )
+        if since:
+            stmt = stmt.where(table.c.borrow_date >= since)
+        if until:
+            stmt = stmt.where(table.c.borrow_date < until)
+        queries.append(stmt.order_by(table.c.id))
+    return queries
+
+
+QUERIES = {"books": books_queries, "users": users_queries, "loans": loans_queries}
+
+
+def iter_chunks(conn, queries, chunk_size=CHUNK_SIZE):
+    """逐批产出查询结果 [(值, ...), ...]，每次只在内存中保留一批"""
+    # stream_results: PostgreSQL 等使用服务器端游标；SQLite 本身就是逐行读取
+    conn = conn.execution_options(stream_results=True)
+    for stmt in queries:
+        result = conn.execute(stmt)
+        for partition in result.partitions(chunk_size):
+            yield [tuple(row) for row in partition]
+
+
+def _text(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(sep=" ")
+    return value
+
+
+class CsvWriter:
+    def __init__(self, out, columns):
+        self.writer = csv.writer(out)
+        self.writer.writerow([name for name, _ in columns])
+
+    def write(self, rows):
+        self.writer.writerows([[_text(value) for value in row] for row in rows])
+
+    def close(self):
+        pass
+
+
+class JsonlWriter:
+    def __init__(self, out, columns):
+        self.out = out
+        self.names = [name for name, _ in columns]
+
+    def write(self, rows):
+        self.out.writelines(
+            json.dumps(dict(zip(self.names, [_text(value) for value in row])), ensure_ascii=False) + "\n"
+            for row in rows
+        )
+
+    def close(self):
+        pass
+
+
+class ParquetWriter:
+    def __init__(self, path, columns):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("导出 Parquet 需要安装 pyarrow: pip install pyarrow")
+        types = {"int64": pa.int64(), "string": pa.string(), "timestamp": pa.timestamp("us"), "bool": pa.bool_()}
+        self.pa = pa
+        self.schema = pa.schema([(name, types[kind]) for name, kind in columns])
+        self.writer = pq.ParquetWriter(path, self.schema)
+
+    def write(self, rows):
+        # 按列组织本批数据，写为一个 row group
+        arrays = [self.pa.array(list(values), type=field.type) for values, field in zip(zip(*rows), self.schema)]
+        self.writer.write_table(self.pa.Table.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+def export(conn, kind, fmt, out=None, path=None, chunk_size=CHUNK_SIZE, progress=None, **filters):
+    """
+    导出一种数据，返回行数。
+    csv / jsonl 写入文本流 out；parquet 写入文件 path。progress(已导出行数) 每批调用一次。
+    """
+    columns = COLUMNS[kind]
+    if fmt == "parquet":
+        writer = ParquetWriter(path, columns)
+    elif fmt == "jsonl":
+        writer = JsonlWriter(out, columns)
+    else:
+        writer = CsvWriter(out, columns)
+
+    count = 0
+    try:
+        for rows in iter_chunks(conn, QUERIES[kind](**filters), chunk_size):
+            writer.write(rows)
+            count += len(rows)
+            if progress:
+                progress(count)
+    finally:
+        writer.close()
+    return count
+
+
+def _date(text):
+    return datetime.datetime.combine(datetime.date.fromisoformat(text), datetime.time())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="导出图书、用户和借阅记录 (CSV/JSONL/Parquet)")
+    parser.add_argument("kind", choices=sorted(QUERIES))
+    parser.add_argument("-o", "--output", help="输出文件，csv/jsonl 默认输出到标准输出")
+    parser.add_argument("--format", choices=FORMATS, help="文件格式，默认根据扩展名判断")
+    parser.add_argument("--user", required=True, help="管理员账号")
+    parser.add_argument("--since", type=_date, help="借阅记录: 借出日期不早于 (YYYY-MM-DD)")
+    parser.add_argument("--until", type=_date, help="借阅记录: 借出日期早于 (YYYY-MM-DD)")
+    parser.add_argument("--no-archive", action="store_true", help="借阅记录: 不包含已归档的记录")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="每批读取的行数")
+    args = parser.parse_args(argv)
+
+    fmt = args.format
+    if fmt is None:
+        ext = os.path.splitext(args.output or "")[1].lower()
+        fmt = {".jsonl": "jsonl", ".ndjson": "jsonl", ".parquet": "parquet"}.get(ext, "csv")
+    if fmt == "parquet" and not args.output:
+        parser.error("parquet 格式需要用 -o 指定输出文件")
+    filters = {}
+    if args.kind == "loans":
+        filters = {"since": args.since, "until": args.until, "include_archive": not args.no_archive}
+    elif args.since or args.until or args.no_archive:
+        parser.error("--since/--until/--no-archive 只适用于 loans")
+
+    import db
+    from auth import AuthManager
+
+    session = next(db.get_db())
+    auth = AuthManager(session)
+    success, msg = auth.login(args.user, getpass.getpass("密码: "))
+    session.close()
+    if not success:
+        print(msg)
+        return 1
+    if auth.current_user.role != 'admin':
+        print("权限不足: 需要管理员账号")
+        return 1
+
+    start = time.perf_counter()
+
+    def report(count):
+        elapsed = time.perf_counter() - start
+        rate = count / elapsed if elapsed > 0 else 0.0
+        print(f"\r{args.kind}: {count} rows ({rate:,.0f} rows/s)", end="", file=sys.stderr, flush=True)
+
+    out = None
+    if fmt != "parquet":
+        out = open(args.output, "w", newline="", encoding="utf-8") if args.output else sys.stdout
+    try:
+        with db.engine.connect() as conn:
+            count = export(conn, args.kind, fmt, out, args.output, args.chunk_size, report, **filters)
+    finally:
+        if out is not None and out is not sys.stdout:
+            out.close()
+    print(file=sys.stderr)
+    print(f"导出完成: {count} 行, 用时 {time.perf_counter() - start:.2f}s", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,81 @@
+# 图书批量导入工具
+# 从 CSV / JSONL 文件流式读取图书数据，分批写入数据库。
+# 用法: python importer.py books.csv --user admin [--chunk-size 5000]
+# 文件字段: isbn, title, author, category, copies
+
+import argparse
+import csv
+import getpass
+import json
+import os
+import sys
+
+from db import get_db
+from auth import AuthManager
+from manager import LibraryManager
+
+
+def read_csv(path):
+    # utf-8-sig 兼容 Excel 导出的带 BOM 文件
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for row in csv.DictReader(f):
+            yield row
+
+
+def read_jsonl(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # 保留位置，交给 bulk_add_books 记录为该行的格式错误
+                yield None
+
+
+def read_rows(path, fmt=None):
+    if fmt is None:
+        ext = os.path.splitext(path)[1].lower()
+        fmt = "jsonl" if ext in (".jsonl", ".ndjson") else "csv"
+    return read_jsonl(path) if fmt == "jsonl" else read_csv(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="批量导入图书 (CSV/JSONL)")
+    parser.add_argument("file", help="导入文件路径")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="文件格式，默认根据扩展名判断")
+    parser.add_argument("--user", required=True, help="管理员账号")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="每个事务处理的行数")
+    args = parser.parse_args(argv)
+
+    db = next(get_db())
+    auth = AuthManager(db)
+    success, msg = auth.login(args.user, getpass.getpass("密码: "))
+    if not success:
+        print(msg)
+        return 1
+
+    manager = LibraryManager(db, auth.current_user)
+
+    def report(result):
+        print(f"已处理 {result['rows']} 行 (新增 {result['inserted']}, 增加库存 {result['updated']}, "
+              f"错误 {len(result['errors'])})", file=sys.stderr)
+
+    success, result = manager.bulk_add_books(
+        read_rows(args.file, args.format), chunk_size=args.chunk_size, progress=report
+    )
+    if not success:
+        print(result)
+        return 1
+
+    for index, error in result["errors"]:
+        print(f"第 {index} 条: {error}")
+    print(f"导入完成: {result['rows']} 行, 用时 {result['elapsed']:.2f}s, "
+          f"{result['rows_per_sec']:.0f} 行/秒")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
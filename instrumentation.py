@@ -0,0 +1,412 @@
+# 性能监控
+# 统计每条 SQL(按语句指纹归类)的执行次数和耗时，以及 LibraryManager / AuthManager 每个操作的
+# 调用次数、耗时、执行的查询数、查询返回/写入的行数和提交耗时。
+#   - 超过 SLOW_QUERY_MS 的 SQL 记录到日志(慢查询日志)
+#   - 指标可导出为 Prometheus 文本格式，写入文件或通过本地 HTTP 端口提供
+#   - 可对指定操作的下一次调用开启 cProfile，结果保存到 profiles/ 目录
+#
+# 环境变量:
+#   LIBRARY_SLOW_QUERY_MS=200          慢查询阈值(毫秒)
+#   LIBRARY_METRICS_FILE=metrics.prom  定期(及退出时)写入指标文件，可配合 node_exporter 的 textfile 收集器
+#   LIBRARY_METRICS_PORT=9108          在 127.0.0.1 上提供 /metrics
+#   LIBRARY_PROFILE=LibraryManager.borrow_book   对该操作的下一次调用做 cProfile
+
+import atexit
+import contextvars
+import cProfile
+import functools
+import inspect
+import io
+import logging
+import os
+import pstats
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from logger_config import logger
+
+enabled = True
+
+SLOW_QUERY_MS = float(os.environ.get("LIBRARY_SLOW_QUERY_MS", "200"))
+METRICS_FILE = os.environ.get("LIBRARY_METRICS_FILE")
+METRICS_PORT = int(os.environ.get("LIBRARY_METRICS_PORT", "0"))
+METRICS_INTERVAL = 30       # 写指标文件的间隔(秒)
+PROFILE_DIR = "profiles"
+# 导出时按总耗时只保留前 N 个语句指纹，避免指标数量无限增长
+EXPORT_TOP_QUERIES = 50
+
+# 操作耗时直方图的分桶上限(秒)
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_lock = threading.Lock()
+# 当前正在执行的操作；使用 contextvars 而不是 threading.local，
+# 使 HTTP 服务在同一线程中交替执行的多个请求(协程/greenlet)各自独立计数
+_current_call = contextvars.ContextVar("library_operation", default=None)
+_operations = {}    # 操作名 -> OperationStats
+_queries = {}       # 语句指纹 -> [次数, 总耗时, 最大耗时]
+_profile_targets = set(filter(None, os.environ.get("LIBRARY_PROFILE", "").split(",")))
+_installed_session_events = False
+
+
+class OperationStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.buckets = [0] * len(BUCKETS)
+        self.queries = 0
+        self.query_time = 0.0
+        self.rows_loaded = 0
+        self.rows_written = 0
+        self.commits = 0
+        self.commit_time = 0.0
+
+
+class _Call:
+    """一次操作调用期间累计的计数，结束时合并到 OperationStats"""
+
+    def __init__(self, name):
+        self.name = name
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.query_time = 0.0
+        self.rows_loaded = 0
+        self.rows_written = 0
+        self.commits = 0
+        self.commit_time = 0.0
+
+
+# ==========================================
+# SQL 语句指纹
+# ==========================================
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE = re.compile(r"\s+")
+
+
+@functools.lru_cache(maxsize=2048)
+def fingerprint(statement):
+    """把 SQL 中的字面量替换为 ?，合并 IN 列表和空白，使同一类查询得到相同的指纹"""
+    s = _STRING.sub("?", statement)
+    s = _NUMBER.sub("?", s)
+    s = _LIST.sub("(...)", s)
+    return _SPACE.sub(" ", s).strip()
+
+
+def _current():
+    return _current_call.get()
+
+
+# ==========================================
+# SQLAlchemy 事件
+# ==========================================
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    key = fingerprint(statement)
+    with _lock:
+        stats = _queries.get(key)
+        if stats is None:
+            stats = _queries[key] = [0, 0.0, 0.0]
+        stats[0] += 1
+        stats[1] += elapsed
+        stats[2] = max(stats[2], elapsed)
+
+    call = _current()
+    if call is not None:
+        call.queries += 1
+        call.query_time += elapsed
+        if context is not None and (context.isinsert or context.isupdate or context.isdelete):
+            call.rows_written += max(cursor.rowcount, 0)
+
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        where = call.name if call is not None else "-"
+        logger.warning(f"Slow query ({elapsed * 1000:.1f} ms) in {where}: {key[:500]}")
+
+
+def _handle_error(exception_context):
+    starts = exception_context.connection.info.get("query_start") if exception_context.connection else None
+    if starts:
+        starts.pop()
+
+
+class OperationLogFilter(logging.Filter):
+    """为操作期间记录的日志补充 operation 和 latency_ms(操作开始至今的耗时)字段"""
+
+    def filter(self, record):
+        call = _current()
+        if call is not None:
+            if getattr(record, "operation", None) is None:
+                record.operation = call.name
+            if getattr(record, "latency_ms", None) is None:
+                record.latency_ms = round((time.perf_counter() - call.start) * 1000, 3)
+        return True
+
+
+logger.addFilter(OperationLogFilter())
+
+
+def _on_orm_execute(orm_execute_state):
+    """
+    统计会话执行的查询返回的行数。load 事件只在加载 ORM 实体时触发，
+    只查询列的操作(图书列表分页、统计、借阅历史)会计为 0，因此在结果层计数：
+    先把结果全部取出(freeze)，计数后返回同样的结果。
+    yield_per / stream_results 的流式查询不计数，以免一次读入全部结果。
+    """
+    call = _current()
+    if call is None:
+        return None
+    options = orm_execute_state.execution_options
+    if options.get("yield_per") or options.get("stream_results"):
+        return None
+    result = orm_execute_state.invoke_statement()
+    # 不返回行的语句(经 session 执行的 UPDATE/DELETE 等)原样返回，保留 rowcount
+    if not getattr(result, "returns_rows", True):
+        return result
+    frozen = result.freeze()
+    call.rows_loaded += len(frozen.data)
+    return frozen()
+
+
+def _before_commit(session):
+    session.info["commit_start"] = time.perf_counter()
+
+
+def _after_commit(session):
+    start = session.info.pop("commit_start", None)
+    call = _current()
+    if start is not None and call is not None:
+        call.commits += 1
+        call.commit_time += time.perf_counter() - start
+
+
+def install(engine):
+    """为引擎注册 SQL 计时事件；会话事件全局只注册一次"""
+    global _installed_session_events
+    if not enabled:
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+    if not _installed_session_events:
+        event.listen(Session, "before_commit", _before_commit)
+        event.listen(Session, "after_commit", _after_commit)
+        event.listen(Session, "do_orm_execute", _on_orm_execute)
+        _installed_session_events = True
+        _start_exporters()
+
+
+# ==========================================
+# 操作计时
+# ==========================================
+def _record(call, elapsed, failed):
+    with _lock:
+        stats = _operations.get(call.name)
+        if stats is None:
+            stats = _operations[call.name] = OperationStats()
+        stats.calls += 1
+        stats.errors += failed
+        stats.total_time += elapsed
+        stats.max_time = max(stats.max_time, elapsed)
+        # 与 Prometheus 直方图一致，每个分桶累计不超过其上限的次数
+        for i, bound in enumerate(BUCKETS):
+            if elapsed <= bound:
+                stats.buckets[i] += 1
+        stats.queries += call.queries
+        stats.query_time += call.query_time
+        stats.rows_loaded += call.rows_loaded
+        stats.rows_written += call.rows_written
+        stats.commits += call.commits
+        stats.commit_time += call.commit_time
+
+
+def timed(name):
+    """
+    操作计时装饰器。返回 (False, msg) 或抛出异常都计为失败。
+    嵌套调用(操作内部调用另一个被计时的操作)只计入最外层。
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not enabled or _current() is not None:
+                return fn(*args, **kwargs)
+
+            call = _Call(name)
+            token = _current_call.set(call)
+            failed = True
+            try:
+                if name in _profile_targets:
+                    result = _profile(name, fn, args, kwargs)
+                else:
+                    result = fn(*args, **kwargs)
+                failed = isinstance(result, tuple) and len(result) == 2 and result[0] is False
+                return result
+            finally:
+                _current_call.reset(token)
+                _record(call, time.perf_counter() - call.start, failed)
+        return wrapper
+    return decorator
+
+
+def instrument(cls):
+    """类装饰器：为所有公开方法加上 timed("类名.方法名")；生成器方法不计时"""
+    for attr, value in list(vars(cls).items()):
+        if attr.startswith("_") or not inspect.isfunction(value) or inspect.isgeneratorfunction(value):
+            continue
+        setattr(cls, attr, timed(f"{cls.__name__}.{attr}")(value))
+    return cls
+
+
+# ==========================================
+# cProfile
+# ==========================================
+def profile_next(name):
+    """对操作 name(例如 "LibraryManager.borrow_book")的下一次调用做 cProfile"""
+    with _lock:
+        _profile_targets.add(name)
+
+
+def _profile(name, fn, args, kwargs):
+    with _lock:
+        _profile_targets.discard(name)
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(fn, *args, **kwargs)
+    finally:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}.prof")
+        profiler.dump_stats(path)
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(15)
+        logger.info(f"Profile of {name} saved to {path}\n{out.getvalue()}")
+
+
+# ==========================================
+# 指标导出
+# ==========================================
+def snapshot():
+    """返回当前指标的副本 {"operations": {...}, "queries": {...}}"""
+    with _lock:
+        operations = {name: dict(vars(stats), buckets=list(stats.buckets)) for name, stats in _operations.items()}
+        queries = {key: {"count": s[0], "total_time": s[1], "max_time": s[2]} for key, s in _queries.items()}
+    return {"operations": operations, "queries": queries}
+
+
+def reset():
+    with _lock:
+        _operations.clear()
+        _queries.clear()
+
+
+def _label(value):
+    return value.replace("\\", "\\\\").replace("\n", " ").replace('"', '\\"')
+
+
+def prometheus_text():
+    data = snapshot()
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            label_text = ",".join(f'{k}="{_label(str(v))}"' for k, v in labels.items())
+            lines.append(f"{name}{{{label_text}}} {value}")
+
+    ops = sorted(data["operations"].items())
+    lines.append("# HELP library_operation_seconds Operation latency")
+    lines.append("# TYPE library_operation_seconds histogram")
+    for name, stats in ops:
+        for bound, count in zip(BUCKETS, stats["buckets"]):
+            lines.append(f'library_operation_seconds_bucket{{operation="{name}",le="{bound}"}} {count}')
+        lines.append(f'library_operation_seconds_bucket{{operation="{name}",le="+Inf"}} {stats["calls"]}')
+        lines.append(f'library_operation_seconds_sum{{operation="{name}"}} {stats["total_time"]}')
+        lines.append(f'library_operation_seconds_count{{operation="{name}"}} {stats["calls"]}')
+
+    counters = (
+        ("library_operation_errors_total", "errors", "Operations that failed or returned False"),
+        ("library_operation_queries_total", "queries", "SQL statements issued by operations"),
+        ("library_operation_query_seconds_total", "query_time", "Time spent in SQL by operations"),
+        ("library_operation_rows_loaded_total", "rows_loaded", "Rows returned by queries issued through the session"),
+        ("library_operation_rows_written_total", "rows_written", "Rows inserted, updated or deleted by operations"),
+        ("library_operation_commits_total", "commits", "Commits issued by operations"),
+        ("library_operation_commit_seconds_total", "commit_time", "Time spent committing"),
+    )
+    for metric_name, field, help_text in counters:
+        metric(metric_name, "counter", help_text, [({"operation": name}, stats[field]) for name, stats in ops])
+
+    top = sorted(data["queries"].items(), key=lambda item: item[1]["total_time"], reverse=True)[:EXPORT_TOP_QUERIES]
+    metric("library_query_total", "counter", "SQL statements by fingerprint",
+           [({"fingerprint": key[:200]}, stats["count"]) for key, stats in top])
+    metric("library_query_seconds_total", "counter", "SQL time by fingerprint",
+           [({"fingerprint": key[:200]}, stats["total_time"]) for key, stats in top])
+
+    import cache
+    cache_stats = cache.stats()
+    metric("library_cache_hits_total", "counter", "Cache hits",
+           [({"cache": name}, cache_stats[name]["hits"]) for name in ("books", "search")])
+    metric("library_cache_misses_total", "counter", "Cache misses",
+           [({"cache": name}, cache_stats[name]["misses"]) for name in ("books", "search")])
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics(path):
+    # 先写临时文件再替换，收集器不会读到写了一半的文件
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(prometheus_text())
+    os.replace(tmp, path)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port, host="127.0.0.1"):
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logger.info(f"Metrics endpoint: http://{host}:{port}/metrics")
+    return server
+
+
+def _write_periodically(path):
+    while True:
+        time.sleep(METRICS_INTERVAL)
+        try:
+            write_metrics(path)
+        except OSError as e:
+            logger.error(f"Failed to write metrics file {path}: {e}")
+
+
+def _start_exporters():
+    if METRICS_FILE:
+        atexit.register(write_metrics, METRICS_FILE)
+        threading.Thread(target=_write_periodically, args=(METRICS_FILE,), name="metrics-file", daemon=True).start()
+    if METRICS_PORT:
+        try:
+            start_metrics_server(METRICS_PORT)
+        except OSError as e:
+            logger.error(f"Failed to start metrics endpoint on port {METRICS_PORT}: {e}")
@@ -0,0 +1,213 @@
+# HTTP 服务压测
+# 模拟大量并发客户端(每个客户端一个长连接)对 server.py 执行查询、借书、还书，
+# 统计吞吐量和各接口的延迟分位数。
+# 用法:
+#   python load_test.py --spawn --clients 200 --requests 50     # 在临时数据库上启动服务并压测
+#   python load_test.py --port 8080 --user admin --password xxx  # 压测已运行的服务
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+SEED_BOOKS = 200
+SEED_COPIES = 5
+
+
+class Client:
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+        self.token = None
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    async def request(self, method, path, payload=None):
+        body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+        head = f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Length: {len(body)}\r\n"
+        if self.token:
+            head += f"Authorization: Bearer {self.token}\r\n"
+        self.writer.write(head.encode("latin-1") + b"\r\n" + body)
+
+        status = int((await self.reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            if name.lower() == "content-length":
+                length = int(value)
+        data = await self.reader.readexactly(length)
+        return status, json.loads(data.decode("utf-8"))
+
+    async def login(self, username, password):
+        status, data = await self.request("POST", "/login", {"username": username, "password": password})
+        if status != 200 or not data.get("ok"):
+            raise RuntimeError(f"login failed for {username}: {data.get('message')}")
+        self.token = data["token"]
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def run_client(host, port, client_id, credentials, isbns, requests, latencies, counts):
+    rng = random.Random(client_id)
+    client = Client(host, port)
+    await client.connect()
+    try:
+        await client.login(*credentials)
+        borrowed = []
+        for _ in range(requests):
+            roll = rng.random()
+            if roll < 0.6:
+                op = "search"
+                path = f"/books?q={rng.choice(['Load', 'Book', '1', '2'])}&limit=20"
+                args = ("GET", path)
+            elif borrowed and roll < 0.8:
+                op = "return"
+                args = ("POST", "/return", {"isbn": borrowed.pop()})
+            else:
+                op = "borrow"
+                args = ("POST", "/borrow", {"isbn": rng.choice(isbns)})
+
+            start = time.perf_counter()
+            status, data = await client.request(*args)
+            latencies.setdefault(op, []).append(time.perf_counter() - start)
+            if status != 200:
+                counts["http_errors"] += 1
+            elif op == "borrow" and data["ok"]:
+                borrowed.append(args[2]["isbn"])
+            counts[op] += 1
+    finally:
+        client.close()
+
+
+async def run_load(host, port, clients, requests, credentials, isbns):
+    latencies = {}
+    counts = {"search": 0, "borrow": 0, "return": 0, "http_errors": 0}
+    start = time.perf_counter()
+    results = await asyncio.gather(*[
+        run_client(host, port, i, credentials(i), isbns, requests, latencies, counts)
+        for i in range(clients)
+    ], return_exceptions=True)
+    elapsed = time.perf_counter() - start
+
+    failed = [r for r in results if isinstance(r, Exception)]
+    total = sum(len(values) for values in latencies.values())
+    report = {
+        "clients": clients,
+        "requests": total,
+        "elapsed": round(elapsed, 3),
+        "requests_per_sec": round(total / elapsed, 1) if elapsed else 0.0,
+        "failed_clients": len(failed),
+        **counts,
+    }
+    for op, values in sorted(latencies.items()):
+        values.sort()
+        for pct in (50, 95, 99):
+            report[f"{op}_p{pct}_ms"] = round(percentile(values, pct) * 1000, 2)
+    if failed:
+        report["first_failure"] = repr(failed[0])
+    return report
+
+
+def seed_database(path, clients):
+    # 在临时数据库中创建压测用户和图书，返回 ISBN 列表
+    import db
+    from auth import AuthManager
+    from models import Book
+
+    db.DB_URL = f"sqlite:///{path}"
+    db.init_db()
+    session = db.SessionLocal()
+    auth = AuthManager(session)
+    for i in range(clients):
+        auth.register(f"load{i}", "load")
+    isbns = [f"97811{i:08d}" for i in range(SEED_BOOKS)]
+    session.add_all(Book(isbn=isbn, title=f"Load Book {i}", author=f"Author {i % 20}", category="load",
+                         total_copies=SEED_COPIES, available_copies=SEED_COPIES)
+                    for i, isbn in enumerate(isbns))
+    session.commit()
+    session.close()
+    db.engine.dispose()
+    return isbns
+
+
+async def wait_for_server(host, port, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            client = Client(host, port)
+            await client.connect()
+            status, _ = await client.request("GET", "/health")
+            client.close()
+            if status == 200:
+                return
+        except OSError:
+            pass
+        if time.monotonic() > deadline:
+            raise RuntimeError("server did not start")
+        await asyncio.sleep(0.2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="HTTP 服务压测")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--clients", type=int, default=100, help="并发客户端数")
+    parser.add_argument("--requests", type=int, default=50, help="每个客户端的请求数")
+    parser.add_argument("--spawn", action="store_true", help="在临时数据库上启动服务后压测")
+    parser.add_argument("--user", help="压测已运行的服务时使用的账号")
+    parser.add_argument("--password", default="")
+    parser.add_argument("--isbn", action="append", default=[], help="借还使用的 ISBN，可重复")
+    args = parser.parse_args(argv)
+
+    server = None
+    if args.spawn:
+        path = os.path.join(tempfile.mkdtemp(prefix="library_load_"), "load.db")
+        isbns = seed_database(path, args.clients)
+        env = dict(os.environ, LIBRARY_DB_URL=f"sqlite:///{path}")
+        here = os.path.dirname(os.path.abspath(__file__))
+        server = subprocess.Popen(
+            [sys.executable, os.path.join(here, "server.py"), "--host", args.host, "--port", str(args.port)],
+            env=env, cwd=os.path.dirname(path), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        credentials = lambda i: (f"load{i}", "load")
+    else:
+        if not args.user:
+            parser.error("未使用 --spawn 时需要指定 --user")
+        isbns = args.isbn or [""]
+        credentials = lambda i: (args.user, args.password)
+
+    try:
+        asyncio.run(wait_for_server(args.host, args.port))
+        report = asyncio.run(run_load(args.host, args.port, args.clients, args.requests, credentials, isbns))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    for key, value in report.items():
+        print(f"{key:>20}: {value}")
+    return 1 if report["failed_clients"] or report["http_errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
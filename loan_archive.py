@@ -0,0 +1,250 @@
+# 借阅记录归档
+# borrow_records 只增不减，已归还的历史记录会拖慢借还和逾期查询。
+# 本模块把已归还且超过 ARCHIVE_AFTER_DAYS 天的记录分批移入 borrow_records_archive(冷数据)，
+# 借还操作只访问较小的热数据表；借阅历史和按时间段统计等历史查询可选择合并冷热两部分。
+#
+# 归档表默认位于主数据库；设置 LIBRARY_ARCHIVE_DB=archive.db 后(仅 SQLite)存放在独立文件中，
+# 通过 ATTACH 挂载，见 db.configure_archive。
+#
+# 每批分两个短事务：先把记录复制到归档表并提交，再从热数据表删除已复制的记录，
+# 批与批之间暂停片刻让出写锁，不影响借还台的操作。
+# 归档表位于独立文件时，跨 ATTACH 数据库的事务在 WAL 模式下不是原子的，先提交复制保证崩溃时不会只删除不复制；
+# 中断后重新运行即可继续：已复制但未删除的记录不会重复写入，会在下次运行时删除。
+# (两次提交之间合并冷热两表的历史查询可能短暂看到同一条记录两次。)
+# 记录保留原 id，borrow_records 使用 AUTOINCREMENT 保证已归档的 id 不会被新借阅重用；
+# 万一遇到 id 冲突(归档表中同 id 的是另一条借阅)则回滚并报错，不会丢失记录。
+# 累计借阅次数保存在 book_stats 中，归档不会改变热门图书统计。
+#
+# 用法:
+#   python loan_archive.py run --days 365 --batch-size 500
+#   python loan_archive.py status
+
+import argparse
+import datetime
+import os
+import sys
+import time
+
+from sqlalchemy import and_, delete, exists, func, insert, literal, select, text, union_all, DateTime
+from sqlalchemy.exc import OperationalError
+from models import Book, BorrowRecord, BorrowRecordArchive
+from logger_config import logger
+
+ARCHIVE_AFTER_DAYS = int(os.environ.get("LIBRARY_ARCHIVE_AFTER_DAYS", "365"))
+BATCH_SIZE = 500
+# 每批之间的暂停(秒)，让借还操作有机会拿到写锁
+BATCH_PAUSE = 0.05
+LOCK_RETRIES = 5
+
+# 冷热两张表共有的列
+LOAN_COLUMNS = ("id", "user_id", "book_id", "borrow_date", "due_date", "return_date")
+
+
+def loans(include_archive=True, where=None):
+    """
+    借阅记录的统一视图(子查询，列见 LOAN_COLUMNS)。
+    where(table) 返回的条件分别加到冷热两张表的查询上，使两边都能用到各自的索引。
+    """
+    tables = [BorrowRecord.__table__]
+    if include_archive:
+        tables.append(BorrowRecordArchive.__table__)
+    selects = []
+    for table in tables:
+        stmt = select(*[table.c[name] for name in LOAN_COLUMNS])
+        if where is not None:
+            stmt = stmt.where(where(table))
+        selects.append(stmt)
+    return (union_all(*selects) if len(selects) > 1 else selects[0]).subquery("loans")
+
+
+def user_history(db, user_id, include_archive=True, limit=100):
+    """用户的借阅历史，按借出时间倒序: [(isbn, 书名, 借出, 应还, 归还), ...]；图书已删除时书名为空"""
+    history = loans(include_archive, lambda t: t.c.user_id == user_id)
+    return db.query(
+        Book.isbn, Book.title, history.c.borrow_date, history.c.due_date, history.c.return_date
+    ).select_from(history).outerjoin(Book, Book.id == history.c.book_id).order_by(
+        history.c.borrow_date.desc()
+    ).limit(limit).all()
+
+
+def hot_books_between(db, start, end=None, include_archive=True, limit=5):
+    """时间段内借阅次数最多的图书: [(书名, 次数), ...]"""
+    end = end or datetime.datetime.now()
+    period = loans(include_archive, lambda t: and_(t.c.borrow_date >= start, t.c.borrow_date < end))
+    count = func.count(period.c.id).label('count')
+    return db.query(Book.title, count).select_from(period).join(
+        Book, Book.id == period.c.book_id
+    ).group_by(Book.id, Book.title).order_by(count.desc()).limit(limit).all()
+
+
+class ArchiveConflictError(Exception):
+    """归档表中已有相同 id 但不是同一条借阅的记录"""
+
+
+def _archivable(table, cutoff):
+    return and_(table.c.return_date != None, table.c.return_date < cutoff)
+
+
+def _same_loan(cold, hot):
+    # 同一条借阅(之前已复制但未删除)：id 相同且借阅人、图书、借出时间都相同
+    return and_(
+        cold.c.id == hot.c.id,
+        cold.c.user_id.is_not_distinct_from(hot.c.user_id),
+        cold.c.book_id.is_not_distinct_from(hot.c.book_id),
+        cold.c.borrow_date.is_not_distinct_from(hot.c.borrow_date),
+    )
+
+
+def _reused_ids(db, where=None):
+    """热数据表中 id 已被归档表中另一条借阅占用的记录 id"""
+    hot = BorrowRecord.__table__
+    cold = BorrowRecordArchive.__table__
+    stmt = select(hot.c.id).where(exists().where(cold.c.id == hot.c.id), ~exists().where(_same_loan(cold, hot)))
+    if where is not None:
+        stmt = stmt.where(where)
+    return [record_id for (record_id,) in db.execute(stmt)]
+
+
+def archive_batch(db, cutoff, after_id=0, batch_size=BATCH_SIZE):
+    """
+    归档 id 大于 after_id 的下一批记录：复制并提交后再删除。
+    返回 (归档条数, 本批最大 id)；没有可归档的记录时返回 (0, None)。
+    """
+    hot = BorrowRecord.__table__
+    cold = BorrowRecordArchive.__table__
+    # 沿主键向后查找，已跳过的未归还/较新的记录不会被重复扫描
+    ids = [record_id for (record_id,) in db.execute(
+        select(hot.c.id).where(hot.c.id > after_id, _archivable(hot, cutoff)).order_by(hot.c.id).limit(batch_size)
+    )]
+    if not ids:
+        return 0, None
+
+    # 用 id 范围加同样的条件限定本批记录，避免很长的 IN 列表
+    in_batch = and_(hot.c.id >= ids[0], hot.c.id <= ids[-1], _archivable(hot, cutoff))
+    # id 被重用过(旧数据库没有 AUTOINCREMENT)时不能跳过或覆盖，否则这条借阅会从两张表中消失
+    conflicts = _reused_ids(db, in_batch)
+    if conflicts:
+        db.rollback()
+        raise ArchiveConflictError(
+            f"借阅记录 id 与归档表中的其他记录冲突: {conflicts[:10]}，本批已回滚"
+        )
+
+    not_copied = ~exists().where(cold.c.id == hot.c.id)
+    db.execute(insert(cold).from_select(
+        list(LOAN_COLUMNS) + ["archived_at"],
+        select(*[hot.c[name] for name in LOAN_COLUMNS], literal(datetime.datetime.now(), DateTime))
+        .where(in_batch, not_copied)
+    ))
+    db.commit()
+
+    # 只删除确实已在归档表中的记录
+    moved = db.execute(delete(hot).where(in_batch, exists().where(_same_loan(cold, hot)))).rowcount
+    if moved != len(ids):
+        db.rollback()
+        raise ArchiveConflictError(f"本批应归档 {len(ids)} 条，实际复制 {moved} 条，删除已回滚")
+    db.commit()
+    return moved, ids[-1]
+
+
+def reserve_ids(db):
+    """
+    保证新借阅的 id 大于两张表中已有的全部 id(SQLite AUTOINCREMENT 的 sqlite_sequence)，
+    并为 id 已被归档记录占用的热数据记录重新分配 id。返回重新分配的记录数。由迁移调用。
+    """
+    hot = BorrowRecord.__table__
+    cold = BorrowRecordArchive.__table__
+    top = max(
+        db.execute(select(func.max(hot.c.id))).scalar() or 0,
+        db.execute(select(func.max(cold.c.id))).scalar() or 0,
+        db.execute(text("SELECT MAX(seq) FROM sqlite_sequence WHERE name = 'borrow_records'")).scalar() or 0,
+    )
+    db.execute(text("DELETE FROM sqlite_sequence WHERE name = 'borrow_records'"))
+    db.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES ('borrow_records', :seq)"), {"seq": top})
+
+    reused = _reused_ids(db)
+    for start in range(0, len(reused), 500):
+        chunk = reused[start:start + 500]
+        columns = [name for name in LOAN_COLUMNS if name != "id"]
+        db.execute(insert(hot).from_select(columns, select(*[hot.c[name] for name in columns])
+                                           .where(hot.c.id.in_(chunk)).order_by(hot.c.id)))
+        db.execute(delete(hot).where(hot.c.id.in_(chunk)))
+    if reused:
+        logger.warning(f"Renumbered {len(reused)} loans whose ids were reused after archiving")
+    return len(reused)
+
+
+def archive_closed_loans(db, older_than_days=ARCHIVE_AFTER_DAYS, batch_size=BATCH_SIZE,
+                         pause=BATCH_PAUSE, max_batches=None, progress=None):
+    """分批归档已归还超过 older_than_days 天的记录，返回归档条数；progress(累计条数) 每批调用一次"""
+    cutoff = datetime.datetime.now() - datetime.timedelta(days=older_than_days)
+    after_id = 0
+    total = 0
+    batches = 0
+    start = time.perf_counter()
+    while max_batches is None or batches < max_batches:
+        for attempt in range(LOCK_RETRIES + 1):
+            try:
+                moved, last_id = archive_batch(db, cutoff, after_id, batch_size)
+                break
+            except OperationalError as e:
+                db.rollback()
+                if "locked" not in str(e).lower() or attempt == LOCK_RETRIES:
+                    raise
+                logger.warning(f"Archive batch hit a lock, retrying ({attempt + 1}/{LOCK_RETRIES})")
+                time.sleep(pause * 2 ** (attempt + 1))
+        if last_id is None:
+            break
+        total += moved
+        batches += 1
+        after_id = last_id
+        if progress:
+            progress(total)
+        time.sleep(pause)
+
+    logger.info(f"Archived {total} closed loans older than {older_than_days} days "
+                f"in {batches} batches ({time.perf_counter() - start:.1f}s)")
+    return total
+
+
+def status(db, older_than_days=ARCHIVE_AFTER_DAYS):
+    cutoff = datetime.datetime.now() - datetime.timedelta(days=older_than_days)
+    hot = BorrowRecord.__table__
+    return {
+        "hot": db.query(func.count(BorrowRecord.id)).scalar(),
+        "open": db.query(func.count(BorrowRecord.id)).filter(BorrowRecord.return_date == None).scalar(),
+        "archivable": db.execute(select(func.count(hot.c.id)).where(_archivable(hot, cutoff))).scalar(),
+        "archived": db.query(func.count(BorrowRecordArchive.id)).scalar(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="归档已归还的借阅记录")
+    parser.add_argument("command", choices=["run", "status"])
+    parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS, help="归档归还超过多少天的记录")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--pause", type=float, default=BATCH_PAUSE, help="每批之间暂停的秒数")
+    parser.add_argument("--max-batches", type=int, help="本次最多执行的批数，下次运行时继续")
+    args = parser.parse_args(argv)
+
+    from db import get_db
+    db = next(get_db())
+    try:
+        if args.command == "run":
+            def progress(total):
+                print(f"\rarchived: {total}", end="", file=sys.stderr, flush=True)
+            try:
+                total = archive_closed_loans(db, args.days, args.batch_size, args.pause, args.max_batches, progress)
+            except ArchiveConflictError as e:
+                print(file=sys.stderr)
+                print(f"归档中止: {e}")
+                sys.exit(1)
+            print(file=sys.stderr)
+            print(f"已归档 {total} 条借阅记录")
+        for name, value in status(db, args.days).items():
+            print(f"{name}: {value}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# 借阅统计计数
+# 在借书/还书的同一事务中增量维护 book_stats 和 loan_due_buckets，
+# 使热门图书和逾期数量的查询与借阅历史的规模无关。
+# 计数与历史不一致时(例如直接改过数据库)可重建:  python loan_stats.py rebuild
+
+import datetime
+import sys
+
+from sqlalchemy import func, insert, select, case
+from models import Book, BorrowRecord, BookStats, LoanDueBucket
+from logger_config import logger
+import loan_archive
+
+
+def _bump(db, model, key_column, key, **deltas):
+    # 计数行不存在时插入，存在时累加
+    from db import add_counts
+    add_counts(db, model.__table__, (key_column.key,), [{key_column.key: key, **deltas}])
+
+
+# 以下函数在调用方的事务中执行，随借还操作一起提交或回滚
+def record_borrow(db, book_id, due_date):
+    _bump(db, BookStats, BookStats.book_id, book_id, borrow_count=1, open_loans=1)
+    _bump(db, LoanDueBucket, LoanDueBucket.due_day, due_date.date(), open_count=1)
+
+
+def record_return(db, book_id, due_date):
+    _bump(db, BookStats, BookStats.book_id, book_id, open_loans=-1)
+    if due_date is not None:
+        _bump(db, LoanDueBucket, LoanDueBucket.due_day, due_date.date(), open_count=-1)
+
+
+def forget_book(db, book_id):
+    db.query(BookStats).filter(BookStats.book_id == book_id).delete(synchronize_session=False)
+
+
+def hot_books(db, limit=5):
+    # borrow_count 上有索引，只需读取前 limit 行
+    return db.query(Book.title, BookStats.borrow_count.label('count')).join(
+        BookStats, BookStats.book_id == Book.id
+    ).filter(BookStats.borrow_count > 0).order_by(BookStats.borrow_count.desc()).limit(limit).all()
+
+
+def overdue_count(db, now=None):
+    now = now or datetime.datetime.now()
+    today = datetime.datetime.combine(now.date(), datetime.time())
+
+    # 今天之前到期的直接取分桶合计，今天到期的只需检查当天的少量记录
+    before_today = db.query(func.coalesce(func.sum(LoanDueBucket.open_count), 0)).filter(
+        LoanDueBucket.due_day < now.date()
+    ).scalar()
+    due_today = db.query(func.count(BorrowRecord.id)).filter(
+        BorrowRecord.return_date == None,
+        BorrowRecord.due_date >= today,
+        BorrowRecord.due_date < now
+    ).scalar()
+    return int(before_today) + int(due_today)
+
+
+# 根据借阅历史重新计算全部计数
+def rebuild(db):
+    db.query(BookStats).delete(synchronize_session=False)
+    db.query(LoanDueBucket).delete(synchronize_session=False)
+
+    # 累计借阅次数包括已归档的记录
+    loans = loan_archive.loans(include_archive=True, where=lambda t: t.c.book_id != None)
+    open_flag = case((loans.c.return_date == None, 1), else_=0)
+    db.execute(insert(BookStats.__table__).from_select(
+        ["book_id", "borrow_count", "open_loans"],
+        select(loans.c.book_id, func.count(loans.c.id), func.sum(open_flag))
+        .group_by(loans.c.book_id)
+    ))
+
+    # 按天汇总在 Python 中完成，避免依赖各数据库不同的日期函数
+    buckets = {}
+    open_loans = db.query(BorrowRecord.due_date).filter(
+        BorrowRecord.return_date == None, BorrowRecord.due_date != None
+    ).yield_per(10000)
+    for (due_date,) in open_loans:
+        day = due_date.date()
+        buckets[day] = buckets.get(day, 0) + 1
+    if buckets:
+        db.execute(insert(LoanDueBucket.__table__), [
+            {"due_day": day, "open_count": count} for day, count in buckets.items()
+        ])
+    db.commit()
+    logger.info(f"Loan statistics rebuilt: {len(buckets)} due-date buckets")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["rebuild"]:
+        print("用法: python loan_stats.py rebuild")
+        sys.exit(1)
+    from db import get_db
+    rebuild(next(get_db()))
+    print("统计计数已重建")
@@ -1,19 +1,116 @@
+import atexit
+import copy
+import gzip
+import json
 import logging
+import logging.handlers
 import os
+import queue
+import shutil
+
+# 日志配置(均可通过环境变量修改)
+#   LIBRARY_LOG_FILE        日志文件，默认 library_system.log
+#   LIBRARY_LOG_LEVEL       日志级别，默认 INFO
+#   LIBRARY_LOG_FORMAT      text(默认) 或 json(每行一个 JSON 对象，便于批量分析)
+#   LIBRARY_LOG_MAX_BYTES   按大小切分，默认 10MB
+#   LIBRARY_LOG_ROTATE_WHEN 设置后改为按时间切分，例如 midnight、H
+#   LIBRARY_LOG_BACKUPS     保留的历史文件数，默认 10；历史文件自动 gzip 压缩
+# 注意：多个进程写同一个日志文件时切分可能互相干扰，多终端部署时应为每个终端指定不同的文件。
+LOG_FILE = os.environ.get("LIBRARY_LOG_FILE", "library_system.log")
+LOG_LEVEL = os.environ.get("LIBRARY_LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("LIBRARY_LOG_FORMAT", "text").lower()
+LOG_MAX_BYTES = int(os.environ.get("LIBRARY_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_ROTATE_WHEN = os.environ.get("LIBRARY_LOG_ROTATE_WHEN")
+LOG_BACKUPS = int(os.environ.get("LIBRARY_LOG_BACKUPS", "10"))
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+# 通过 logger.info(..., extra={...}) 或 instrumentation 附加到日志记录上的结构化字段
+CONTEXT_FIELDS = ("operation", "user", "isbn", "latency_ms")
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "process": record.process,
+            "thread": record.threadName,
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """
+    标准的 QueueHandler.prepare 用默认格式把异常堆栈拼进 message，并清空 exc_info/exc_text，
+    写文件时 JsonFormatter 就得不到 exception 字段。
+    这里只合并消息参数，堆栈格式化为文本保留在 exc_text 中，由各 handler 自己的格式决定如何输出。
+    """
+
+    _formatter = logging.Formatter()
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.message = record.msg = record.getMessage()
+        record.args = None
+        # traceback 引用着调用栈的各帧，入队前换成文本，不让这些帧在队列中存活
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self._formatter.formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+
+def _gzip_namer(name):
+    return name + ".gz"
+
+
+def _gzip_rotator(source, dest):
+    # 切分出的历史文件压缩保存
+    with open(source, "rb") as f_in, gzip.open(dest, "wb") as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+
+def _file_handler():
+    if LOG_ROTATE_WHEN:
+        handler = logging.handlers.TimedRotatingFileHandler(
+            LOG_FILE, when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUPS, encoding='utf-8'
+        )
+    else:
+        handler = logging.handlers.RotatingFileHandler(
+            LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS, encoding='utf-8'
+        )
+    handler.namer = _gzip_namer
+    handler.rotator = _gzip_rotator
+    return handler
+
 
 def setup_logger():
-    log_file = 'library_system.log'
-    
-    # Configure logging format
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler(log_file, encoding='utf-8'),
-            logging.StreamHandler() # Also output to console
-        ]
-    )
-    
+    # 业务代码只把日志记录放入队列，由后台线程写文件和控制台，借还等操作不再等待磁盘写入
+    formatter = JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT)
+    handlers = [_file_handler(), logging.StreamHandler()]  # Also output to console
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(-1)
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    # 退出时写完队列中剩余的日志
+    atexit.register(listener.stop)
+
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    root.addHandler(QueueHandler(log_queue))
+
     return logging.getLogger('LibrarySystem')
 
 logger = setup_logger()
@@ -1,11 +1,36 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
 import datetime
-from db import get_db, init_db
-from auth import AuthManager
-from manager import LibraryManager
-from scanner import BarcodeScanner
-from models import Book
+import importlib
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+import time
+from worker import TaskRunner
+import events
+from logger_config import logger
+
+# 图书列表按键集分页读取，每页的行数
+BOOK_PAGE_SIZE = 100
+# 图书列表只保留可视区域附近的若干页，离开可视区域的页被丢弃，滚动回来时重新读取
+BOOK_CACHED_PAGES = 5
+# 连续扫码：同一本书的去重间隔(秒)和预览刷新间隔(毫秒)
+SCAN_COOLDOWN = 3.0
+SCAN_POLL_MS = 30
+# 借书后热门图书统计的刷新延迟(毫秒)，连续借书时合并为一次查询
+STATS_REFRESH_DELAY_MS = 1000
+
+def init_backend():
+    # 在后台线程中执行：导入数据库相关模块(SQLAlchemy 导入约需数百毫秒)并建表、迁移，
+    # 登录窗口不必等待。OpenCV 等扫码依赖则在第一次扫码时才加载。
+    start = time.perf_counter()
+    from db import init_db
+    # 只为预先导入(登录和业务操作时不再等待导入)，模块本身在任务中按需取用
+    for name in ("auth", "manager"):
+        importlib.import_module(name)
+    init_db()
+    logger.info(f"Backend initialized in {(time.perf_counter() - start) * 1000:.0f} ms")
+
 
 class LibraryApp:
     def __init__(self, root):
@@ -13,14 +38,20 @@ class LibraryApp:
         self.root.title("简易图书管理系统")
         self.root.geometry("900x600")
         
-        # 初始化数据库连接
-        init_db()
-        self.db = next(get_db())
-        self.auth = AuthManager(self.db)
-        self.scanner = BarcodeScanner()
+        # 数据库初始化和数据库操作统一交给后台线程执行，任务会等初始化完成后再运行
+        self.tasks = TaskRunner(self.root, initializer=init_backend)
+        self.tasks.on_busy = self.set_busy
+        # 借还、添加等操作提交后，只更新受影响的行和统计数字(事件在工作线程发布，转到主线程处理)
+        events.subscribe(lambda event: self.tasks.post(self.on_library_event, event))
+        self.stats_refresh_pending = False
+        self.overdue_count = 0
+        self.auth = None
+        self.scanner = None     # 第一次扫码时创建，见 get_scanner
+        self.scan_session = None
+        # 扫码结果送往的表单: "op" 借还页(加入借阅清单) 或 "add" 添加图书
+        self.scan_target = "op"
         
         self.current_user = None
-        self.manager = None
 
         # 设置样式
         self.setup_styles()
@@ -87,6 +118,25 @@ class LibraryApp:
         style.configure("Treeview", font=("Microsoft YaHei UI", 10), rowheight=25)
         style.configure("Treeview.Heading", font=("Microsoft YaHei UI", 10, "bold"))
 
+    def set_busy(self, busy):
+        # 后台有任务执行时显示等待光标
+        self.root.config(cursor="watch" if busy else "")
+
+    # 在后台线程中以当前用户身份调用 LibraryManager，回调在主线程执行
+    def run_manager(self, fn, on_success, key=None, on_error=None):
+        user = self.current_user
+
+        def task(session):
+            from manager import LibraryManager
+            return fn(LibraryManager(session, user))
+
+        self.tasks.submit(
+            task,
+            on_success=on_success,
+            on_error=on_error or (lambda e: messagebox.showerror("错误", f"操作失败: {e}")),
+            key=key,
+        )
+
     def clear_window(self):
         for widget in self.root.winfo_children():
             widget.destroy()
@@ -142,13 +192,22 @@ class LibraryApp:
             messagebox.showwarning("提示", "请输入用户名和密码")
             return
 
-        success, msg = self.auth.login(username, password)
-        if success:
-            self.current_user = self.auth.current_user
-            self.manager = LibraryManager(self.db, self.current_user)
-            self.show_main_screen()
-        else:
-            messagebox.showerror("登录失败", msg)
+        def login(session):
+            from auth import AuthManager
+            auth = AuthManager(session)
+            success, msg = auth.login(username, password)
+            return auth, success, msg
+
+        def done(result):
+            auth, success, msg = result
+            if success:
+                self.auth = auth
+                self.current_user = auth.current_user
+                self.show_main_screen()
+            else:
+                messagebox.showerror("登录失败", msg)
+
+        self.tasks.submit(login, on_success=done, on_error=lambda e: messagebox.showerror("登录失败", str(e)), key="login")
 
     def perform_register(self):
         username = self.entry_user.get()
@@ -159,17 +218,29 @@ class LibraryApp:
             messagebox.showwarning("提示", "请输入用户名和密码")
             return
 
-        success, msg = self.auth.register(username, password, is_admin)
-        if success:
-            messagebox.showinfo("注册成功", msg)
-        else:
-            messagebox.showerror("注册失败", msg)
+        def register(session):
+            from auth import AuthManager
+            return AuthManager(session).register(username, password, is_admin)
+
+        def done(result):
+            success, msg = result
+            if success:
+                messagebox.showinfo("注册成功", msg)
+            else:
+                messagebox.showerror("注册失败", msg)
+
+        self.tasks.submit(
+            register,
+            on_success=done,
+            on_error=lambda e: messagebox.showerror("注册失败", str(e)),
+        )
 
     def logout(self):
+        self.stop_continuous_scan()
         if self.auth:
             self.auth.logout()
+        self.auth = None
         self.current_user = None
-        self.manager = None
         self.show_login_screen()
 
     # ==========================================
@@ -206,6 +277,13 @@ class LibraryApp:
             self.notebook.add(self.tab_admin, text='管理员面板')
             self.build_admin_tab(self.tab_admin)
 
+            # Tab 4: 借阅分析 (仅管理员可见)，第一次切换到该页时才计算
+            self.tab_analytics = ttk.Frame(self.notebook)
+            self.notebook.add(self.tab_analytics, text='借阅分析')
+            self.build_analytics_tab(self.tab_analytics)
+            self.analytics_loaded = False
+            self.notebook.bind("<<NotebookTabChanged>>", self.on_tab_changed)
+
     # ------------------------------------------
     # Tab 1: 图书查询
     # ------------------------------------------
@@ -223,9 +301,19 @@ class LibraryApp:
         ttk.Button(search_frame, text="搜索", command=self.refresh_book_list).pack(side=tk.LEFT)
         ttk.Button(search_frame, text="显示全部", command=lambda: [self.entry_search.delete(0, tk.END), self.refresh_book_list()]).pack(side=tk.LEFT, padx=5)
 
+        # 虚拟列表：Treeview 中只有填满可视区域的固定数量的行，滚动时只替换这些行的内容。
+        # 第 p 页是 book_anchors[p] 之后的 BOOK_PAGE_SIZE 本书(键集分页)，已知的页起点逐页向后扩展
+        self.book_keyword = ""
+        self.book_anchors = [0]         # 每页之前最后一本书的 id
+        self.book_pages = OrderedDict() # 已读取的页: 页号 -> 行，最近用到的在后
+        self.book_end = None            # 已读到最后一页时为结果总数
+        self.book_top = 0               # 可视区域第一行在结果中的位置
+        self.book_loading = None        # 正在读取的页号，同一时间只读取一页
+        self.book_items = []            # Treeview 中复用的行
+
         # 列表 (Treeview)
         columns = ("isbn", "title", "author", "category", "available")
-        self.tree_books = ttk.Treeview(parent, columns=columns, show="headings")
+        self.tree_books = ttk.Treeview(parent, columns=columns, show="headings", selectmode="browse")
         
         self.tree_books.heading("isbn", text="ISBN")
         self.tree_books.heading("title", text="书名")
@@ -239,8 +327,15 @@ class LibraryApp:
         self.tree_books.column("category", width=80)
         self.tree_books.column("available", width=80)
 
-        scrollbar = ttk.Scrollbar(parent, orient=tk.VERTICAL, command=self.tree_books.yview)
-        self.tree_books.configure(yscroll=scrollbar.set)
+        # 滚动条和滚轮改变的是 book_top，而不是 Treeview 自身的滚动位置
+        scrollbar = ttk.Scrollbar(parent, orient=tk.VERTICAL, command=self.on_book_scrollbar)
+        self.book_scrollbar = scrollbar
+        self.tree_books.bind("<Configure>", self.on_book_list_resize)
+        self.tree_books.bind("<MouseWheel>", lambda e: self.scroll_books(-3 if e.delta > 0 else 3))
+        self.tree_books.bind("<Button-4>", lambda e: self.scroll_books(-3))
+        self.tree_books.bind("<Button-5>", lambda e: self.scroll_books(3))
+        self.tree_books.bind("<Prior>", lambda e: self.scroll_books(-len(self.book_items)))
+        self.tree_books.bind("<Next>", lambda e: self.scroll_books(len(self.book_items)))
         
         self.tree_books.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=10, pady=10)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y, pady=10)
@@ -249,56 +344,366 @@ class LibraryApp:
         self.refresh_book_list()
 
     def refresh_book_list(self):
-        # 清空现有
-        for i in self.tree_books.get_children():
-            self.tree_books.delete(i)
-            
-        keyword = self.entry_search.get()
-        books = self.manager.list_books(keyword)
-        
-        if books:
-            for b in books:
-                self.tree_books.insert("", tk.END, values=(b.isbn, b.title, b.author, b.category, f"{b.available_copies}/{b.total_copies}"))
+        # 重置分页状态，从第一页开始
+        self.book_keyword = self.entry_search.get()
+        self.book_anchors = [0]
+        self.book_pages.clear()
+        self.book_end = None
+        self.book_top = 0
+        self.book_loading = None
+        self.render_book_window()
+
+    def on_book_list_resize(self, event):
+        # 行数随控件高度变化(表头约占一行)
+        row_height = int(ttk.Style().lookup("Treeview", "rowheight") or 25)
+        count = max(1, event.height // row_height - 1)
+        if count == len(self.book_items):
+            return
+        while len(self.book_items) < count:
+            self.book_items.append(self.tree_books.insert("", tk.END, values=("", "", "", "", "")))
+        while len(self.book_items) > count:
+            self.tree_books.delete(self.book_items.pop())
+        self.scroll_books(0)
+
+    def book_row_limit(self):
+        # 目前可以滚动到的行数：最后一页已读到时为总数，否则为已知页起点覆盖的范围
+        if self.book_end is not None:
+            return self.book_end
+        return len(self.book_anchors) * BOOK_PAGE_SIZE
+
+    def scroll_books(self, delta):
+        top = min(self.book_top + delta, self.book_row_limit() - len(self.book_items))
+        self.book_top = max(0, top)
+        self.render_book_window()
+        return "break"
+
+    def on_book_scrollbar(self, action, value, unit=None):
+        if action == "moveto":
+            self.book_top = int(float(value) * self.book_scroll_total())
+            self.scroll_books(0)
+        elif action == "scroll":
+            self.scroll_books(int(value) * (len(self.book_items) if unit == "pages" else 1))
+
+    def book_scroll_total(self):
+        # 总数未知时多留一页，滚动条不会停在底部
+        if self.book_end is not None:
+            return self.book_end
+        return len(self.book_anchors) * BOOK_PAGE_SIZE + BOOK_PAGE_SIZE
+
+    def book_row(self, index):
+        page, offset = divmod(index, BOOK_PAGE_SIZE)
+        rows = self.book_pages.get(page)
+        if rows is None or offset >= len(rows):
+            return None
+        self.book_pages.move_to_end(page)
+        return rows[offset]
+
+    def render_book_window(self):
+        if not self.widget_alive("tree_books"):
+            return
+        missing = None
+        for position, item in enumerate(self.book_items):
+            index = self.book_top + position
+            if self.book_end is not None and index >= self.book_end:
+                self.tree_books.detach(item)
+                continue
+            row = self.book_row(index)
+            if row is None:
+                missing = index // BOOK_PAGE_SIZE if missing is None else missing
+                values = ("", "加载中...", "", "", "")
+            else:
+                book_id, isbn, title, author, category, available, total = row
+                values = (isbn, title, author, category, f"{available}/{total}")
+            self.tree_books.move(item, "", position)
+            self.tree_books.item(item, values=values)
+
+        total = self.book_scroll_total()
+        if total:
+            self.book_scrollbar.set(self.book_top / total, min(1.0, (self.book_top + len(self.book_items)) / total))
+        else:
+            self.book_scrollbar.set(0.0, 1.0)
+        if missing is not None:
+            # 页起点未知时先读取最后一个已知的页，逐页向后扩展
+            self.load_book_page(min(missing, len(self.book_anchors) - 1))
+
+    def load_book_page(self, page):
+        if self.book_loading is not None:
+            return
+        self.book_loading = page
+        keyword, after_id = self.book_keyword, self.book_anchors[page]
+        self.run_manager(
+            lambda m: m.list_books_page(keyword, after_id, BOOK_PAGE_SIZE),
+            on_success=lambda rows: self.on_book_page_loaded(page, after_id, rows),
+            on_error=self.on_book_load_failed,
+            key="books",
+        )
+
+    def on_book_load_failed(self, error):
+        # 滚动时会重新读取这一页
+        self.book_loading = None
+        messagebox.showerror("错误", f"加载图书列表失败: {error}")
+
+    def on_book_page_loaded(self, page, after_id, rows):
+        self.book_loading = None
+        # 读取期间列表已被刷新或这一页之前的内容有变化时丢弃结果
+        if page < len(self.book_anchors) and self.book_anchors[page] == after_id:
+            self.book_pages[page] = rows
+            self.book_pages.move_to_end(page)
+            while len(self.book_pages) > BOOK_CACHED_PAGES:
+                self.book_pages.popitem(last=False)
+            if len(rows) == BOOK_PAGE_SIZE:
+                if page + 1 == len(self.book_anchors):
+                    self.book_anchors.append(rows[-1][0])
+            else:
+                self.book_end = page * BOOK_PAGE_SIZE + len(rows)
+                self.book_top = max(0, min(self.book_top, self.book_end - len(self.book_items)))
+        self.render_book_window()
+
+    def invalidate_books_from(self, book_id):
+        # 图书增删后，包含该 id 的页及其后各页的起点和内容都可能变化，重新读取(可视位置不变)
+        page = max(0, bisect_left(self.book_anchors, book_id) - 1)
+        del self.book_anchors[page + 1:]
+        for stale in [p for p in self.book_pages if p >= page]:
+            del self.book_pages[stale]
+        self.book_end = None
+        self.render_book_window()
 
     # ------------------------------------------
     # Tab 2: 借阅/归还 (带扫码)
     # ------------------------------------------
     def build_borrow_return_tab(self, parent):
-        frame = ttk.Frame(parent, padding="40")
+        frame = ttk.Frame(parent, padding="20")
         frame.pack(fill=tk.BOTH, expand=True)
 
         # 操作区域
-        op_frame = ttk.LabelFrame(frame, text="操作区域", padding="20")
-        op_frame.pack(fill=tk.X, pady=20)
+        op_frame = ttk.LabelFrame(frame, text="操作区域", padding="10")
+        op_frame.pack(fill=tk.X, pady=(0, 10))
 
         ttk.Label(op_frame, text="图书 ISBN:").grid(row=0, column=0, sticky=tk.W, pady=10)
         
         self.entry_isbn_op = ttk.Entry(op_frame, width=30, font=("Arial", 14))
         self.entry_isbn_op.grid(row=0, column=1, padx=10, pady=10)
 
-        # 扫码按钮 (移除Emoji，防止Windows显示问题)
-        btn_scan = ttk.Button(op_frame, text="扫码输入", command=self.scan_isbn_for_op)
-        btn_scan.grid(row=0, column=2, padx=10)
-
         # 借还按钮
         btn_borrow = ttk.Button(op_frame, text="借阅图书", command=self.action_borrow, style="Big.TButton")
-        btn_borrow.grid(row=1, column=1, pady=20, sticky=tk.W)
+        btn_borrow.grid(row=1, column=1, pady=10, sticky=tk.W)
         
         btn_return = ttk.Button(op_frame, text="归还图书", command=self.action_return, style="Big.TButton")
-        btn_return.grid(row=1, column=2, pady=20, sticky=tk.W)
+        btn_return.grid(row=1, column=2, pady=10, sticky=tk.W)
+
+        # 借书成功后显示"借过这本书的读者还借了"
+        self.lbl_recommend = ttk.Label(op_frame, text="", foreground="gray", wraplength=600)
+        self.lbl_recommend.grid(row=2, column=0, columnspan=3, sticky=tk.W)
 
         # 说明
-        ttk.Label(frame, text="提示: 您可以手动输入ISBN，或点击'扫码输入'使用摄像头识别书籍背面的条形码。", foreground="gray").pack(pady=10)
-
-    def scan_isbn_for_op(self):
-        isbn = self.scanner.scan_isbn()
-        if isbn:
-            self.entry_isbn_op.delete(0, tk.END)
-            self.entry_isbn_op.insert(0, isbn)
-            messagebox.showinfo("扫码成功", f"已识别 ISBN: {isbn}")
+        ttk.Label(frame, text="提示: 您可以手动输入ISBN，或开启连续扫码使用摄像头识别书籍背面的条形码。识别的书会填入上方并自动加入借阅清单。", foreground="gray").pack(pady=(0, 10))
+
+        # 连续扫码：摄像头保持打开，画面嵌入在窗口中
+        scan_frame = ttk.LabelFrame(frame, text="连续扫码", padding="10")
+        scan_frame.pack(fill=tk.X)
+
+        self.btn_continuous = ttk.Button(scan_frame, text="开启连续扫码", command=self.toggle_continuous_scan)
+        self.btn_continuous.grid(row=0, column=0, sticky=tk.NW)
+        self.lbl_scan_status = ttk.Label(scan_frame, text="", foreground="gray")
+        self.lbl_scan_status.grid(row=1, column=0, sticky=tk.NW, pady=5)
+        self.lbl_preview = ttk.Label(scan_frame)
+        self.lbl_preview.grid(row=0, column=1, rowspan=2, padx=10)
+
+        # 借阅清单：读者一次带来多本书时，扫码逐本加入清单，再一次性借阅或归还
+        cart_frame = ttk.LabelFrame(frame, text="借阅清单", padding="10")
+        cart_frame.pack(fill=tk.BOTH, expand=True, pady=(10, 0))
+
+        cart_buttons = ttk.Frame(cart_frame)
+        cart_buttons.pack(side=tk.RIGHT, fill=tk.Y, padx=(10, 0))
+        ttk.Button(cart_buttons, text="加入清单", command=self.cart_add_entry).pack(fill=tk.X, pady=2)
+        ttk.Button(cart_buttons, text="移除选中", command=self.cart_remove_selected).pack(fill=tk.X, pady=2)
+        ttk.Button(cart_buttons, text="清空", command=self.cart_clear).pack(fill=tk.X, pady=2)
+        ttk.Button(cart_buttons, text="全部借阅", command=self.action_borrow_cart).pack(fill=tk.X, pady=(10, 2))
+        ttk.Button(cart_buttons, text="全部归还", command=self.action_return_cart).pack(fill=tk.X, pady=2)
+
+        self.tree_cart = ttk.Treeview(cart_frame, columns=("isbn", "status"), show="headings", height=5)
+        self.tree_cart.heading("isbn", text="ISBN")
+        self.tree_cart.heading("status", text="状态")
+        self.tree_cart.column("isbn", width=150)
+        self.tree_cart.column("status", width=300)
+        self.tree_cart.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+    # ------------------------------------------
+    # 连续扫码
+    # ------------------------------------------
+    # 借还页和添加图书表单共用一个扫码会话，摄像头只打开一次；结果由 root.after 轮询送到当前表单
+    SCAN_CONTROLS = {
+        # 表单: (按钮, 状态标签, 预览标签, 未扫码时的按钮文字, 扫码时的按钮文字)
+        "op": ("btn_continuous", "lbl_scan_status", "lbl_preview", "开启连续扫码", "停止连续扫码"),
+        "add": ("btn_add_scan", "lbl_add_scan_status", "lbl_add_preview", "扫码填入", "停止扫码"),
+    }
+
+    def toggle_continuous_scan(self):
+        self.toggle_scan("op")
+
+    def toggle_add_scan(self):
+        self.toggle_scan("add")
+
+    def toggle_scan(self, target):
+        if self.scan_session and self.scan_target == target:
+            self.stop_continuous_scan()
+            return
+        self.scan_target = target
+        if self.scan_session:
+            # 摄像头已经打开，之后的结果改送到这个表单
+            self.update_scan_controls("正在扫码...")
+        else:
+            self.start_continuous_scan()
+
+    def update_scan_controls(self, status=""):
+        # 只有当前表单显示停止按钮、状态和预览画面
+        for target, (button, label, preview, start_text, stop_text) in self.SCAN_CONTROLS.items():
+            if not self.widget_alive(button):
+                continue
+            active = self.scan_session is not None and self.scan_target == target
+            getattr(self, button).config(text=stop_text if active else start_text)
+            getattr(self, label).config(text=status if active else "")
+            if not active:
+                getattr(self, preview).config(image="")
+
+    def start_continuous_scan(self):
+        scanner = self.get_scanner()
+        if not scanner:
+            return
+        session = scanner.session(cooldown=SCAN_COOLDOWN)
+        self.scan_session = session
+        self.update_scan_controls("正在打开摄像头...")
+
+        errors = []
+
+        # 打开摄像头约需 1 秒，放到后台线程，避免卡住界面
+        def open_camera():
+            try:
+                session.open()
+            except RuntimeError as e:
+                errors.append(str(e))
+
+        threading.Thread(target=open_camera, daemon=True).start()
+        self.root.after(SCAN_POLL_MS, self.poll_continuous_scan, session, errors, 0)
+
+    def stop_continuous_scan(self):
+        session, self.scan_session = self.scan_session, None
+        if session:
+            session.close()
+            self.update_scan_controls()
+            self.preview_image = None
+
+    def poll_continuous_scan(self, session, errors, frame_id):
+        if session is not self.scan_session:
+            return
+        if errors:
+            self.stop_continuous_scan()
+            messagebox.showerror("扫码失败", errors[0])
+            return
+
+        if session.running:
+            isbn = session.poll()
+            if isbn:
+                self.on_scanned_isbn(isbn)
+
+            frame_id, frame = session.latest_frame(frame_id)
+            preview = self.SCAN_CONTROLS[self.scan_target][2]
+            if frame is not None and self.widget_alive(preview):
+                from scanner import frame_to_ppm
+                data = frame_to_ppm(frame)
+                if data:
+                    # 保留引用，防止图片被回收
+                    self.preview_image = tk.PhotoImage(data=data, format="PPM")
+                    getattr(self, preview).config(image=self.preview_image)
+
+        self.root.after(SCAN_POLL_MS, self.poll_continuous_scan, session, errors, frame_id)
+
+    def on_scanned_isbn(self, isbn):
+        if self.scan_target == "add":
+            self.on_add_form_isbn(isbn)
+        else:
+            self.on_continuous_isbn(isbn)
+
+    def on_continuous_isbn(self, isbn):
+        self.entry_isbn_op.delete(0, tk.END)
+        self.entry_isbn_op.insert(0, isbn)
+        self.lbl_scan_status.config(text=f"已识别: {isbn}")
+        self.cart_add(isbn)
+
+    def on_add_form_isbn(self, isbn):
+        if not self.widget_alive("entry_add_isbn"):
+            return
+        # 填入 ISBN 后光标移到书名，摄像头保持打开，可以接着扫下一本
+        self.entry_add_isbn.delete(0, tk.END)
+        self.entry_add_isbn.insert(0, isbn)
+        self.entry_add_title.focus_set()
+        self.lbl_add_scan_status.config(text=f"已识别: {isbn}")
+
+    # ------------------------------------------
+    # 借阅清单
+    # ------------------------------------------
+    def cart_add(self, isbn):
+        # 清单中以 ISBN 作为行 id，同一本书只加入一次
+        if self.tree_cart.exists(isbn):
+            self.tree_cart.set(isbn, "status", "已在清单中")
+            return
+        self.tree_cart.insert("", tk.END, iid=isbn, values=(isbn, "待处理"))
+
+    def cart_add_entry(self):
+        isbn = self.entry_isbn_op.get().strip()
+        if not isbn:
+            messagebox.showwarning("提示", "请输入或扫描 ISBN")
+            return
+        self.cart_add(isbn)
+        self.entry_isbn_op.delete(0, tk.END)
+
+    def cart_remove_selected(self):
+        self.tree_cart.delete(*self.tree_cart.selection())
+
+    def cart_clear(self):
+        self.tree_cart.delete(*self.tree_cart.get_children())
+
+    def action_borrow_cart(self):
+        isbns = list(self.tree_cart.get_children())
+        if not isbns:
+            messagebox.showwarning("提示", "借阅清单为空")
+            return
+        self.run_manager(lambda m: m.borrow_many(isbns), on_success=self.on_cart_done)
+
+    def action_return_cart(self):
+        isbns = list(self.tree_cart.get_children())
+        if not isbns:
+            messagebox.showwarning("提示", "借阅清单为空")
+            return
+        self.run_manager(lambda m: m.return_many(isbns), on_success=self.on_cart_done)
+
+    def on_cart_done(self, result):
+        all_ok, results = result
+        succeeded = 0
+        for isbn, success, msg in results:
+            if not self.tree_cart.exists(isbn):
+                continue
+            if success:
+                # 处理成功的书移出清单，失败的保留并显示原因
+                self.tree_cart.delete(isbn)
+                succeeded += 1
+            else:
+                self.tree_cart.set(isbn, "status", msg)
+
+        if all_ok:
+            messagebox.showinfo("成功", f"已处理 {succeeded} 本图书")
         else:
-            # 如果是取消，通常不需要弹窗，或者在scanner里打印了
-            pass
+            messagebox.showwarning("部分失败", f"成功 {succeeded} 本，失败 {len(results) - succeeded} 本，失败原因见清单")
+
+    def get_scanner(self):
+        # 第一次使用时才加载 OpenCV / pyzbar；未安装时提示，其余功能不受影响
+        if self.scanner is None:
+            import scanner
+            if not scanner.available():
+                messagebox.showerror("扫码不可用", f"请安装 opencv-python 和 pyzbar 后重试\n({scanner.IMPORT_ERROR})")
+                return None
+            self.scanner = scanner.BarcodeScanner()
+        return self.scanner
 
     def action_borrow(self):
         isbn = self.entry_isbn_op.get().strip()
@@ -306,10 +711,28 @@ class LibraryApp:
             messagebox.showwarning("提示", "请输入或扫描 ISBN")
             return
         
-        success, msg = self.manager.borrow_book(isbn)
+        def done(result):
+            self.on_circulation_done(result)
+            if result[0]:
+                self.refresh_recommendations(isbn)
+
+        self.lbl_recommend.config(text="")
+        self.run_manager(lambda m: m.borrow_book(isbn), on_success=done)
+
+    def refresh_recommendations(self, isbn):
+        self.run_manager(lambda m: m.also_borrowed(isbn, 5), on_success=self.show_recommendations, key="recommend")
+
+    def show_recommendations(self, rows):
+        if not rows or not self.widget_alive("lbl_recommend"):
+            return
+        titles = "、".join(f"《{title}》" + ("" if available else "(已借完)") for isbn, title, author, available, score in rows)
+        self.lbl_recommend.config(text=f"借过这本书的读者还借了: {titles}")
+
+    def on_circulation_done(self, result):
+        success, msg = result
         if success:
+            # 库存显示由变更事件更新
             messagebox.showinfo("成功", msg)
-            self.refresh_book_list() # 刷新库存显示
         else:
             messagebox.showerror("失败", msg)
 
@@ -319,12 +742,7 @@ class LibraryApp:
             messagebox.showwarning("提示", "请输入或扫描 ISBN")
             return
         
-        success, msg = self.manager.return_book(isbn)
-        if success:
-            messagebox.showinfo("成功", msg)
-            self.refresh_book_list()
-        else:
-            messagebox.showerror("失败", msg)
+        self.run_manager(lambda m: m.return_book(isbn), on_success=self.on_circulation_done)
 
     # ------------------------------------------
     # Tab 3: 管理员面板
@@ -342,8 +760,13 @@ class LibraryApp:
         self.entry_add_isbn = ttk.Entry(frame_add)
         self.entry_add_isbn.pack(fill=tk.X, pady=2)
         
-        # 扫码填入 ISBN (移除Emoji)
-        ttk.Button(frame_add, text="扫码填入", command=self.scan_isbn_for_add).pack(anchor=tk.W, pady=2)
+        # 扫码填入 ISBN：与借还页的连续扫码共用摄像头，识别结果填入此表单
+        self.btn_add_scan = ttk.Button(frame_add, text="扫码填入", command=self.toggle_add_scan)
+        self.btn_add_scan.pack(anchor=tk.W, pady=2)
+        self.lbl_add_scan_status = ttk.Label(frame_add, text="", foreground="gray")
+        self.lbl_add_scan_status.pack(anchor=tk.W)
+        self.lbl_add_preview = ttk.Label(frame_add)
+        self.lbl_add_preview.pack(anchor=tk.W)
 
         ttk.Label(frame_add, text="书名:").pack(anchor=tk.W, pady=(10,0))
         self.entry_add_title = ttk.Entry(frame_add)
@@ -384,12 +807,6 @@ class LibraryApp:
         # 初始加载统计
         self.refresh_stats()
 
-    def scan_isbn_for_add(self):
-        isbn = self.scanner.scan_isbn()
-        if isbn:
-            self.entry_add_isbn.delete(0, tk.END)
-            self.entry_add_isbn.insert(0, isbn)
-
     def action_add_book(self):
         isbn = self.entry_add_isbn.get()
         title = self.entry_add_title.get()
@@ -407,10 +824,15 @@ class LibraryApp:
             messagebox.showerror("错误", "数量必须是数字")
             return
 
-        success, msg = self.manager.add_book(isbn, title, author, category, copies)
+        self.run_manager(
+            lambda m: m.add_book(isbn, title, author, category, copies),
+            on_success=self.on_add_book_done,
+        )
+
+    def on_add_book_done(self, result):
+        success, msg = result
         if success:
             messagebox.showinfo("成功", msg)
-            self.refresh_book_list()
             # 清空输入
             self.entry_add_isbn.delete(0, tk.END)
             self.entry_add_title.delete(0, tk.END)
@@ -421,12 +843,17 @@ class LibraryApp:
             messagebox.showerror("失败", msg)
 
     def refresh_stats(self):
-        if not self.manager:
+        if not self.current_user:
+            return
+        self.run_manager(lambda m: m.get_stats(), on_success=self.show_stats, key="stats")
+
+    def show_stats(self, stats):
+        self.stats_refresh_pending = False
+        if not self.widget_alive("tree_hot"):
             return
-        stats = self.manager.get_stats()
-        
         # 更新逾期数
-        self.lbl_stats_overdue.config(text=f"当前逾期记录: {stats['overdue_count']}")
+        self.overdue_count = stats['overdue_count']
+        self.lbl_stats_overdue.config(text=f"当前逾期记录: {self.overdue_count}")
         
         # 更新热门图书
         for i in self.tree_hot.get_children():
@@ -435,6 +862,130 @@ class LibraryApp:
         for title, count in stats['hot_books']:
             self.tree_hot.insert("", tk.END, values=(title, count))
 
+    # ------------------------------------------
+    # Tab 4: 借阅分析
+    # ------------------------------------------
+    def build_analytics_tab(self, parent):
+        top = ttk.Frame(parent, padding="10")
+        top.pack(fill=tk.X)
+        self.lbl_durations = ttk.Label(top, text="借阅时长: -")
+        self.lbl_durations.pack(side=tk.LEFT)
+        ttk.Button(top, text="刷新分析", command=self.refresh_analytics).pack(side=tk.RIGHT)
+
+        body = ttk.Frame(parent, padding="10")
+        body.pack(fill=tk.BOTH, expand=True)
+        body.columnconfigure(0, weight=3)
+        body.columnconfigure(1, weight=2)
+        body.rowconfigure(1, weight=1)
+        body.rowconfigure(3, weight=1)
+
+        ttk.Label(body, text="分类利用率(近一年借阅量):").grid(row=0, column=0, sticky=tk.W)
+        columns = ("category", "copies", "on_loan", "rate", "borrows")
+        self.tree_categories = ttk.Treeview(body, columns=columns, show="headings", height=6)
+        for column, text, width in zip(columns, ("分类", "总册数", "借出", "利用率", "借阅量"), (120, 70, 70, 70, 80)):
+            self.tree_categories.heading(column, text=text)
+            self.tree_categories.column(column, width=width)
+        self.tree_categories.grid(row=1, column=0, sticky=tk.NSEW, padx=(0, 10))
+
+        ttk.Label(body, text="逾期率趋势(按应还月份):").grid(row=0, column=1, sticky=tk.W)
+        columns = ("month", "due", "late", "rate")
+        self.tree_overdue_trend = ttk.Treeview(body, columns=columns, show="headings", height=6)
+        for column, text, width in zip(columns, ("月份", "到期", "逾期", "逾期率"), (80, 70, 70, 70)):
+            self.tree_overdue_trend.heading(column, text=text)
+            self.tree_overdue_trend.column(column, width=width)
+        self.tree_overdue_trend.grid(row=1, column=1, sticky=tk.NSEW)
+
+        ttk.Label(body, text="按星期的借阅量:").grid(row=2, column=0, sticky=tk.W, pady=(10, 0))
+        self.canvas_weekday = tk.Canvas(body, height=120, bg="white", highlightthickness=0)
+        self.canvas_weekday.grid(row=3, column=0, sticky=tk.NSEW, padx=(0, 10))
+        ttk.Label(body, text="按小时的借阅量:").grid(row=2, column=1, sticky=tk.W, pady=(10, 0))
+        self.canvas_hour = tk.Canvas(body, height=120, bg="white", highlightthickness=0)
+        self.canvas_hour.grid(row=3, column=1, sticky=tk.NSEW)
+
+    def on_tab_changed(self, event):
+        if not self.analytics_loaded and self.notebook.select() == str(self.tab_analytics):
+            self.analytics_loaded = True
+            self.refresh_analytics()
+
+    def refresh_analytics(self):
+        self.lbl_durations.config(text="借阅时长: 计算中...")
+        self.run_manager(lambda m: m.get_analytics(), on_success=self.show_analytics, key="analytics")
+
+    def show_analytics(self, result):
+        if not result or not self.widget_alive("tree_categories"):
+            return
+        durations = result["durations"]
+        if durations["count"]:
+            self.lbl_durations.config(text=(
+                f"近 {result['window_days']} 天借阅时长(天): 中位数 {durations['p50']}  P90 {durations['p90']}  "
+                f"P99 {durations['p99']}  平均 {durations['mean']}  (共 {result['records']} 条记录，"
+                f"用时 {result['elapsed_ms']:.0f} ms)"
+            ))
+        else:
+            self.lbl_durations.config(text="借阅时长: 暂无已归还的记录")
+
+        self.tree_categories.delete(*self.tree_categories.get_children())
+        for category, copies, on_loan, rate, borrows in result["categories"]:
+            self.tree_categories.insert("", tk.END, values=(category, copies, on_loan, f"{rate:.1%}", borrows))
+        self.tree_overdue_trend.delete(*self.tree_overdue_trend.get_children())
+        for month, due, late, rate in reversed(result["overdue_trend"]):
+            self.tree_overdue_trend.insert("", tk.END, values=(month, due, late, f"{rate:.1%}"))
+
+        self.draw_bars(self.canvas_weekday, result["weekday"], ["一", "二", "三", "四", "五", "六", "日"])
+        self.draw_bars(self.canvas_hour, result["hour"], [str(h) if h % 3 == 0 else "" for h in range(24)])
+
+    def draw_bars(self, canvas, values, labels):
+        # 简单柱状图，高度按最大值缩放
+        canvas.delete("all")
+        canvas.update_idletasks()
+        width, height = max(canvas.winfo_width(), 200), max(canvas.winfo_height(), 120)
+        peak = max(values) or 1
+        step = width / len(values)
+        for i, (value, label) in enumerate(zip(values, labels)):
+            bar = (height - 20) * value / peak
+            x0, x1 = i * step + 2, (i + 1) * step - 2
+            canvas.create_rectangle(x0, height - 15 - bar, x1, height - 15, fill=self.colors["primary"], outline="")
+            canvas.create_text((x0 + x1) / 2, height - 7, text=label, font=("Microsoft YaHei UI", 8))
+
+    # ------------------------------------------
+    # 变更事件
+    # ------------------------------------------
+    def widget_alive(self, name):
+        # 切换界面(登录/登出)后旧的控件已被销毁
+        widget = getattr(self, name, None)
+        return widget is not None and widget.winfo_exists()
+
+    def on_library_event(self, event):
+        if isinstance(event, (events.BookChanged, events.BookAdded, events.BookRemoved, events.CatalogChanged)):
+            if self.widget_alive("tree_books"):
+                self.patch_book_list(event)
+        elif isinstance(event, events.LoanOpened):
+            # 热门图书排名可能变化，稍后合并刷新
+            self.schedule_stats_refresh()
+        elif isinstance(event, events.LoanClosed):
+            if self.widget_alive("lbl_stats_overdue") and event.due_date and event.due_date < datetime.datetime.now():
+                self.overdue_count = max(0, self.overdue_count - 1)
+                self.lbl_stats_overdue.config(text=f"当前逾期记录: {self.overdue_count}")
+
+    def patch_book_list(self, event):
+        if isinstance(event, events.CatalogChanged):
+            self.refresh_book_list()
+        elif isinstance(event, (events.BookRemoved, events.BookAdded)):
+            self.invalidate_books_from(event.book_id)
+        elif isinstance(event, events.BookChanged):
+            # 只更新已读取的页，其余的页读取时就是最新值
+            for rows in self.book_pages.values():
+                for i, row in enumerate(rows):
+                    if row[0] == event.book_id:
+                        rows[i] = tuple(event)
+            self.render_book_window()
+
+    def schedule_stats_refresh(self):
+        if self.stats_refresh_pending or not self.widget_alive("tree_hot"):
+            return
+        self.stats_refresh_pending = True
+        self.root.after(STATS_REFRESH_DELAY_MS, self.refresh_stats)
+
 
 if __name__ == "__main__":
     root = tk.Tk()
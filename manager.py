@@ -2,16 +2,75 @@
 # 负责图书的添加、删除、查询等操作
 
 import datetime
+import random
+import time
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import insert, update, bindparam
+from sqlalchemy.exc import OperationalError
 from models import Book, BorrowRecord, User
 from logger_config import logger
+import search_index
+import loan_stats
+import loan_archive
+import recommend
+import cache
+import catalog
+import events
+from instrumentation import instrument
 
+# 多终端共用一个数据库时，写操作遇到锁冲突的重试次数和初始退避时间(秒)
+LOCK_RETRIES = 5
+LOCK_BACKOFF = 0.05
+
+
+def _is_lock_error(error):
+    message = str(error).lower()
+    return "locked" in message or "busy" in message
+
+
+# 每个公开方法的耗时、查询数、加载/写入行数记录到 instrumentation
+@instrument
 class LibraryManager:
     def __init__(self, db: Session, current_user: User):
         self.db = db
         self.user = current_user
 
+    # 执行 action()（其中包含提交），遇到数据库锁冲突时回滚并按指数退避重试
+    def _retry_on_lock(self, action):
+        for attempt in range(LOCK_RETRIES):
+            try:
+                return action()
+            except OperationalError as e:
+                self.db.rollback()
+                if not _is_lock_error(e) or attempt == LOCK_RETRIES - 1:
+                    raise
+                delay = LOCK_BACKOFF * (2 ** attempt) * (0.5 + random.random())
+                logger.warning(f"Database locked, retrying in {delay:.2f}s ({attempt + 1}/{LOCK_RETRIES})")
+                time.sleep(delay)
+
+    # 提交写操作：图书目录变化时在同一事务中更新缓存版本号，提交后失效本进程中受影响的缓存，再发布变更事件。
+    # 借还(stock_only)只改变库存，不更新版本号，也不需要失效缓存(分页结果的库存每次从数据库读取)，
+    # 避免所有借还事务都更新 catalog_version 同一行而互相排队
+    def _commit(self, published=(), stock_only=False, **changes):
+        version = None if stock_only else cache.bump_version(self.db)
+        self.db.commit()
+        if not stock_only:
+            cache.after_commit(version, **changes)
+            catalog.after_commit(version, published)
+        for event in published:
+            if event is not None:
+                events.publish(event)
+
+    # 读取图书当前的库存生成事件(在提交前调用，读到的是本事务修改后的值)；没有订阅者且未启用内存目录时省去查询
+    def _book_event(self, book_id, event_type=events.BookChanged):
+        if not events.has_subscribers(event_type) and not catalog.enabled:
+            return None
+        row = self.db.query(
+            Book.id, Book.isbn, Book.title, Book.author, Book.category,
+            Book.available_copies, Book.total_copies
+        ).filter(Book.id == book_id).first()
+        return event_type(*row) if row else None
+
     # --- Book Management (Admin) ---
     # 管理员添加图书
     def add_book(self, isbn, title, author, category, total_copies):
@@ -22,9 +81,12 @@ class LibraryManager:
             book = self.db.query(Book).filter(Book.isbn == isbn).first()
             if book:
                 # Update existing book copies
-                book.total_copies += int(total_copies)
-                book.available_copies += int(total_copies)
+                # 使用 SQL 表达式在数据库中累加，避免并发时覆盖其他终端的修改
+                book.total_copies = Book.total_copies + int(total_copies)
+                book.available_copies = Book.available_copies + int(total_copies)
+                self.db.flush()
                 msg = f"图书已存在，库存增加。当前库存: {book.available_copies}/{book.total_copies}"
+                changes = {"published": [self._book_event(book.id)]}
             else:
                 new_book = Book(
                     isbn=isbn,
@@ -35,10 +97,17 @@ class LibraryManager:
                     available_copies=int(total_copies)
                 )
                 self.db.add(new_book)   # 标记为待添加
+                self.db.flush()         # 生成 id，供检索索引使用
+                search_index.index_book(self.db, new_book)
                 msg = "新书添加成功"
+                changes = {
+                    "isbns": [isbn], "catalog_changed": True,
+                    "published": [self._book_event(new_book.id, events.BookAdded)],
+                }
             
-            self.db.commit()    # 提交事务，此时数据库中才会有新的图书记录
-            logger.info(f"Admin {self.user.username} added book: {title} (ISBN: {isbn})")
+            self._commit(**changes)    # 提交事务，此时数据库中才会有新的图书记录
+            logger.info(f"Admin {self.user.username} added book: {title} (ISBN: {isbn})",
+                        extra={"user": self.user.username, "isbn": isbn})
             return True, msg
         except Exception as e:
             self.db.rollback()
@@ -73,69 +142,372 @@ class LibraryManager:
             return False, "未找到该图书"
             
         try:
+            search_index.unindex_book(self.db, book.id)
+            loan_stats.forget_book(self.db, book.id)
+            recommend.forget_book(self.db, book.id)
             self.db.delete(book)
-            self.db.commit()
-            logger.info(f"Admin {self.user.username} removed book: {book.title} (ISBN: {book.isbn})")
+            self._commit(
+                isbns=[book.isbn], catalog_changed=True, published=[events.BookRemoved(book.id, book.isbn)]
+            )
+            logger.info(f"Admin {self.user.username} removed book: {book.title} (ISBN: {book.isbn})",
+                        extra={"user": self.user.username, "isbn": book.isbn})
             return True, "图书删除成功"
         except Exception as e:
             self.db.rollback()
             logger.error(f"Remove book failed: {e}")
             return False, f"删除失败(可能存在关联借阅记录): {e}"
 
+    # 管理员批量导入图书
+    # rows 为可迭代的字典序列(isbn, title, author, category, copies)，按 chunk_size 分批处理，
+    # 每批只做一次 ISBN 查询、一次批量 UPDATE/INSERT 和一次提交。
+    # 已存在的 ISBN 与 add_book 一样只增加库存。单行错误只记录不中断整个导入。
+    def bulk_add_books(self, rows, chunk_size=1000, progress=None):
+        if self.user.role != 'admin':
+            return False, "权限不足"
+
+        result = {"rows": 0, "inserted": 0, "updated": 0, "errors": []}
+        start = time.perf_counter()
+        chunk = []
+        for index, row in enumerate(rows, 1):
+            result["rows"] += 1
+            try:
+                chunk.append((index, self._parse_book_row(row)))
+            except (KeyError, TypeError, ValueError) as e:
+                result["errors"].append((index, f"数据格式错误: {e}"))
+
+            if len(chunk) >= chunk_size:
+                self._import_chunk(chunk, result)
+                chunk = []
+                if progress:
+                    progress(result)
+        if chunk:
+            self._import_chunk(chunk, result)
+            if progress:
+                progress(result)
+
+        result["errors"].sort()
+        elapsed = time.perf_counter() - start
+        result["elapsed"] = elapsed
+        result["rows_per_sec"] = result["rows"] / elapsed if elapsed > 0 else 0.0
+        logger.info(
+            f"Admin {self.user.username} bulk imported {result['rows']} rows: "
+            f"{result['inserted']} inserted, {result['updated']} updated, "
+            f"{len(result['errors'])} errors in {elapsed:.2f}s"
+        )
+        return True, result
+
+    @staticmethod
+    def _parse_book_row(row):
+        if not isinstance(row, dict):
+            raise ValueError("无法解析的记录")
+        isbn = str(row["isbn"]).strip()
+        title = str(row.get("title") or "").strip()
+        author = str(row.get("author") or "").strip()
+        category = str(row.get("category") or "").strip() or None
+        if not isbn:
+            raise ValueError("ISBN 为空")
+        # 只有缺少数量(None 或空字符串)时才默认为 1；JSON 的 0 与 CSV 的 "0" 一样按无效数量拒绝
+        copies = row.get("copies")
+        if copies is None or copies == "":
+            copies = row.get("total_copies")
+        if copies is None or copies == "":
+            copies = 1
+        if isinstance(copies, str):
+            copies = copies.strip()
+        if isinstance(copies, bool) or (isinstance(copies, float) and not copies.is_integer()):
+            raise ValueError(f"数量必须是整数: {copies!r}")
+        copies = int(copies)
+        if copies <= 0:
+            raise ValueError("数量必须大于 0")
+        return {"isbn": isbn, "title": title, "author": author, "category": category, "copies": copies}
+
+    def _import_chunk(self, chunk, result):
+        books = Book.__table__
+
+        # 同一批内重复的 ISBN 合并为一次写入
+        merged = {}
+        for index, item in chunk:
+            if item["isbn"] in merged:
+                merged[item["isbn"]][1]["copies"] += item["copies"]
+            else:
+                merged[item["isbn"]] = (index, dict(item))
+
+        try:
+            existing = {
+                isbn for (isbn,) in self.db.query(Book.isbn).filter(Book.isbn.in_(list(merged)))
+            }
+
+            updates = []
+            inserts = []
+            errors = []
+            for isbn, (index, item) in merged.items():
+                if isbn in existing:
+                    updates.append({"b_isbn": isbn, "n": item["copies"]})
+                elif not item["title"] or not item["author"]:
+                    errors.append((index, f"新书 {isbn} 缺少书名或作者"))
+                else:
+                    inserts.append({
+                        "isbn": isbn,
+                        "title": item["title"],
+                        "author": item["author"],
+                        "category": item["category"],
+                        "total_copies": item["copies"],
+                        "available_copies": item["copies"],
+                    })
+
+            if updates:
+                self.db.execute(
+                    update(books).where(books.c.isbn == bindparam("b_isbn")).values(
+                        total_copies=books.c.total_copies + bindparam("n"),
+                        available_copies=books.c.available_copies + bindparam("n"),
+                    ),
+                    updates,
+                )
+            if inserts:
+                self.db.execute(insert(books), inserts)
+                new_rows = self.db.query(
+                    Book.id, Book.title, Book.author, Book.category
+                ).filter(Book.isbn.in_([row["isbn"] for row in inserts])).all()
+                search_index.index_rows(self.db, new_rows)
+
+            self._commit(
+                isbns=list(merged), catalog_changed=True,
+                published=[events.CatalogChanged("import", len(inserts) + len(updates))]
+            )
+            result["updated"] += len(updates)
+            result["inserted"] += len(inserts)
+            result["errors"].extend(errors)
+        except Exception as e:
+            self.db.rollback()
+            if len(chunk) == 1:
+                index = chunk[0][0]
+                logger.error(f"Bulk import row {index} failed: {e}")
+                result["errors"].append((index, f"操作失败: {e}"))
+                return
+            # 整批失败时逐行重试，定位出错的行
+            logger.warning(f"Bulk import chunk failed, retrying row by row: {e}")
+            for item in chunk:
+                self._import_chunk([item], result)
+
     # --- Borrowing Logic ---
     # 用户借阅图书
     def borrow_book(self, isbn):
-        book = self.db.query(Book).filter(Book.isbn == isbn).first()
+        book = cache.lookup_book(self.db, isbn)
         if not book:
             return False, "未找到该图书"
-        
-        if book.available_copies <= 0:
-            return False, "暂无库存"
             
+        book_id, title = book
         try:
-            book.available_copies -= 1
-            due_date = datetime.datetime.now() + datetime.timedelta(days=3)
-            
-            record = BorrowRecord(
-                user_id=self.user.id,
-                book_id=book.id,
-                due_date=due_date
-            )
-            self.db.add(record)
-            self.db.commit()
-            logger.info(f"User {self.user.username} borrowed '{book.title}'")
-            return True, f"借阅成功，请于 {due_date.strftime('%Y-%m-%d')} 前归还"
+            return self._retry_on_lock(lambda: self._borrow(book_id, title, isbn))
         except Exception as e:
             self.db.rollback()
             logger.error(f"Borrow failed: {e}")
             return False, f"借阅失败: {e}"
 
+    def _borrow(self, book_id, title, isbn):
+        # 条件更新：库存检查和扣减在同一条语句中完成，多个终端同时借最后一本时不会超借
+        updated = self.db.query(Book).filter(
+            Book.id == book_id, Book.available_copies > 0
+        ).update({Book.available_copies: Book.available_copies - 1}, synchronize_session=False)
+        if not updated:
+            self.db.rollback()
+            return False, "暂无库存"
+
+        # 共同借阅计数需要在新记录写入前读取读者最近的借阅
+        recommend.record_borrow(self.db, self.user.id, book_id)
+        due_date = datetime.datetime.now() + datetime.timedelta(days=3)
+        record = BorrowRecord(
+            user_id=self.user.id,
+            book_id=book_id,
+            due_date=due_date
+        )
+        self.db.add(record)
+        loan_stats.record_borrow(self.db, book_id, due_date)
+        self._commit(stock_only=True, published=[
+            events.LoanOpened(self.user.id, book_id, isbn, due_date), self._book_event(book_id)
+        ])
+        logger.info(f"User {self.user.username} borrowed '{title}'",
+                    extra={"user": self.user.username, "isbn": isbn})
+        return True, f"借阅成功，请于 {due_date.strftime('%Y-%m-%d')} 前归还"
+
     # 用户归还图书
     def return_book(self, isbn):
-        # 查找该图书的借阅记录book_id
-        # 借阅表只存储了book_id，所以要通过isbn关联查询book_id
-        record = self.db.query(BorrowRecord).join(Book).filter(
-            BorrowRecord.user_id == self.user.id,       # 归还的用户是当前登录用户
-            Book.isbn == isbn,      # 借阅书的ISBN必须与归还的ISBN一致
-            BorrowRecord.return_date == None    # 归还日期必须为空，表示未还
-        ).first()
+        # 借阅表只存储了book_id，所以先通过isbn(缓存)查到book_id，再查找该图书的借阅记录
+        book = cache.lookup_book(self.db, isbn)
+        record = None
+        if book:
+            record = self.db.query(
+                BorrowRecord.id, BorrowRecord.book_id, BorrowRecord.due_date
+            ).filter(
+                BorrowRecord.user_id == self.user.id,       # 归还的用户是当前登录用户
+                BorrowRecord.book_id == book[0],    # 借阅书的ISBN必须与归还的ISBN一致
+                BorrowRecord.return_date == None    # 归还日期必须为空，表示未还
+            ).first()
         
         if not record:
             return False, "未找到该书的借阅记录"
             
         try:
-            record.return_date = datetime.datetime.now()
-            record.book.available_copies += 1
-            self.db.commit()
-            logger.info(f"User {self.user.username} returned '{record.book.title}' (ISBN: {record.book.isbn})")
-            return True, "归还成功"
+            return self._retry_on_lock(lambda: self._return(record, isbn, book[1]))
         except Exception as e:
             self.db.rollback()
             logger.error(f"Return failed: {e}")
             return False, f"归还失败: {e}"
 
-    # 用户查询图书(根据书名或作者作为关键词查询)
+    def _return(self, record, isbn, title):
+        # 只更新仍未归还的记录，防止同一条借阅在两个终端被重复归还
+        updated = self.db.query(BorrowRecord).filter(
+            BorrowRecord.id == record.id, BorrowRecord.return_date == None
+        ).update({BorrowRecord.return_date: datetime.datetime.now()}, synchronize_session=False)
+        if not updated:
+            self.db.rollback()
+            return False, "未找到该书的借阅记录"
+
+        self.db.query(Book).filter(Book.id == record.book_id).update(
+            {Book.available_copies: Book.available_copies + 1}, synchronize_session=False
+        )
+        loan_stats.record_return(self.db, record.book_id, record.due_date)
+        self._commit(stock_only=True, published=[
+            events.LoanClosed(self.user.id, record.book_id, isbn, record.due_date),
+            self._book_event(record.book_id)
+        ])
+        logger.info(f"User {self.user.username} returned '{title}' (ISBN: {isbn})",
+                    extra={"user": self.user.username, "isbn": isbn})
+        return True, "归还成功"
+
+    # --- Batch Borrowing (购物车) ---
+    # 一次借阅/归还多本书：一次查询解析全部 ISBN，所有变更在同一个事务中提交。
+    # 返回 (是否全部成功, [(isbn, 是否成功, 提示信息), ...])，单本失败(无库存等)不影响其他书。
+    def borrow_many(self, isbns):
+        isbns = [isbn.strip() for isbn in isbns if isbn and isbn.strip()]
+        if not isbns:
+            return False, []
+        books = {
+            row.isbn: row for row in
+            self.db.query(Book.id, Book.isbn, Book.title).filter(Book.isbn.in_(set(isbns)))
+        }
+        try:
+            results = self._retry_on_lock(lambda: self._borrow_many(isbns, books))
+        except Exception as e:
+            self.db.rollback()
+            logger.error(f"Batch borrow failed: {e}")
+            results = [(isbn, False, f"借阅失败: {e}") for isbn in isbns]
+        return all(success for _, success, _ in results), results
+
+    def _borrow_many(self, isbns, books):
+        results = []
+        borrowed = []
+        published = []
+        recent = recommend.recent_books(self.db, self.user.id)
+        due_date = datetime.datetime.now() + datetime.timedelta(days=3)
+        for isbn in isbns:
+            book = books.get(isbn)
+            if not book:
+                results.append((isbn, False, "未找到该图书"))
+                continue
+            updated = self.db.query(Book).filter(
+                Book.id == book.id, Book.available_copies > 0
+            ).update({Book.available_copies: Book.available_copies - 1}, synchronize_session=False)
+            if not updated:
+                results.append((isbn, False, "暂无库存"))
+                continue
+            self.db.add(BorrowRecord(user_id=self.user.id, book_id=book.id, due_date=due_date))
+            loan_stats.record_borrow(self.db, book.id, due_date)
+            borrowed.append(book)
+            published.append(events.LoanOpened(self.user.id, book.id, isbn, due_date))
+            results.append((isbn, True, f"借阅成功，请于 {due_date.strftime('%Y-%m-%d')} 前归还"))
+
+        if not borrowed:
+            self.db.rollback()
+            return results
+        recommend.record_borrows(self.db, self.user.id, [book.id for book in borrowed], recent)
+        book_ids = list(dict.fromkeys(book.id for book in borrowed))
+        published.extend(self._book_event(book_id) for book_id in book_ids)
+        self._commit(stock_only=True, published=published)
+        logger.info(
+            f"User {self.user.username} borrowed {len(borrowed)} books: "
+            + ", ".join(f"'{book.title}'" for book in borrowed),
+            extra={"user": self.user.username, "isbn": ",".join(book.isbn for book in borrowed)}
+        )
+        return results
+
+    def return_many(self, isbns):
+        isbns = [isbn.strip() for isbn in isbns if isbn and isbn.strip()]
+        if not isbns:
+            return False, []
+        books = {
+            row.isbn: row for row in
+            self.db.query(Book.id, Book.isbn, Book.title).filter(Book.isbn.in_(set(isbns)))
+        }
+        try:
+            results = self._retry_on_lock(lambda: self._return_many(isbns, books))
+        except Exception as e:
+            self.db.rollback()
+            logger.error(f"Batch return failed: {e}")
+            results = [(isbn, False, f"归还失败: {e}") for isbn in isbns]
+        return all(success for _, success, _ in results), results
+
+    def _return_many(self, isbns, books):
+        # 当前用户这些书的全部未归还记录，同一本书借了多册时先还最早的
+        open_records = {}
+        if books:
+            records = self.db.query(
+                BorrowRecord.id, BorrowRecord.book_id, BorrowRecord.due_date
+            ).filter(
+                BorrowRecord.user_id == self.user.id,
+                BorrowRecord.book_id.in_([book.id for book in books.values()]),
+                BorrowRecord.return_date == None
+            ).order_by(BorrowRecord.id)
+            for record in records:
+                open_records.setdefault(record.book_id, []).append(record)
+
+        results = []
+        returned = []
+        published = []
+        now = datetime.datetime.now()
+        for isbn in isbns:
+            book = books.get(isbn)
+            pending = open_records.get(book.id) if book else None
+            if not pending:
+                results.append((isbn, False, "未找到该书的借阅记录"))
+                continue
+            record = pending.pop(0)
+            # 只更新仍未归还的记录，防止同一条借阅在两个终端被重复归还
+            updated = self.db.query(BorrowRecord).filter(
+                BorrowRecord.id == record.id, BorrowRecord.return_date == None
+            ).update({BorrowRecord.return_date: now}, synchronize_session=False)
+            if not updated:
+                results.append((isbn, False, "未找到该书的借阅记录"))
+                continue
+            self.db.query(Book).filter(Book.id == book.id).update(
+                {Book.available_copies: Book.available_copies + 1}, synchronize_session=False
+            )
+            loan_stats.record_return(self.db, book.id, record.due_date)
+            returned.append(book)
+            published.append(events.LoanClosed(self.user.id, book.id, isbn, record.due_date))
+            results.append((isbn, True, "归还成功"))
+
+        if not returned:
+            self.db.rollback()
+            return results
+        book_ids = list(dict.fromkeys(book.id for book in returned))
+        published.extend(self._book_event(book_id) for book_id in book_ids)
+        self._commit(stock_only=True, published=published)
+        logger.info(
+            f"User {self.user.username} returned {len(returned)} books: "
+            + ", ".join(f"'{book.title}'" for book in returned),
+            extra={"user": self.user.username, "isbn": ",".join(book.isbn for book in returned)}
+        )
+        return results
+
+    # 用户查询图书(根据书名、作者或分类作为关键词查询，按相关度排序)
     def list_books(self, keyword=None):
+        if keyword:
+            books = search_index.search_books(self.db, keyword)
+            if books is not None:
+                return books
+
+        # 未启用全文索引时回退到 LIKE 查询
         query = self.db.query(Book)
         if keyword:
             query = query.filter(
@@ -144,33 +516,107 @@ class LibraryManager:
             )
         return query.all()
 
+    # 分页查询图书(键集分页，按 id 递增)
+    # 返回轻量元组 (id, isbn, title, author, category, available_copies, total_copies)，
+    # 下一页以本页最后一行的 id 作为 after_id 继续查询。结果经过缓存(库存列每次从数据库读取)；
+    # 启用内存目录(catalog)且快照已加载时直接在内存中查询
+    def list_books_page(self, keyword=None, after_id=0, limit=100):
+        keyword = keyword or None
+        rows = catalog.page(self.db, keyword, after_id, limit)
+        if rows is not None:
+            return rows
+        return cache.search_page(
+            self.db, (keyword, after_id, limit),
+            lambda: self._load_books_page(keyword, after_id, limit)
+        )
+
+    def _load_books_page(self, keyword, after_id, limit):
+        if keyword:
+            rows = search_index.search_page(self.db, keyword, after_id, limit)
+            if rows is not None:
+                return rows
+
+        query = self.db.query(
+            Book.id, Book.isbn, Book.title, Book.author, Book.category,
+            Book.available_copies, Book.total_copies
+        ).filter(Book.id > after_id)
+        if keyword:
+            query = query.filter(
+                (Book.title.contains(keyword)) |
+                (Book.author.contains(keyword))
+            )
+        return [tuple(row) for row in query.order_by(Book.id).limit(limit)]
+
+    # 逐页遍历全部图书，内存中只保留一页数据
+    def iter_books(self, keyword=None, page_size=500):
+        after_id = 0
+        while True:
+            rows = self.list_books_page(keyword, after_id, page_size)
+            if not rows:
+                return
+            for row in rows:
+                yield row
+            if len(rows) < page_size:
+                return
+            after_id = rows[-1][0]
+
     # 管理员查询统计信息(热门图书、逾期图书)
     def get_stats(self):
         if self.user.role != 'admin':
             return None
             
+        # 统计值来自借还时维护的计数表，不再扫描全部借阅记录
         # 1. 最受欢迎的图书(借阅次数最多的前5本)
-        hot_books = self.db.query(
-            Book.title, func.count(BorrowRecord.id).label('count')
-        ).join(BorrowRecord).group_by(Book.id).order_by(func.count(BorrowRecord.id).desc()).limit(5).all()
-        
-        # 2. 逾期图书列表(未归还且超期的图书)
-        overdue = self.db.query(BorrowRecord).filter(
-            BorrowRecord.return_date == None,
-            BorrowRecord.due_date < datetime.datetime.now()
-        ).all()
-        
-        # 3. 逾期图书详情(包括用户、图书、超期时间)
+        hot_books = loan_stats.hot_books(self.db, 5)
+
+        # 2. 逾期记录数(未归还且超期)
+        overdue_count = loan_stats.overdue_count(self.db)
+
+        return {
+            "hot_books": hot_books,
+            "overdue_count": overdue_count
+        }
+
+    # 借阅历史：普通用户查询自己的记录，管理员可指定用户名；include_archive 时包含已归档的记录
+    def borrow_history(self, username=None, include_archive=True, limit=100):
+        user_id = self.user.id
+        if username and username != self.user.username:
+            if self.user.role != 'admin':
+                return None
+            user_id = self.db.query(User.id).filter(User.username == username).scalar()
+            if user_id is None:
+                return []
+        return loan_archive.user_history(self.db, user_id, include_archive, limit)
+
+    # 管理员按时间段统计热门图书(累计排名见 get_stats)
+    def hot_books_between(self, start, end=None, include_archive=True, limit=5):
+        if self.user.role != 'admin':
+            return None
+        return loan_archive.hot_books_between(self.db, start, end, include_archive, limit)
+
+    # 借过这本书的读者还借了哪些书: [(isbn, 书名, 作者, 可借数量, 分数), ...]
+    def also_borrowed(self, isbn, k=5):
+        book = cache.lookup_book(self.db, isbn)
+        if not book:
+            return []
+        return recommend.similar_books(self.db, book[0], k)
+
+    # 管理员借阅分析：借阅时长分位数、分类利用率、按星期/小时的借阅量、逾期率趋势(见 analytics.py)
+    def get_analytics(self, days=365, months=12):
+        if self.user.role != 'admin':
+            return None
+        import analytics    # 依赖 numpy，第一次使用时才加载
+        return analytics.compute(self.db, days, months)
+
+    # 管理员查询逾期图书详情(包括用户、图书、超期时间)
+    def list_overdue(self, limit=100):
+        if self.user.role != 'admin':
+            return None
+
         # 使用 select_from 明确查询主体，解决多表 Join 时的路径歧义问题
-        overdue_details = self.db.query(
+        return self.db.query(
             User.username, Book.title, BorrowRecord.due_date
         ).select_from(BorrowRecord).join(User).join(Book).filter(
             BorrowRecord.return_date == None,
             BorrowRecord.due_date < datetime.datetime.now()
-        ).all()
-        
-        return {
-            "hot_books": hot_books,
-            "overdue_count": len(overdue),
-            "overdue_list": overdue_details
-        }
+        ).order_by(BorrowRecord.due_date).limit(limit).all()
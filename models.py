@@ -3,13 +3,16 @@
 # 每个 Python 类都对应数据库中的一个表，类的属性对应表的列。
 # SQLAlchemy 会自动将这个 Python 类转换成 SQLite 的建表语句。
 
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, Date, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship, declarative_base
 import datetime
 
 # 创建对象的基类
 Base = declarative_base()
 
+# 归档表所在的 schema 名，实际位置由 db.configure_archive 决定(主库或独立的 SQLite 文件)
+ARCHIVE_SCHEMA = "archive"
+
 # 定义映射对象
 
 class User(Base):
@@ -56,5 +59,89 @@ class BorrowRecord(Base):
     user = relationship("User", back_populates="borrow_records")
     book = relationship("Book", back_populates="borrow_records")
 
+    # 热点查询的索引（部分索引只包含未归还的记录，体积小且随历史增长很慢）
+    # 归还：按 user_id + book_id 查找未归还记录；逾期统计：按 due_date 查找未归还记录
+    __table_args__ = (
+        Index('ix_borrow_records_open_user_book', user_id, book_id,
+              sqlite_where=return_date.is_(None), postgresql_where=return_date.is_(None)),
+        Index('ix_borrow_records_open_due', due_date,
+              sqlite_where=return_date.is_(None), postgresql_where=return_date.is_(None)),
+        Index('ix_borrow_records_book_id', book_id),
+        # 借阅历史：按用户查询
+        Index('ix_borrow_records_user_borrow_date', user_id, borrow_date),
+        # AUTOINCREMENT: 已归档(移出本表)的记录的 id 不会被新借阅重用，冷热两张表中的 id 始终唯一
+        {"sqlite_autoincrement": True},
+    )
+
     def __repr__(self):
         return f"<BorrowRecord(user='{self.user.username}', book='{self.book.title}', due='{self.due_date}')>"
+
+# 已归档的借阅记录(冷数据)：已归还且超过一定时间的记录由 loan_archive.py 从 borrow_records 迁入，保留原 id。
+# 不设外键，图书或用户删除后历史记录仍然保留。
+class BorrowRecordArchive(Base):
+    __tablename__ = 'borrow_records_archive'
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    user_id = Column(Integer)
+    book_id = Column(Integer)
+    borrow_date = Column(DateTime)
+    due_date = Column(DateTime)
+    return_date = Column(DateTime)
+    archived_at = Column(DateTime)
+
+    __table_args__ = (
+        Index('ix_borrow_records_archive_user_borrow_date', user_id, borrow_date),
+        Index('ix_borrow_records_archive_borrow_date', borrow_date),
+        {"schema": ARCHIVE_SCHEMA},
+    )
+
+    def __repr__(self):
+        return f"<BorrowRecordArchive(id={self.id}, user_id={self.user_id}, book_id={self.book_id})>"
+
+# 统计计数表：在借还时同步更新，统计查询无需再扫描全部借阅记录
+class BookStats(Base):
+    __tablename__ = 'book_stats'
+
+    book_id = Column(Integer, ForeignKey('books.id'), primary_key=True)
+    borrow_count = Column(Integer, default=0, nullable=False, index=True)  # 累计借阅次数
+    open_loans = Column(Integer, default=0, nullable=False)                # 当前未归还数
+
+    def __repr__(self):
+        return f"<BookStats(book_id={self.book_id}, borrow_count={self.borrow_count}, open_loans={self.open_loans})>"
+
+# 按应还日期分桶的未归还数量，用于快速计算逾期数
+class LoanDueBucket(Base):
+    __tablename__ = 'loan_due_buckets'
+
+    due_day = Column(Date, primary_key=True)
+    open_count = Column(Integer, default=0, nullable=False)
+
+    def __repr__(self):
+        return f"<LoanDueBucket(due_day='{self.due_day}', open_count={self.open_count})>"
+
+# 共同借阅计数："借过 book_id 的读者也借过 other_id" 的次数，对称存储(两个方向各一行)，
+# 由 recommend.py 在借书时增量维护
+class BookPair(Base):
+    __tablename__ = 'book_pairs'
+
+    book_id = Column(Integer, primary_key=True)
+    other_id = Column(Integer, primary_key=True)
+    count = Column(Integer, default=0, nullable=False)
+
+    # 推荐查询：按 book_id 取计数最高的若干行
+    __table_args__ = (
+        Index('ix_book_pairs_book_count', book_id, count),
+    )
+
+    def __repr__(self):
+        return f"<BookPair(book_id={self.book_id}, other_id={self.other_id}, count={self.count})>"
+
+# 图书目录版本号：增删改图书、导入时加一(借还不更新)，多个进程据此判断本地缓存是否过期
+class CatalogVersion(Base):
+    __tablename__ = 'catalog_version'
+
+    name = Column(String(50), primary_key=True)
+    version = Column(Integer, default=0, nullable=False)
+
+    def __repr__(self):
+        return f"<CatalogVersion(name='{self.name}', version={self.version})>"
@@ -0,0 +1,170 @@
+# "借过这本书的读者还借了" 推荐
+# book_pairs 记录两本书被同一读者先后借阅的次数(稀疏的图书 x 图书共现矩阵)。
+# 为了让矩阵规模与借阅量成线性关系，每次借书只与该读者最近借过的 WINDOW 本不同的书配对。
+# 借书时在同一事务中增量更新(与 loan_stats 的计数相同)，推荐查询只需读取一本书的少量行。
+#
+# 推荐分数为余弦相似度: 共同借阅次数 / sqrt(两本书各自的累计借阅次数)，避免总是推荐最热门的书。
+#
+# 根据已有借阅历史(含已归档的记录)重建:  python recommend.py rebuild
+
+import math
+import os
+import sys
+import time
+from collections import Counter
+
+from sqlalchemy import select
+from models import Book, BookPair, BookStats, BorrowRecord, BorrowRecordArchive
+from logger_config import logger
+import loan_archive
+
+# 每次借书与最近多少本不同的书配对
+WINDOW = int(os.environ.get("LIBRARY_COBORROW_WINDOW", "10"))
+# 推荐时按共同借阅次数取前多少本作为候选，再按相似度排序
+CANDIDATES = 50
+# 重建时内存中累计多少个图书对后写入一次数据库
+FLUSH_PAIRS = 1000000
+
+# 内存中一对图书用一个整数表示: 较小的 id << 32 | 较大的 id，写入时再展开为两个方向
+_MASK = (1 << 32) - 1
+
+
+def _pair_key(a, b):
+    return a << 32 | b if a < b else b << 32 | a
+
+
+def _add_pairs(db, pairs):
+    """把 {_pair_key(a, b): 次数} 累加到 book_pairs(两个方向各一行)"""
+    if not pairs:
+        return
+    from db import add_counts
+    counts = {}
+    for key, n in pairs.items():
+        counts[key] = n
+        counts[(key & _MASK) << 32 | key >> 32] = n
+    # 按主键顺序写入，B 树页面顺序访问，大批量时快得多
+    rows = [{"book_id": key >> 32, "other_id": key & _MASK, "count": counts[key]} for key in sorted(counts)]
+    add_counts(db, BookPair.__table__, ("book_id", "other_id"), rows)
+
+
+def recent_books(db, user_id):
+    """读者最近借过的不同图书 id，最近的在前，最多 WINDOW 本；热数据表不够时再查归档表"""
+    recent = []
+    for model in (BorrowRecord, BorrowRecordArchive):
+        # 沿 (user_id, borrow_date) 索引倒序逐行读取，凑够 WINDOW 本即停止
+        rows = db.query(model.book_id).filter(model.user_id == user_id, model.book_id != None).order_by(
+            model.borrow_date.desc(), model.id.desc()
+        ).yield_per(WINDOW * 3)
+        for (book_id,) in rows:
+            if book_id not in recent:
+                recent.append(book_id)
+                if len(recent) == WINDOW:
+                    return recent
+    return recent
+
+
+def _pair_with_recent(pairs, recent, book_id):
+    # 重复借阅同一本书不再计数，只把它移到最近
+    if book_id in recent:
+        recent.remove(book_id)
+    else:
+        for other in recent:
+            pairs[_pair_key(book_id, other)] += 1
+    recent.insert(0, book_id)
+    del recent[WINDOW:]
+
+
+# 在借书的事务中调用，须在新的借阅记录写入之前读取 recent(也可由调用方预先读取后传入)
+def record_borrows(db, user_id, book_ids, recent=None):
+    recent = list(recent_books(db, user_id) if recent is None else recent)
+    pairs = Counter()
+    for book_id in book_ids:
+        _pair_with_recent(pairs, recent, book_id)
+    _add_pairs(db, pairs)
+
+
+def record_borrow(db, user_id, book_id):
+    record_borrows(db, user_id, [book_id])
+
+
+def forget_book(db, book_id):
+    # 对称存储：先按 book_id 找到所有相关的书，再删除反方向的行(都走主键)
+    others = [other for (other,) in db.query(BookPair.other_id).filter(BookPair.book_id == book_id)]
+    for start in range(0, len(others), 500):
+        db.query(BookPair).filter(
+            BookPair.book_id.in_(others[start:start + 500]), BookPair.other_id == book_id
+        ).delete(synchronize_session=False)
+    db.query(BookPair).filter(BookPair.book_id == book_id).delete(synchronize_session=False)
+
+
+def similar_books(db, book_id, k=5):
+    """与 book_id 一起被借阅的图书: [(isbn, 书名, 作者, 可借数量, 分数), ...]，按分数降序"""
+    candidates = db.query(BookPair.other_id, BookPair.count).filter(
+        BookPair.book_id == book_id
+    ).order_by(BookPair.count.desc()).limit(CANDIDATES).all()
+    if not candidates:
+        return []
+
+    ids = [book_id] + [other for other, _ in candidates]
+    borrows = dict(db.query(BookStats.book_id, BookStats.borrow_count).filter(BookStats.book_id.in_(ids)))
+    base = borrows.get(book_id) or 1
+    scores = {
+        other: count / math.sqrt(base * (borrows.get(other) or 1))
+        for other, count in candidates
+    }
+    top = sorted(scores, key=scores.get, reverse=True)[:k]
+    books = {row[0]: row[1:] for row in db.query(
+        Book.id, Book.isbn, Book.title, Book.author, Book.available_copies
+    ).filter(Book.id.in_(top))}
+    return [books[other] + (round(scores[other], 4),) for other in top if other in books]
+
+
+def rebuild(db, progress=None):
+    """按借阅历史(含已归档的记录)重建 book_pairs；progress(已处理的借阅记录数) 定期调用"""
+    start = time.perf_counter()
+    db.query(BookPair).delete(synchronize_session=False)
+    # 重建期间先去掉二级索引，写完后再一次性建立，避免每次累加都更新索引
+    for index in BookPair.__table__.indexes:
+        index.drop(bind=db.connection(), checkfirst=True)
+
+    loans = loan_archive.loans(include_archive=True, where=lambda t: t.c.book_id != None)
+    stmt = select(loans.c.user_id, loans.c.book_id).order_by(loans.c.user_id, loans.c.borrow_date, loans.c.id)
+    result = db.connection().execute(stmt.execution_options(stream_results=True))
+
+    pairs = Counter()
+    current_user, recent = None, []
+    processed = 0
+    for rows in result.partitions(100000):
+        for user_id, book_id in rows:
+            if user_id != current_user:
+                current_user, recent = user_id, []
+            _pair_with_recent(pairs, recent, book_id)
+        processed += len(rows)
+        # 计数分批累加到表中，内存占用有上限
+        if len(pairs) >= FLUSH_PAIRS:
+            _add_pairs(db, pairs)
+            pairs.clear()
+        if progress:
+            progress(processed)
+    _add_pairs(db, pairs)
+    for index in BookPair.__table__.indexes:
+        index.create(bind=db.connection())
+    db.commit()
+    total = db.query(BookPair).count()
+    logger.info(f"Co-borrow pairs rebuilt from {processed} loans: {total} rows "
+                f"in {time.perf_counter() - start:.1f}s")
+    return total
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["rebuild"]:
+        print("用法: python recommend.py rebuild")
+        sys.exit(1)
+    from db import get_db
+
+    def report(processed):
+        print(f"\rloans: {processed}", end="", file=sys.stderr, flush=True)
+
+    total = rebuild(next(get_db()), report)
+    print(file=sys.stderr)
+    print(f"共同借阅矩阵已重建: {total} 行")
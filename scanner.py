@@ -4,96 +4,522 @@ Date: 2026-01-07 18:35:35
 Last Modified by: 
 Last Modified time: 
 '''
-import cv2
-from pyzbar.pyzbar import decode, ZBarSymbol
 import time
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# 未安装 OpenCV / pyzbar(或缺少 zbar 动态库)时模块仍可导入，扫码功能不可用
+try:
+    import cv2
+    from pyzbar.pyzbar import decode, ZBarSymbol
+    IMPORT_ERROR = None
+except ImportError as e:
+    cv2 = None
+    IMPORT_ERROR = e
+
+# 多角度检测（支持竖向条码）
+# 很多书本是竖着放的，默认扫描无法识别。同时尝试 0度 / 90度 / 270度
+ORIENTATIONS = (None, cv2.ROTATE_90_CLOCKWISE, cv2.ROTATE_90_COUNTERCLOCKWISE) if cv2 else (None,)
+
+
+def available():
+    """OpenCV 和 pyzbar 是否都可以使用"""
+    return IMPORT_ERROR is None
+
+
+def decode_orientation(gray, rotation):
+    # 保持 symbols=[ZBarSymbol.EAN13] 以防止崩溃并专注识别 ISBN
+    image = gray if rotation is None else cv2.rotate(gray, rotation)
+    return decode(image, symbols=[ZBarSymbol.EAN13])
+
+
+def is_valid_isbn13(code):
+    # ISBN-13: 978/979 开头的 13 位数字，校验位按 1/3 交替加权
+    if len(code) != 13 or not code.isdigit() or code[:3] not in ("978", "979"):
+        return False
+    total = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(code[:12]))
+    return (10 - total % 10) % 10 == int(code[12])
+
+
+def frame_sharpness(gray):
+    # 拉普拉斯方差：越大越清晰，模糊/运动中的画面值很小
+    return cv2.Laplacian(gray, cv2.CV_64F).var()
+
+
+def _barcode_region(energy, vertical_bars):
+    blurred = cv2.blur(energy, (9, 9))
+    _, thresh = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    # 沿条码方向闭运算，把一根根条纹连成一个整体，再腐蚀膨胀去掉零散的小块
+    kernel_size = (21, 7) if vertical_bars else (7, 21)
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, kernel_size)
+    closed = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel)
+    closed = cv2.erode(closed, None, iterations=4)
+    closed = cv2.dilate(closed, None, iterations=4)
+
+    # 兼容 OpenCV 3/4 的返回值
+    contours = cv2.findContours(closed, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[-2]
+    if not contours:
+        return None
+    contour = max(contours, key=cv2.contourArea)
+    return cv2.contourArea(contour), cv2.boundingRect(contour)
+
+
+def locate_barcode(gray, work_width=400, min_area=0.01, max_area=0.8):
+    """
+    用梯度 + 形态学在缩小的图上粗定位条码区域。
+    返回 ((x, y, w, h), 是否需要旋转)，坐标为原图坐标；找不到时返回 None。
+    """
+    h, w = gray.shape[:2]
+    scale = min(1.0, work_width / float(w))
+    small = cv2.resize(gray, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA) if scale < 1 else gray
+
+    grad_x = cv2.convertScaleAbs(cv2.Sobel(small, cv2.CV_16S, 1, 0, ksize=3))
+    grad_y = cv2.convertScaleAbs(cv2.Sobel(small, cv2.CV_16S, 0, 1, ksize=3))
+
+    # 横放的条码是竖条纹，x 方向梯度远大于 y 方向；竖放的条码正好相反
+    candidates = []
+    for rotated, energy in ((False, cv2.subtract(grad_x, grad_y)), (True, cv2.subtract(grad_y, grad_x))):
+        region = _barcode_region(energy, vertical_bars=not rotated)
+        if region:
+            candidates.append((region[0], region[1], rotated))
+    if not candidates:
+        return None
+
+    area, (x, y, bw, bh), rotated = max(candidates, key=lambda c: c[0])
+    small_area = small.shape[0] * small.shape[1]
+    if not (min_area * small_area <= area <= max_area * small_area):
+        return None
+
+    # 还原到原图坐标，并留出条码两侧的静区
+    pad_x, pad_y = int(bw * 0.15) + 2, int(bh * 0.15) + 2
+    x0 = max(0, int((x - pad_x) / scale))
+    y0 = max(0, int((y - pad_y) / scale))
+    x1 = min(w, int((x + bw + pad_x) / scale))
+    y1 = min(h, int((y + bh + pad_y) / scale))
+    return (x0, y0, x1 - x0, y1 - y0), rotated
+
+
+def decode_roi(gray, min_sharpness=0.0):
+    """
+    对单帧灰度图做质量检测 + 区域定位 + 单次解码。
+    返回 (状态, [(条码内容, 区域), ...])，状态为 blurry / no_barcode / failed / decoded。
+    """
+    if min_sharpness and frame_sharpness(gray) < min_sharpness:
+        return "blurry", []
+
+    located = locate_barcode(gray)
+    if located is None:
+        return "no_barcode", []
+
+    (x, y, w, h), rotated = located
+    crop = gray[y:y + h, x:x + w]
+    barcodes = decode_orientation(crop, cv2.ROTATE_90_CLOCKWISE if rotated else None)
+    if not barcodes:
+        return "failed", []
+    return "decoded", [(barcode.data.decode("utf-8"), (x, y, w, h)) for barcode in barcodes]
+
+
+def decode_image(gray, min_sharpness=0.0):
+    """
+    离线识别单张图片：先区域定位解码，失败再依次尝试全图三个方向。
+    返回 [(条码内容, 识别方式), ...]，识别方式为 roi 或 full。
+    """
+    status, codes = decode_roi(gray, min_sharpness)
+    if codes:
+        return [(code, "roi") for code, region in codes]
+    if status == "blurry":
+        return []
+    for rotation in ORIENTATIONS:
+        barcodes = decode_orientation(gray, rotation)
+        if barcodes:
+            return [(barcode.data.decode("utf-8"), "full") for barcode in barcodes]
+    return []
+
+
+class IsbnVoter:
+    """多帧投票：同一个 ISBN 在最近 window 次识别中出现 votes 次才被接受"""
+
+    def __init__(self, votes=3, window=5):
+        self.votes = votes
+        self.recent = deque(maxlen=window)
+
+    def add(self, code):
+        self.recent.append(code)
+        if self.recent.count(code) >= self.votes:
+            self.recent.clear()
+            return code
+        return None
+
+    def reset(self):
+        self.recent.clear()
+
+
+class ScanPipeline:
+    """
+    扫码流水线：采集线程 -> 有界帧队列 -> 解码线程池。
+    采集线程只负责读帧，队列满时丢弃旧帧，解码始终处理最新画面；
+    各个方向的解码在线程池中并行执行（cv2 和 zbar 调用期间会释放 GIL）。
+    """
+
+    # 统计值的平滑系数
+    SMOOTHING = 0.1
+    # 区域定位解码连续失败多少帧后，做一次全图多方向解码兜底
+    FALLBACK_INTERVAL = 10
+
+    def __init__(self, cap, decode_workers=3, queue_size=1, min_sharpness=50.0, votes=3):
+        self.cap = cap
+        self.min_sharpness = min_sharpness
+        self.voter = IsbnVoter(votes=votes)
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.results = queue.Queue()
+        self.pool = ThreadPoolExecutor(max_workers=decode_workers, thread_name_prefix="zbar")
+        self.stop_event = threading.Event()
+        self.threads = []
+
+        self.lock = threading.Lock()
+        self._latest_frame = None
+        self.frame_count = 0
+        self.camera_failed = False
+
+        # 实测指标
+        self.capture_fps = 0.0
+        self.decode_fps = 0.0
+        self.decode_latency = 0.0   # 单帧解码耗时(毫秒)
+        self.dropped_frames = 0
+        self.frame_status = {"blurry": 0, "no_barcode": 0, "failed": 0, "decoded": 0, "rejected": 0}
+        self.misses = 0
+        # 最近一次定位到的条码区域，用于界面提示
+        self.last_region = None
+
+    def start(self):
+        for target in (self._capture_loop, self._decode_loop):
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        for thread in self.threads:
+            thread.join(timeout=1)
+        self.pool.shutdown(wait=False)
+
+    @property
+    def running(self):
+        return not self.stop_event.is_set() and not self.camera_failed
+
+    def _smooth(self, old, new):
+        return new if old == 0 else old + (new - old) * self.SMOOTHING
+
+    def _capture_loop(self):
+        last = time.perf_counter()
+        while not self.stop_event.is_set():
+            ret, frame = self.cap.read()
+            if not ret:
+                self.camera_failed = True
+                break
+
+            now = time.perf_counter()
+            self.capture_fps = self._smooth(self.capture_fps, 1.0 / max(now - last, 1e-6))
+            last = now
+
+            with self.lock:
+                self._latest_frame = frame
+                self.frame_count += 1
+
+            # 队列满时丢弃最旧的帧，保证解码的是最新画面
+            try:
+                self.frames.put_nowait(frame)
+            except queue.Full:
+                try:
+                    self.frames.get_nowait()
+                    self.dropped_frames += 1
+                except queue.Empty:
+                    pass
+                try:
+                    self.frames.put_nowait(frame)
+                except queue.Full:
+                    pass
+
+    def _decode_loop(self):
+        last = time.perf_counter()
+        while not self.stop_event.is_set():
+            try:
+                frame = self.frames.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            start = time.perf_counter()
+            status, codes = self.decode_frame(frame)
+            end = time.perf_counter()
+
+            self.decode_latency = self._smooth(self.decode_latency, (end - start) * 1000)
+            self.decode_fps = self._smooth(self.decode_fps, 1.0 / max(end - last, 1e-6))
+            last = end
+
+            self.frame_status[status] += 1
+            for code, region in codes:
+                # 校验位不正确的读数直接丢弃，避免误读进入借还流程
+                if not is_valid_isbn13(code):
+                    self.frame_status["rejected"] += 1
+                    continue
+                if self.voter.add(code):
+                    self.results.put((code, region))
+
+    def decode_frame(self, frame):
+        # 转为灰度图，提高识别速度
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        status, codes = decode_roi(gray, self.min_sharpness)
+        self.last_region = codes[0][1] if codes else None
+        if status == "blurry" or codes:
+            self.misses = 0
+            return status, codes
+
+        # 定位失败时偶尔做一次全图多方向并行解码兜底
+        self.misses += 1
+        if self.misses % self.FALLBACK_INTERVAL:
+            return status, codes
+        futures = [self.pool.submit(decode_orientation, gray, rotation) for rotation in ORIENTATIONS]
+        # 按 0度 -> 90度 -> 270度 的优先级取第一个识别成功的结果
+        for rotation, future in zip(ORIENTATIONS, futures):
+            barcodes = future.result()
+            if barcodes:
+                return "decoded", [(barcode.data.decode("utf-8"), None) for barcode in barcodes]
+        return status, codes
+
+    def latest_frame(self, seen=0):
+        """返回 (帧序号, 帧副本)；没有比 seen 更新的帧时返回 (seen, None)"""
+        with self.lock:
+            if self._latest_frame is None or self.frame_count == seen:
+                return seen, None
+            return self.frame_count, self._latest_frame.copy()
+
+    def get_result(self, timeout=0):
+        try:
+            if timeout:
+                return self.results.get(timeout=timeout)
+            return self.results.get_nowait()
+        except queue.Empty:
+            return None
+
+    def stats(self):
+        return {
+            "capture_fps": round(self.capture_fps, 1),
+            "decode_fps": round(self.decode_fps, 1),
+            "decode_latency_ms": round(self.decode_latency, 1),
+            "dropped_frames": self.dropped_frames,
+            "frames": dict(self.frame_status),
+        }
+
+
+def frame_to_ppm(frame, width=320):
+    # 缩放并编码为 PPM，Tk 的 PhotoImage 可以直接显示，无需额外依赖
+    h, w = frame.shape[:2]
+    if w > width:
+        frame = cv2.resize(frame, (width, int(h * width / w)), interpolation=cv2.INTER_AREA)
+    ok, data = cv2.imencode(".ppm", frame)
+    return data.tobytes() if ok else None
+
+
+class ScanSession:
+    """
+    连续扫码会话：摄像头在整个会话期间保持打开，逐个产出去重后的 ISBN。
+
+        with scanner.session(cooldown=3) as session:
+            for isbn in session:
+                ...
+
+    同一个 ISBN 在 cooldown 秒内重复出现(例如书还停留在镜头前)时会被忽略。
+    不创建 cv2 窗口，界面可以通过 latest_frame() 自行绘制预览(例如嵌入 Tk 窗口)。
+    """
+
+    def __init__(self, camera_index=0, cooldown=3.0, decode_workers=3, min_sharpness=50.0, votes=3):
+        self.camera_index = camera_index
+        self.cooldown = cooldown
+        self.pipeline_options = dict(decode_workers=decode_workers, min_sharpness=min_sharpness, votes=votes)
+        self.cap = None
+        self.pipeline = None
+        self.last_seen = {}
+        self.closed = False
+        # open() 可能在后台线程执行，与界面线程的 close() 并发
+        self.lock = threading.Lock()
+
+    def open(self):
+        if not available():
+            raise RuntimeError(f"扫码功能不可用，请安装 opencv-python 和 pyzbar: {IMPORT_ERROR}")
+        # 先用局部变量打开，期间 close() 不会看到也不会释放一半打开的资源
+        cap = cv2.VideoCapture(self.camera_index)
+        if not cap.isOpened():
+            cap.release()
+            raise RuntimeError("无法打开摄像头")
+        pipeline = ScanPipeline(cap, **self.pipeline_options).start()
+        with self.lock:
+            if not self.closed:
+                self.cap, self.pipeline = cap, pipeline
+                return self
+        # 在后台线程打开期间会话已被关闭
+        pipeline.stop()
+        cap.release()
+        return self
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            pipeline, self.pipeline = self.pipeline, None
+            cap, self.cap = self.cap, None
+        if pipeline:
+            pipeline.stop()
+        if cap:
+            cap.release()
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @property
+    def running(self):
+        pipeline = self.pipeline
+        return not self.closed and pipeline is not None and pipeline.running
+
+    def poll(self, timeout=0):
+        """取出下一个新 ISBN，没有时返回 None（timeout=0 时不阻塞，适合界面定时轮询）"""
+        # 读取一次引用，期间被 close() 置空也不影响本次调用
+        pipeline = self.pipeline
+        if self.closed or pipeline is None or not pipeline.running:
+            return None
+        result = pipeline.get_result(timeout)
+        if result is None:
+            return None
+
+        isbn = result[0]
+        now = time.monotonic()
+        last = self.last_seen.get(isbn)
+        # 每次看到都刷新时间，书一直停在镜头前不会被重复产出
+        self.last_seen[isbn] = now
+        if last is not None and now - last < self.cooldown:
+            return None
+        return isbn
+
+    def __iter__(self):
+        while self.running:
+            isbn = self.poll(timeout=0.1)
+            if isbn:
+                yield isbn
+
+    def latest_frame(self, seen=0):
+        pipeline = self.pipeline
+        if not pipeline:
+            return seen, None
+        return pipeline.latest_frame(seen)
+
+    def stats(self):
+        pipeline = self.pipeline
+        return pipeline.stats() if pipeline else None
+
 
 class BarcodeScanner:
+    def __init__(self, camera_index=0, decode_workers=3, min_sharpness=50.0, votes=3):
+        self.camera_index = camera_index
+        self.decode_workers = decode_workers
+        # 清晰度下限(拉普拉斯方差)和需要一致的识别次数
+        self.min_sharpness = min_sharpness
+        self.votes = votes
+        # 最近一次扫描的性能指标（帧率、解码延迟）
+        self.last_stats = None
+
+    def session(self, cooldown=3.0):
+        """创建连续扫码会话，需调用 open() 或使用 with 语句打开"""
+        return ScanSession(
+            self.camera_index, cooldown=cooldown, decode_workers=self.decode_workers,
+            min_sharpness=self.min_sharpness, votes=self.votes,
+        )
+
     def scan_isbn(self):
         """
         打开摄像头，扫描条形码（EAN-13/ISBN）。
         返回扫描到的 ISBN 字符串。
         如果用户按 'q' 取消或无法打开摄像头，返回 None。
         """
+        if not available():
+            print(f"扫码功能不可用，请安装 opencv-python 和 pyzbar: {IMPORT_ERROR}")
+            return None
+
         # 尝试打开默认摄像头
-        cap = cv2.VideoCapture(0)
-        
+        cap = cv2.VideoCapture(self.camera_index)
+
         if not cap.isOpened():
             print("无法打开摄像头")
             return None
 
         found_isbn = None
-        
+
         print("正在启动摄像头... 请将书籍背面的条形码对准摄像头。")
         print("按 'q' 键取消扫描。")
 
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                print("无法接收摄像头画面")
-                break
+        pipeline = ScanPipeline(
+            cap, decode_workers=self.decode_workers, min_sharpness=self.min_sharpness, votes=self.votes
+        ).start()
+        frame_id = 0
+        try:
+            while True:
+                if pipeline.camera_failed:
+                    print("无法接收摄像头画面")
+                    break
 
-            barcode_data = None
-                    
-            # 转为灰度图，提高识别速度
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-
-            # 多角度检测（支持竖向条码）
-            # 很多书本是竖着放的，默认扫描无法识别。尝试 0度 -> 90度 -> 270度
-            # 保持 symbols=[ZBarSymbol.EAN13] 以防止崩溃并专注识别 ISBN
-            barcodes = decode(gray, symbols=[ZBarSymbol.EAN13])
-            is_rotated = False
-            
-            if not barcodes:
-                # 尝试顺时针旋转90度
-                gray_rotated = cv2.rotate(gray, cv2.ROTATE_90_CLOCKWISE)
-                barcodes = decode(gray_rotated, symbols=[ZBarSymbol.EAN13])
-                if barcodes:
-                    is_rotated = True
-            
-            if not barcodes:
-                # 尝试逆时针旋转90度
-                gray_rotated = cv2.rotate(gray, cv2.ROTATE_90_COUNTERCLOCKWISE)
-                barcodes = decode(gray_rotated, symbols=[ZBarSymbol.EAN13])
-                if barcodes:
-                    is_rotated = True
-
-            for barcode in barcodes:
-                # 提取条形码数据
-                barcode_data = barcode.data.decode("utf-8")
-                barcode_type = barcode.type
-                text = f"{barcode_data} ({barcode_type})"
-
-                if not is_rotated:
-                    # 正常角度：绘制矩形框
-                    (x, y, w, h) = barcode.rect
-                    cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
-                    cv2.putText(frame, text, (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-                else:
-                    # 旋转角度：直接在界面下方显示结果
-                    h_frm, w_frm = frame.shape[:2]
-                    cv2.putText(frame, f"Found: {text}", (10, h_frm - 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-            # 简单的过滤：我们假设书籍条码通常是 EAN13
-            # 即使不是，我们也先返回，由上层逻辑判断
-            if barcode_data:
-                found_isbn = barcode_data
-                
-            # 显示画面
-            cv2.imshow('Scan ISBN - Press "q" to cancel', frame)
-
-            # 如果找到了 ISBN，暂停一下给用户视觉确认，然后退出
-            if found_isbn:
-                print(f"识别成功: {found_isbn}")
-                # 绘制最终确认框（绿色实心）
-                cv2.waitKey(500) # 停留 0.5 秒
-                break
+                # 只在有新画面时重绘
+                frame_id, frame = pipeline.latest_frame(frame_id)
+                if frame is None:
+                    if cv2.waitKey(5) & 0xFF == ord('q'):
+                        break
+                    continue
 
-            # 按 'q' 退出
-            if cv2.waitKey(1) & 0xFF == ord('q'):
-                break
+                # 识别中：黄色框标出定位到的条码区域
+                region = pipeline.last_region
+                if region:
+                    (x, y, w, h) = region
+                    cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 255), 1)
 
-        cap.release()
-        cv2.destroyAllWindows()
+                # 结果已经过 ISBN-13 校验和多帧投票
+                result = pipeline.get_result()
+                if result:
+                    found_isbn, region = result
+                    if region:
+                        # 绘制矩形框
+                        (x, y, w, h) = region
+                        cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
+                        cv2.putText(frame, found_isbn, (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+                    else:
+                        # 全图兜底识别没有区域信息：直接在界面下方显示结果
+                        h_frm, w_frm = frame.shape[:2]
+                        cv2.putText(frame, f"Found: {found_isbn}", (10, h_frm - 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+
+                # 左上角显示实时帧率和解码耗时
+                stats = pipeline.stats()
+                cv2.putText(frame, f"FPS {stats['capture_fps']:.0f}  decode {stats['decode_latency_ms']:.0f}ms",
+                            (10, 20), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 200, 255), 1)
+
+                # 显示画面
+                cv2.imshow('Scan ISBN - Press "q" to cancel', frame)
+
+                # 如果找到了 ISBN，暂停一下给用户视觉确认，然后退出
+                if found_isbn:
+                    print(f"识别成功: {found_isbn}")
+                    # 绘制最终确认框（绿色实心）
+                    cv2.waitKey(500) # 停留 0.5 秒
+                    break
+
+                # 按 'q' 退出
+                if cv2.waitKey(1) & 0xFF == ord('q'):
+                    break
+        finally:
+            self.last_stats = pipeline.stats()
+            pipeline.stop()
+            cap.release()
+            cv2.destroyAllWindows()
         return found_isbn
 
 if __name__ == "__main__":
@@ -102,4 +528,6 @@ if __name__ == "__main__":
     if result:
         print(f"最终结果: {result}")
     else:
-        print("扫描取消或失败")
\ No newline at end of file
+        print("扫描取消或失败")
+    if scanner.last_stats:
+        print(f"性能统计: {scanner.last_stats}")
@@ -0,0 +1,174 @@
+# 图书全文检索索引
+# 基于 SQLite FTS5 为书名/作者/分类建立倒排索引，替代 LIKE '%kw%' 的全表扫描。
+# FTS5 自带的分词器无法切分不含空格的中文，因此在 Python 侧把文本切成重叠的二元组(bigram)，
+# 查询时把关键词同样切分后做短语匹配，命中结果与子串匹配等价。
+
+import re
+from sqlalchemy import text
+from models import Book
+from logger_config import logger
+
+FTS_TABLE = "books_fts"
+
+# 列权重：书名 > 作者 > 分类，用于 bm25 排序
+RANK_WEIGHTS = (10.0, 5.0, 1.0)
+
+# 索引是否可用（非 SQLite 或 SQLite 未编译 FTS5 时为 False，查询回退到 LIKE）
+enabled = False
+
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+def normalize(value):
+    # 统一小写并去掉空白和标点，保证索引和查询的切分方式一致
+    return _NON_WORD.sub("", (value or "").lower())
+
+
+def tokenize(value):
+    """
+    把文本切成以空格分隔的二元组，例如 "大学物理" -> "大学 学物 物理 理"。
+    末尾字符单独成词，使单字查询也能通过前缀匹配命中。
+    """
+    s = normalize(value)
+    return " ".join(s[i:i + 2] for i in range(len(s)))
+
+
+def build_match_query(keyword):
+    """把用户输入的关键词转换为 FTS5 MATCH 表达式，无法检索时返回 None。"""
+    s = normalize(keyword)
+    if not s:
+        return None
+    if len(s) == 1:
+        return f'"{s}"*'
+    grams = [s[i:i + 2] for i in range(len(s) - 1)]
+    # 连续二元组组成的短语 == 原关键词的子串
+    return '"' + " ".join(grams) + '"'
+
+
+def _row_params(book_id, title, author, category):
+    return {
+        "rowid": book_id,
+        "title": tokenize(title),
+        "author": tokenize(author),
+        "category": tokenize(category),
+    }
+
+
+# 初始化索引：建表，并在索引与 books 表不一致时重建
+def ensure_index(engine):
+    global enabled
+    if engine.dialect.name != "sqlite":
+        enabled = False
+        return False
+
+    try:
+        with engine.begin() as conn:
+            conn.execute(text(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(title, author, category)"
+            ))
+            books = conn.execute(text("SELECT COUNT(*) FROM books")).scalar()
+            indexed = conn.execute(text(f"SELECT COUNT(*) FROM {FTS_TABLE}")).scalar()
+            if books != indexed:
+                logger.info(f"Rebuilding search index ({indexed} indexed / {books} books)")
+                _rebuild(conn)
+        enabled = True
+    except Exception as e:
+        # 例如 SQLite 未编译 FTS5 扩展
+        logger.warning(f"Full-text search index unavailable, falling back to LIKE: {e}")
+        enabled = False
+    return enabled
+
+
+def _rebuild(conn, batch_size=5000):
+    conn.execute(text(f"DELETE FROM {FTS_TABLE}"))
+    insert = text(
+        f"INSERT INTO {FTS_TABLE}(rowid, title, author, category) "
+        "VALUES (:rowid, :title, :author, :category)"
+    )
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            text("SELECT id, title, author, category FROM books WHERE id > :last ORDER BY id LIMIT :n"),
+            {"last": last_id, "n": batch_size},
+        ).fetchall()
+        if not rows:
+            break
+        conn.execute(insert, [_row_params(*row) for row in rows])
+        last_id = rows[-1][0]
+
+
+# 重建整个索引（数据被外部工具直接修改后使用）
+def rebuild_index(db):
+    if enabled:
+        _rebuild(db.connection())
+
+
+# 以下函数在调用方的事务中执行，随业务操作一起提交或回滚
+def index_book(db, book):
+    if not enabled:
+        return
+    db.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid = :rowid"), {"rowid": book.id})
+    db.execute(
+        text(f"INSERT INTO {FTS_TABLE}(rowid, title, author, category) VALUES (:rowid, :title, :author, :category)"),
+        _row_params(book.id, book.title, book.author, book.category),
+    )
+
+
+def unindex_book(db, book_id):
+    if not enabled:
+        return
+    db.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid = :rowid"), {"rowid": book_id})
+
+
+def search_books(db, keyword):
+    """
+    按相关度排序返回匹配的图书 ORM 对象列表。
+    索引不可用或关键词无法切分时返回 None，由调用方回退到 LIKE 查询。
+    """
+    if not enabled:
+        return None
+    match = build_match_query(keyword)
+    if match is None:
+        return None
+
+    weights = ", ".join(str(w) for w in RANK_WEIGHTS)
+    stmt = text(
+        f"SELECT books.* FROM {FTS_TABLE} JOIN books ON books.id = {FTS_TABLE}.rowid "
+        f"WHERE {FTS_TABLE} MATCH :match ORDER BY bm25({FTS_TABLE}, {weights}), books.id"
+    )
+    return db.query(Book).from_statement(stmt).params(match=match).all()
+
+
+def search_page(db, keyword, after_id, limit):
+    """
+    键集分页版本：按 id 顺序返回 id > after_id 的匹配行(元组)，用于列表滚动加载。
+    不可用时返回 None。
+    """
+    if not enabled:
+        return None
+    match = build_match_query(keyword)
+    if match is None:
+        return None
+
+    stmt = text(
+        "SELECT books.id, books.isbn, books.title, books.author, books.category, "
+        "books.available_copies, books.total_copies "
+        f"FROM {FTS_TABLE} JOIN books ON books.id = {FTS_TABLE}.rowid "
+        f"WHERE {FTS_TABLE} MATCH :match AND {FTS_TABLE}.rowid > :after "
+        f"ORDER BY {FTS_TABLE}.rowid LIMIT :limit"
+    )
+    return db.execute(stmt, {"match": match, "after": after_id, "limit": limit}).fetchall()
+
+
+# 批量写入索引（批量导入使用），rows 为 (id, title, author, category) 序列
+def index_rows(db, rows):
+    if not enabled or not rows:
+        return
+    db.execute(
+        text(f"DELETE FROM {FTS_TABLE} WHERE rowid = :rowid"),
+        [{"rowid": row[0]} for row in rows],
+    )
+    db.execute(
+        text(f"INSERT INTO {FTS_TABLE}(rowid, title, author, category) VALUES (:rowid, :title, :author, :category)"),
+        [_row_params(*row) for row in rows],
+    )
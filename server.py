@@ -0,0 +1,384 @@
+# 图书馆 HTTP/JSON 服务
+# 基于 asyncio 的轻量服务，把 LibraryManager 的登录、查询、借还、添加图书和统计接口
+# 开放给瘦客户端(图形界面、自助借还机、脚本)，所有终端共用服务端的数据库连接池，
+# 不再各自直接打开数据库文件。
+#
+# 业务逻辑复用同步的 LibraryManager，在线程池中执行(使用 db.py 的连接池)，事件循环只负责网络读写，
+# 不会被数据库访问、锁冲突重试的退避等待或缓存/目录计算阻塞。
+#
+# 用法: python server.py --host 127.0.0.1 --port 8080
+#
+# 接口(请求和响应均为 JSON，除 /login 和 /health 外需携带 Authorization: Bearer <token>):
+#   POST /login    {"username", "password"}             -> {"ok", "message", "token", "role"}
+#   POST /logout
+#   GET  /books?q=关键词&after_id=0&limit=100           -> {"ok", "books": [...]}
+#   POST /borrow   {"isbn"}
+#   POST /return   {"isbn"}
+#   POST /books    {"isbn", "title", "author", "category", "total_copies"}   (管理员)
+#   GET  /recommendations?isbn=...&k=5                  -> {"ok", "books": [...]}  借过这本书的读者还借了
+#   GET  /stats                                          (管理员)
+#   GET  /health                                         (含缓存命中率和延迟、内存目录状态)
+
+import argparse
+import asyncio
+import json
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+
+import db
+import cache
+import catalog
+from auth import AuthManager
+from manager import LibraryManager
+from logger_config import logger
+
+# 登录令牌有效期(秒)
+TOKEN_TTL = 8 * 3600
+# 请求体大小上限(字节)
+MAX_BODY = 1024 * 1024
+# 空闲的长连接在多久后关闭(秒)
+KEEP_ALIVE_TIMEOUT = 15
+BOOK_PAGE_LIMIT = 500
+
+HTTP_STATUS = {
+    200: "OK",
+    400: "Bad Request",
+    401: "Unauthorized",
+    403: "Forbidden",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+}
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+# ==========================================
+# 数据库访问
+# ==========================================
+class Database:
+    """
+    在线程池中执行同步的业务函数 fn(session)，每次调用使用独立的 db.session_scope()。
+    LibraryManager 是同步代码(包括遇到数据库锁时的退避等待)，不能在事件循环线程中执行，否则会阻塞所有连接。
+    并发数限制为连接池大小，超出的请求排队等待，而不是在连接池上超时失败。
+    SQLite 同一时间只允许一个写事务，写操作在服务内部排队，避免多个连接在数据库锁上反复等待重试。
+    """
+
+    def __init__(self, url=None):
+        self.url = url or db.DB_URL
+        self.executor = None
+        self.limit = asyncio.Semaphore(db.POOL_SIZE + db.MAX_OVERFLOW)
+        self.write_lock = None
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        # 建表、全文索引和迁移沿用同步初始化流程
+        db.DB_URL = self.url
+        await loop.run_in_executor(None, db.init_db)
+        if db.engine.dialect.name == "sqlite":
+            self.write_lock = asyncio.Lock()
+        # 线程数与连接池大小相同，每个线程同一时间只占用一个连接
+        self.executor = ThreadPoolExecutor(
+            max_workers=db.POOL_SIZE + db.MAX_OVERFLOW, thread_name_prefix="service-db"
+        )
+        logger.info(f"Service using database: {db.engine.url!r}")
+
+    async def call(self, fn, write=False):
+        if write and self.write_lock is not None:
+            async with self.write_lock:
+                return await self._call(fn)
+        return await self._call(fn)
+
+    async def _call(self, fn):
+        async with self.limit:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, _call_sync, fn)
+
+    async def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+
+
+def _call_sync(fn):
+    with db.session_scope() as session:
+        return fn(session)
+
+
+# ==========================================
+# 业务接口
+# ==========================================
+def _book_dict(row):
+    book_id, isbn, title, author, category, available, total = row
+    return {
+        "id": book_id, "isbn": isbn, "title": title, "author": author,
+        "category": category, "available_copies": available, "total_copies": total,
+    }
+
+
+def _int_param(params, name, default, maximum=None):
+    try:
+        value = int(params.get(name, default))
+    except (TypeError, ValueError):
+        raise HttpError(400, f"参数 {name} 必须是整数")
+    return min(value, maximum) if maximum else value
+
+
+class LibraryService:
+    def __init__(self, database):
+        self.database = database
+        # token -> (用户对象(已与会话分离), 过期时间)
+        self.tokens = {}
+        self.routes = {
+            ("POST", "/login"): self.login,
+            ("POST", "/logout"): self.logout,
+            ("GET", "/books"): self.search,
+            ("POST", "/books"): self.add_book,
+            ("POST", "/borrow"): self.borrow,
+            ("POST", "/return"): self.return_book,
+            ("GET", "/recommendations"): self.recommendations,
+            ("GET", "/stats"): self.stats,
+            ("GET", "/health"): self.health,
+        }
+
+    def authenticate(self, headers):
+        auth = headers.get("authorization", "")
+        token = auth[7:] if auth.startswith("Bearer ") else ""
+        entry = self.tokens.get(token)
+        if entry is None or entry[1] < time.monotonic():
+            self.tokens.pop(token, None)
+            raise HttpError(401, "未登录或登录已过期")
+        return token, entry[0]
+
+    async def dispatch(self, method, path, params, headers, body):
+        handler = self.routes.get((method, path))
+        if handler is None:
+            if any(route_path == path for _, route_path in self.routes):
+                raise HttpError(405, "不支持的请求方法")
+            raise HttpError(404, "接口不存在")
+        return await handler(params, headers, body)
+
+    async def login(self, params, headers, body):
+        username, password = body.get("username", ""), body.get("password", "")
+
+        def login(session):
+            auth = AuthManager(session)
+            success, msg = auth.login(username, password)
+            return auth.current_user, success, msg
+
+        user, success, msg = await self.database.call(login)
+        if not success:
+            return {"ok": False, "message": msg}
+        # 顺便清理过期令牌
+        now = time.monotonic()
+        for token in [t for t, (_, expires) in self.tokens.items() if expires < now]:
+            del self.tokens[token]
+        token = secrets.token_urlsafe(24)
+        self.tokens[token] = (user, now + TOKEN_TTL)
+        return {"ok": True, "message": msg, "token": token, "role": user.role}
+
+    async def logout(self, params, headers, body):
+        token, user = self.authenticate(headers)
+        del self.tokens[token]
+        logger.info(f"User logged out: {user.username}")
+        return {"ok": True, "message": "已登出"}
+
+    async def search(self, params, headers, body):
+        _, user = self.authenticate(headers)
+        keyword = params.get("q") or None
+        after_id = _int_param(params, "after_id", 0)
+        limit = _int_param(params, "limit", 100, BOOK_PAGE_LIMIT)
+        rows = await self.database.call(
+            lambda session: LibraryManager(session, user).list_books_page(keyword, after_id, limit)
+        )
+        return {"ok": True, "books": [_book_dict(row) for row in rows]}
+
+    async def borrow(self, params, headers, body):
+        _, user = self.authenticate(headers)
+        isbn = str(body.get("isbn", "")).strip()
+        success, msg = await self.database.call(
+            lambda session: LibraryManager(session, user).borrow_book(isbn), write=True
+        )
+        return {"ok": success, "message": msg}
+
+    async def return_book(self, params, headers, body):
+        _, user = self.authenticate(headers)
+        isbn = str(body.get("isbn", "")).strip()
+        success, msg = await self.database.call(
+            lambda session: LibraryManager(session, user).return_book(isbn), write=True
+        )
+        return {"ok": success, "message": msg}
+
+    async def add_book(self, params, headers, body):
+        _, user = self.authenticate(headers)
+        if user.role != "admin":
+            raise HttpError(403, "权限不足")
+        try:
+            fields = (body["isbn"], body["title"], body.get("author", ""),
+                      body.get("category", ""), int(body.get("total_copies", 1)))
+        except (KeyError, TypeError, ValueError):
+            raise HttpError(400, "需要 isbn、title，total_copies 必须是整数")
+        success, msg = await self.database.call(
+            lambda session: LibraryManager(session, user).add_book(*fields), write=True
+        )
+        return {"ok": success, "message": msg}
+
+    async def recommendations(self, params, headers, body):
+        _, user = self.authenticate(headers)
+        isbn = str(params.get("isbn", "")).strip()
+        k = _int_param(params, "k", 5, 50)
+        rows = await self.database.call(lambda session: LibraryManager(session, user).also_borrowed(isbn, k))
+        return {"ok": True, "books": [
+            {"isbn": isbn, "title": title, "author": author, "available_copies": available, "score": score}
+            for isbn, title, author, available, score in rows
+        ]}
+
+    async def stats(self, params, headers, body):
+        _, user = self.authenticate(headers)
+        if user.role != "admin":
+            raise HttpError(403, "权限不足")
+
+        def stats(session):
+            result = LibraryManager(session, user).get_stats()
+            return {
+                "hot_books": [{"title": title, "count": count} for title, count in result["hot_books"]],
+                "overdue_count": result["overdue_count"],
+            }
+
+        return {"ok": True, **await self.database.call(stats)}
+
+    async def health(self, params, headers, body):
+        return {"ok": True, "sessions": len(self.tokens), "cache": cache.stats(), "catalog": catalog.stats()}
+
+
+# ==========================================
+# HTTP 处理
+# ==========================================
+async def _readline(reader):
+    try:
+        return await reader.readline()
+    except ValueError:
+        # 超过 StreamReader 的行长度上限
+        raise HttpError(400, "请求行或请求头过长")
+
+
+async def read_request(reader):
+    """读取一个 HTTP 请求，连接关闭时返回 None"""
+    line = await _readline(reader)
+    if not line:
+        return None
+    try:
+        method, target, version = line.decode("latin-1").split()
+    except ValueError:
+        raise HttpError(400, "无效的请求行")
+
+    headers = {}
+    while True:
+        line = await _readline(reader)
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    # 只接受非负的十进制整数，否则 int() / readexactly() 抛出的 ValueError 会让连接没有响应就断开
+    length = headers.get("content-length", "")
+    if length and not (length.isascii() and length.isdigit()):
+        raise HttpError(400, "无效的 Content-Length")
+    length = int(length or 0)
+    if length > MAX_BODY:
+        raise HttpError(413, "请求体过大")
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), target, version, headers, body
+
+
+def write_response(writer, status, payload, keep_alive):
+    data = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+    head = (
+        f"HTTP/1.1 {status} {HTTP_STATUS.get(status, '')}\r\n"
+        "Content-Type: application/json; charset=utf-8\r\n"
+        f"Content-Length: {len(data)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    writer.write(head.encode("latin-1") + data)
+
+
+class LibraryServer:
+    def __init__(self, service):
+        self.service = service
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(read_request(reader), KEEP_ALIVE_TIMEOUT)
+                except HttpError as e:
+                    write_response(writer, e.status, {"ok": False, "message": e.message}, False)
+                    break
+                if request is None:
+                    break
+
+                method, target, version, headers, body = request
+                connection = headers.get("connection", "").lower()
+                keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+                status, payload = await self.handle_request(method, target, headers, body)
+                write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def handle_request(self, method, target, headers, body):
+        url = urlsplit(target)
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        try:
+            data = json.loads(body.decode("utf-8")) if body else {}
+            if not isinstance(data, dict):
+                raise ValueError("body must be an object")
+        except ValueError:
+            return 400, {"ok": False, "message": "请求体必须是 JSON 对象"}
+
+        try:
+            return 200, await self.service.dispatch(method, url.path, params, headers, data)
+        except HttpError as e:
+            return e.status, {"ok": False, "message": e.message}
+        except Exception as e:
+            logger.error(f"Request {method} {url.path} failed: {e}")
+            return 500, {"ok": False, "message": "服务器内部错误"}
+
+
+async def serve(host, port):
+    database = Database()
+    await database.start()
+    server = LibraryServer(LibraryService(database))
+    listener = await asyncio.start_server(server.handle_connection, host, port, backlog=1024)
+    logger.info(f"Library service listening on {host}:{port}")
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        await database.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="图书馆 HTTP/JSON 服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
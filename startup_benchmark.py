@@ -0,0 +1,103 @@
+# 启动性能测试
+# 在全新的子进程中多次测量:
+#   - import main 的耗时，以及导入后是否已经加载了 OpenCV / SQLAlchemy 等重量级模块
+#   - 登录窗口的创建和首次绘制耗时(需要图形界面，没有显示器时跳过)
+#   - 后台数据库初始化(导入数据库模块 + 建表迁移)的耗时
+# 导入期间加载了重量级模块，或导入/首次绘制超过预算时返回非零退出码，可用于防止启动变慢。
+#
+# 用法:
+#   python startup_benchmark.py
+#   python startup_benchmark.py --runs 10 --budget-ms 200 -o startup.json
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+# 不应在启动时加载的模块：扫码依赖在第一次扫码时加载，数据库依赖在后台线程加载
+HEAVY_MODULES = ("cv2", "pyzbar", "numpy", "sqlalchemy")
+
+# 在子进程中执行，结果以一行 JSON 输出
+CHILD_CODE = r"""
+import json, sys, time
+heavy = sys.argv[1].split(",")
+result = {}
+
+start = time.perf_counter()
+import main
+result["import_ms"] = (time.perf_counter() - start) * 1000
+result["heavy_loaded"] = [name for name in heavy if name in sys.modules]
+
+try:
+    root = main.tk.Tk()
+except main.tk.TclError:
+    root = None
+if root is not None:
+    start = time.perf_counter()
+    app = main.LibraryApp(root)
+    root.update()
+    result["first_paint_ms"] = (time.perf_counter() - start) * 1000
+    app.tasks.ready.result()
+    root.destroy()
+
+start = time.perf_counter()
+main.init_backend()
+result["init_backend_ms"] = (time.perf_counter() - start) * 1000
+print(json.dumps(result))
+"""
+
+
+def run_once(db_path):
+    env = dict(os.environ, LIBRARY_DB_URL=f"sqlite:///{db_path}", LIBRARY_LOG_LEVEL="WARNING")
+    output = subprocess.check_output(
+        [sys.executable, "-c", CHILD_CODE, ",".join(HEAVY_MODULES)],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env, stderr=subprocess.DEVNULL,
+    )
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def median(values):
+    values = sorted(values)
+    return round(values[len(values) // 2], 1) if values else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="测量应用启动耗时")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=300.0, help="import main 和首次绘制的耗时上限(中位数)")
+    parser.add_argument("-o", "--output", help="结果 JSON 文件")
+    args = parser.parse_args(argv)
+
+    runs = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for i in range(args.runs):
+            # 第一次运行会建表，之后的运行测量已有数据库时的初始化
+            runs.append(run_once(os.path.join(tmp, "startup.db")))
+
+    summary = {"runs": args.runs, "budget_ms": args.budget_ms}
+    for key in ("import_ms", "first_paint_ms", "init_backend_ms"):
+        summary[key] = median([run[key] for run in runs if key in run])
+    summary["heavy_loaded"] = sorted({name for run in runs for name in run["heavy_loaded"]})
+
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"summary": summary, "runs": runs}, f, ensure_ascii=False, indent=2)
+
+    failed = False
+    if summary["heavy_loaded"]:
+        print(f"启动时加载了重量级模块: {', '.join(summary['heavy_loaded'])}", file=sys.stderr)
+        failed = True
+    for key in ("import_ms", "first_paint_ms"):
+        if summary[key] is not None and summary[key] > args.budget_ms:
+            print(f"{key} {summary[key]} ms 超过预算 {args.budget_ms} ms", file=sys.stderr)
+            failed = True
+    if summary["first_paint_ms"] is None:
+        print("没有图形界面，未测量首次绘制耗时", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
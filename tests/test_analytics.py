@@ -0,0 +1,66 @@
+# 借阅分析快照的增量读取：PostgreSQL 上较小 id 的借阅可能晚提交，回读的 id 范围要把它补进快照
+
+import datetime
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+np = pytest.importorskip("numpy")
+
+import analytics  # noqa: E402
+import db  # noqa: E402
+from models import Base, BorrowRecord  # noqa: E402
+
+NOW = datetime.datetime(2026, 3, 2, 10, 0)
+
+
+@pytest.fixture
+def session(monkeypatch):
+    monkeypatch.setattr(db, "ARCHIVE_DB", None)
+    engine = create_engine("sqlite://")
+    db.configure_archive(engine)
+    Base.metadata.create_all(engine)
+    # 按 PostgreSQL 的方式增量读取(SQLite 的 id 按提交顺序分配，不回读)
+    monkeypatch.setattr(engine.dialect, "name", "postgresql")
+    with Session(engine) as session:
+        yield session
+    engine.dispose()
+
+
+def _loan(session, record_id, returned=False):
+    session.add(BorrowRecord(
+        id=record_id, user_id=1, book_id=None, borrow_date=NOW, due_date=NOW + datetime.timedelta(days=30),
+        return_date=NOW + datetime.timedelta(days=3) if returned else None,
+    ))
+    session.commit()
+
+
+def test_late_committed_loans_are_picked_up(session):
+    snapshot = analytics.LoanSnapshot()
+    for record_id in (1, 2, 4, 5):
+        _loan(session, record_id, returned=True)
+    assert snapshot.refresh(session) == (4, 0)
+
+    # id 3 在 id 4、5 之后才提交
+    _loan(session, 3)
+    assert snapshot.refresh(session) == (1, 0)
+    assert snapshot.ids.tolist() == [1, 2, 3, 4, 5]
+    assert np.isnat(snapshot.returned).tolist() == [False, False, True, False, False]
+
+    # 已在快照中的记录不会重复读入
+    _loan(session, 6)
+    assert snapshot.refresh(session) == (1, 0)
+    assert snapshot.ids.tolist() == [1, 2, 3, 4, 5, 6]
+
+
+def test_loans_older_than_the_overlap_are_not_reread(session, monkeypatch):
+    monkeypatch.setattr(analytics, "ID_OVERLAP", 3)
+    snapshot = analytics.LoanSnapshot()
+    for record_id in (1, 5, 6):
+        _loan(session, record_id)
+    snapshot.refresh(session)
+    _loan(session, 3)
+    _loan(session, 4)
+    assert snapshot.refresh(session) == (1, 0)
+    assert snapshot.ids.tolist() == [1, 4, 5, 6]
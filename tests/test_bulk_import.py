@@ -0,0 +1,24 @@
+# 批量导入的数量字段：JSON 的数字与 CSV 的字符串按同样的规则校验
+
+import pytest
+
+from manager import LibraryManager
+
+
+@pytest.mark.parametrize("copies", [0, "0", -1, "-1", 2.5, True, "abc"])
+def test_invalid_copies_are_rejected(copies):
+    with pytest.raises(ValueError):
+        LibraryManager._parse_book_row({"isbn": "9780000000001", "copies": copies})
+
+
+@pytest.mark.parametrize("row, expected", [
+    ({"isbn": "1"}, 1),
+    ({"isbn": "1", "copies": None}, 1),
+    ({"isbn": "1", "copies": ""}, 1),
+    ({"isbn": "1", "copies": "", "total_copies": "4"}, 4),
+    ({"isbn": "1", "copies": " 3 "}, 3),
+    ({"isbn": "1", "copies": 3}, 3),
+    ({"isbn": "1", "copies": 3.0}, 3),
+])
+def test_copies_default_only_when_missing(row, expected):
+    assert LibraryManager._parse_book_row(row)["copies"] == expected
@@ -0,0 +1,18 @@
+# 多个终端进程同时借还同一批图书：不能超借，库存不能为负，锁冲突不能返回给调用方
+
+import bench_concurrency
+
+
+def test_concurrent_terminals_do_not_oversell(tmp_path):
+    # 图书少、册数少，让终端之间反复争抢最后一本
+    result = bench_concurrency.run(terminals=4, ops=60, books=3, copies=2, tmpdir=str(tmp_path))
+    print(f"throughput: {result['ops_per_sec']} ops/s ({result['ops']} ops in {result['elapsed']}s)")
+
+    assert result["inconsistent_books"] == 0
+    assert result["negative_stock_books"] == 0
+    assert result["locked"] == 0
+    assert result["errors"] == 0
+    assert result["borrow_ok"] + result["no_stock"] + result["return_ok"] == result["ops"]
+    # 确实发生过争抢，测试才有意义
+    assert result["no_stock"] > 0
+    assert result["ops_per_sec"] > 0
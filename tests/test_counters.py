@@ -0,0 +1,38 @@
+# 计数表累加(db.add_counts)：ON CONFLICT DO UPDATE 和其他数据库的 UPDATE/INSERT 两条路径结果相同
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+import db
+from models import BookPair
+
+
+@pytest.fixture(params=["on_conflict", "update_insert"])
+def session(request, monkeypatch):
+    engine = create_engine("sqlite://")
+    BookPair.__table__.create(engine)
+    if request.param == "update_insert":
+        monkeypatch.setattr(engine.dialect, "name", "other")
+    with Session(engine) as session:
+        yield session
+    engine.dispose()
+
+
+def _pairs(session):
+    return {(row.book_id, row.other_id): row.count for row in session.query(BookPair)}
+
+
+def test_counts_are_inserted_then_added(session):
+    table = BookPair.__table__
+    db.add_counts(session, table, ("book_id", "other_id"), [
+        {"book_id": 1, "other_id": 2, "count": 1},
+        {"book_id": 2, "other_id": 1, "count": 1},
+    ])
+    db.add_counts(session, table, ("book_id", "other_id"), [
+        {"book_id": 1, "other_id": 2, "count": 2},
+        {"book_id": 1, "other_id": 3, "count": 1},
+    ])
+    db.add_counts(session, table, ("book_id", "other_id"), [])
+    session.commit()
+    assert _pairs(session) == {(1, 2): 3, (2, 1): 1, (1, 3): 1}
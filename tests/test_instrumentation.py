@@ -0,0 +1,73 @@
+# 操作指标：rows_loaded 统计查询返回的行数，只查询列(不加载 ORM 实体)的操作也要计入
+
+import pytest
+from sqlalchemy import Column, Integer, String, create_engine, text
+from sqlalchemy.orm import Session, declarative_base
+
+import instrumentation
+
+Base = declarative_base()
+
+
+class Item(Base):
+    __tablename__ = "items"
+    id = Column(Integer, primary_key=True)
+    name = Column(String(50))
+
+
+@pytest.fixture
+def session(monkeypatch):
+    monkeypatch.setattr(instrumentation, "enabled", True)
+    engine = create_engine("sqlite://")
+    instrumentation.install(engine)
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add_all([Item(id=i, name=f"item {i}") for i in range(1, 8)])
+        session.commit()
+        instrumentation.reset()
+        yield session
+    engine.dispose()
+    instrumentation.reset()
+
+
+def _rows_loaded(name):
+    return instrumentation.snapshot()["operations"][name]["rows_loaded"]
+
+
+def test_column_queries_count_rows(session):
+    @instrumentation.timed("test.columns")
+    def columns():
+        return session.query(Item.id, Item.name).filter(Item.id > 2).all()
+
+    assert len(columns()) == 5
+    assert _rows_loaded("test.columns") == 5
+
+
+def test_entities_text_and_scalars_count_rows(session):
+    @instrumentation.timed("test.mixed")
+    def mixed():
+        items = session.query(Item).limit(3).all()
+        names = session.execute(text("SELECT name FROM items WHERE id <= 2")).fetchall()
+        total = session.query(Item).count()
+        return len(items), len(names), total
+
+    assert mixed() == (3, 2, 7)
+    assert _rows_loaded("test.mixed") == 6
+
+
+def test_statements_without_rows_keep_rowcount(session):
+    @instrumentation.timed("test.update")
+    def update():
+        return session.execute(text("UPDATE items SET name = 'x' WHERE id < 4")).rowcount
+
+    assert update() == 3
+    assert _rows_loaded("test.update") == 0
+
+
+def test_streaming_queries_are_not_buffered(session):
+    @instrumentation.timed("test.stream")
+    def stream():
+        return [item.id for item in session.query(Item).order_by(Item.id).yield_per(2)]
+
+    assert stream() == list(range(1, 8))
+    assert _rows_loaded("test.stream") == 0
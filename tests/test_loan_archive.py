@@ -0,0 +1,122 @@
+# 旧数据库(borrow_records 没有 AUTOINCREMENT)归档后 id 被新借阅重用：迁移 6 重建表后再归档，不能丢失任何借阅
+
+import datetime
+
+import pytest
+from sqlalchemy import create_engine, func, select, text
+from sqlalchemy.orm import sessionmaker
+
+import db
+import loan_archive
+from models import Base, BorrowRecord, BorrowRecordArchive
+
+# 迁移 6 之前 borrow_records 的建表语句
+LEGACY_BORROW_RECORDS = """
+CREATE TABLE borrow_records (
+    id INTEGER NOT NULL,
+    user_id INTEGER,
+    book_id INTEGER,
+    borrow_date DATETIME,
+    due_date DATETIME,
+    return_date DATETIME,
+    PRIMARY KEY (id),
+    FOREIGN KEY(user_id) REFERENCES users (id),
+    FOREIGN KEY(book_id) REFERENCES books (id)
+)
+"""
+
+
+@pytest.fixture(params=["same-file", "attached"])
+def legacy_engine(request, tmp_path, monkeypatch):
+    """已执行迁移 1-5 的数据库，borrow_records 为旧的表定义；归档表在主库或 ATTACH 的独立文件中"""
+    if request.param == "attached":
+        monkeypatch.setattr(db, "ARCHIVE_DB", str(tmp_path / "archive.db"))
+    else:
+        monkeypatch.setattr(db, "ARCHIVE_DB", None)
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    db.configure_archive(engine)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE borrow_records"))
+        conn.execute(text(LEGACY_BORROW_RECORDS))
+        db.get_schema_version(conn)
+        conn.execute(text("INSERT INTO schema_version (version) VALUES (5)"))
+    monkeypatch.setattr(db, "SessionLocal", sessionmaker(bind=engine))
+    yield engine
+    engine.dispose()
+
+
+def _add_returned_loan(session, user_id, book_id, days_ago):
+    borrowed = datetime.datetime(2000, 1, 1) + datetime.timedelta(days=user_id * 10 + book_id)
+    session.add(BorrowRecord(user_id=user_id, book_id=book_id, borrow_date=borrowed,
+                             due_date=borrowed + datetime.timedelta(days=3),
+                             return_date=datetime.datetime.now() - datetime.timedelta(days=days_ago)))
+    session.commit()
+
+
+def _all_loans(session):
+    return sorted(
+        (user_id, book_id, borrow_date) for _, user_id, book_id, borrow_date, _, _
+        in session.execute(select(loan_archive.loans(include_archive=True)))
+    )
+
+
+def test_reused_ids_survive_migration_and_archiving(legacy_engine):
+    session = db.SessionLocal()
+    for book_id in (1, 2, 3):
+        _add_returned_loan(session, 1, book_id, days_ago=400)
+    assert loan_archive.archive_closed_loans(session, older_than_days=365, pause=0) == 3
+
+    # 旧表没有 AUTOINCREMENT：表空了以后新借阅从 id 1 开始，与归档表中的记录重复
+    _add_returned_loan(session, 2, 4, days_ago=400)
+    _add_returned_loan(session, 2, 5, days_ago=1)
+    reused = session.query(BorrowRecord.id).order_by(BorrowRecord.id).first()[0]
+    assert session.get(BorrowRecordArchive, reused) is not None
+    with pytest.raises(loan_archive.ArchiveConflictError):
+        loan_archive.archive_closed_loans(session, older_than_days=365, pause=0)
+    expected = _all_loans(session)
+    assert len(expected) == 5
+    session.close()
+
+    assert db.run_migrations(legacy_engine) == db.MIGRATIONS[-1][0]
+
+    session = db.SessionLocal()
+    ddl = session.execute(text("SELECT sql FROM sqlite_master WHERE name = 'borrow_records'")).scalar()
+    assert "AUTOINCREMENT" in ddl.upper()
+    assert _all_loans(session) == expected
+
+    assert loan_archive.archive_closed_loans(session, older_than_days=365, pause=0) == 1
+    _add_returned_loan(session, 3, 6, days_ago=400)
+    assert loan_archive.archive_closed_loans(session, older_than_days=365, pause=0) == 1
+    archived_ids = [record_id for (record_id,) in session.query(BorrowRecordArchive.id)]
+    assert len(archived_ids) == len(set(archived_ids)) == 5
+    assert session.query(func.count(BorrowRecord.id)).scalar() == 1
+    assert len(_all_loans(session)) == 6
+    session.close()
+
+
+def test_interrupted_batch_is_finished_by_the_next_run(legacy_engine, monkeypatch):
+    db.run_migrations(legacy_engine)
+    session = db.SessionLocal()
+    for book_id in (1, 2, 3):
+        _add_returned_loan(session, 1, book_id, days_ago=400)
+    expected = _all_loans(session)
+
+    # 复制已提交、删除之前中断
+    original_delete = loan_archive.delete
+
+    def crash(*args, **kwargs):
+        raise RuntimeError("crash")
+
+    monkeypatch.setattr(loan_archive, "delete", crash)
+    with pytest.raises(RuntimeError):
+        loan_archive.archive_closed_loans(session, older_than_days=365, pause=0)
+    session.rollback()
+    assert session.query(func.count(BorrowRecordArchive.id)).scalar() == 3
+    assert session.query(func.count(BorrowRecord.id)).scalar() == 3
+
+    monkeypatch.setattr(loan_archive, "delete", original_delete)
+    assert loan_archive.archive_closed_loans(session, older_than_days=365, pause=0) == 3
+    assert session.query(func.count(BorrowRecord.id)).scalar() == 0
+    assert sorted(set(_all_loans(session))) == expected == _all_loans(session)
+    session.close()
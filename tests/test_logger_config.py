@@ -0,0 +1,46 @@
+# 日志经队列写出：logger.exception 的堆栈要保留到 JSON 的 exception 字段，而不是拼进 message
+
+import json
+import logging
+import queue
+
+import pytest
+
+from logger_config import JsonFormatter, QueueHandler, TEXT_FORMAT
+
+
+@pytest.fixture
+def queued():
+    log_queue = queue.Queue()
+    logger = logging.getLogger("test_logger_config")
+    logger.propagate = False
+    handler = QueueHandler(log_queue)
+    logger.addHandler(handler)
+    yield logger, log_queue
+    logger.removeHandler(handler)
+
+
+def test_exception_field_survives_the_queue(queued):
+    logger, log_queue = queued
+    try:
+        1 / 0
+    except ZeroDivisionError:
+        logger.exception("借书失败: %s", "9780000000001", extra={"operation": "LibraryManager.borrow_book"})
+    record = log_queue.get_nowait()
+
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["message"] == "借书失败: 9780000000001"
+    assert entry["operation"] == "LibraryManager.borrow_book"
+    assert entry["exception"].startswith("Traceback")
+    assert "ZeroDivisionError" in entry["exception"]
+
+    text = logging.Formatter(TEXT_FORMAT).format(record)
+    assert "借书失败: 9780000000001" in text and "ZeroDivisionError" in text
+
+
+def test_records_without_exception_have_no_exception_field(queued):
+    logger, log_queue = queued
+    logger.warning("库存不足 %d", 3)
+    entry = json.loads(JsonFormatter().format(log_queue.get_nowait()))
+    assert entry["message"] == "库存不足 3"
+    assert "exception" not in entry
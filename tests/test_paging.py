@@ -0,0 +1,80 @@
+# 图书列表分页：快照或缓存中的图书已在数据库中删除时，页面从其后的图书补足，
+# 不足 limit 行的一页才是最后一页(iter_books 和图书列表据此判断结束)
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+import cache
+import catalog
+from models import Book, CatalogVersion
+
+BOOKS = 10
+
+
+@pytest.fixture
+def session(monkeypatch):
+    # 不读取版本号，快照和缓存不会因为测试中直接删除图书而被清空
+    monkeypatch.setattr(cache, "VERSION_CHECK_INTERVAL", float("inf"))
+    engine = create_engine("sqlite://")
+    for model in (Book, CatalogVersion):
+        model.__table__.create(engine)
+    with Session(engine) as session:
+        session.add_all([
+            Book(id=i, isbn=f"97800000000{i:02d}", title=f"Book {i}", author="author", category="test",
+                 total_copies=2, available_copies=1)
+            for i in range(1, BOOKS + 1)
+        ])
+        session.add(CatalogVersion(name=cache.CATALOG, version=1))
+        session.commit()
+        yield session
+    cache.search_cache.clear()
+    engine.dispose()
+
+
+def _delete(session, *ids):
+    session.query(Book).filter(Book.id.in_(ids)).delete(synchronize_session=False)
+    session.commit()
+
+
+def _load_page(session, after_id, limit):
+    rows = session.query(
+        Book.id, Book.isbn, Book.title, Book.author, Book.category, Book.available_copies, Book.total_copies
+    ).filter(Book.id > after_id).order_by(Book.id).limit(limit)
+    return [tuple(row) for row in rows]
+
+
+def _all_pages(page, limit):
+    ids = []
+    after_id = 0
+    while True:
+        rows = page(after_id, limit)
+        ids += [row[0] for row in rows]
+        if len(rows) < limit:
+            return ids
+        after_id = rows[-1][0]
+
+
+def test_snapshot_page_is_refilled_after_deletes(session, monkeypatch):
+    monkeypatch.setattr(catalog, "enabled", True)
+    monkeypatch.setattr(catalog, "_snapshot", None)
+    catalog.load(session)
+    _delete(session, 2, 3, 5)
+
+    rows = catalog.page(session, None, 0, 3)
+    assert [row[0] for row in rows] == [1, 4, 6]
+    assert rows[0][5:] == (1, 2)
+    assert _all_pages(lambda after_id, limit: catalog.page(session, None, after_id, limit), 3) == [1, 4, 6, 7, 8, 9, 10]
+    assert _all_pages(lambda after_id, limit: catalog.page(session, "Book", after_id, limit), 2) == [1, 4, 6, 7, 8, 9, 10]
+
+
+def test_cached_page_is_reloaded_after_deletes(session):
+    def page(after_id, limit):
+        return cache.search_page(session, (None, after_id, limit), lambda: _load_page(session, after_id, limit))
+
+    assert [row[0] for row in page(0, 3)] == [1, 2, 3]
+    _delete(session, 2)
+    assert [row[0] for row in page(0, 3)] == [1, 3, 4]
+    # 重新查询的结果已放回缓存
+    assert cache.search_cache.get((None, 0, 3))[0]
+    assert _all_pages(page, 3) == [1, 3, 4, 5, 6, 7, 8, 9, 10]
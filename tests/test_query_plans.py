@@ -0,0 +1,46 @@
+# 迁移前后热点查询的执行计划：迁移前全表扫描(SCAN)，迁移后通过新建的部分索引查找(SEARCH)
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+import db
+from models import Base, BorrowRecord
+
+
+@pytest.fixture
+def legacy_engine(tmp_path, monkeypatch):
+    """迁移机制引入之前的数据库：有全部表，但 borrow_records 上没有索引，也没有 schema_version"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    db.configure_archive(engine)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        for index in BorrowRecord.__table__.indexes:
+            conn.execute(text(f"DROP INDEX {index.name}"))
+    # 迁移函数通过 db.SessionLocal 创建会话
+    monkeypatch.setattr(db, "SessionLocal", sessionmaker(bind=engine))
+    yield engine
+    engine.dispose()
+
+
+def test_hot_queries_switch_from_scan_to_index_search(legacy_engine):
+    before = db.check_query_plans(legacy_engine)
+    for name, (uses_index, plan) in before.items():
+        assert not uses_index, name
+        assert any(line.startswith("SCAN") for line in plan), (name, plan)
+
+    assert db.run_migrations(legacy_engine) == db.MIGRATIONS[-1][0]
+
+    after = db.check_query_plans(legacy_engine)
+    for name, (sql, index_name) in db.HOT_QUERIES.items():
+        uses_index, plan = after[name]
+        assert uses_index, (name, plan)
+        assert any(line.startswith("SEARCH") and index_name in line for line in plan), (name, plan)
+        assert not any(line.startswith("SCAN") for line in plan), (name, plan)
+
+
+def test_migrations_are_recorded_and_not_repeated(legacy_engine):
+    version = db.run_migrations(legacy_engine)
+    assert db.run_migrations(legacy_engine) == version
+    with legacy_engine.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM schema_version")).scalar() == len(db.MIGRATIONS)
@@ -0,0 +1,55 @@
+# HTTP 请求解析：无效的请求头返回 400，而不是让连接直接断开
+
+import asyncio
+
+import pytest
+
+import server
+
+
+def _read(data):
+    async def read():
+        reader = asyncio.StreamReader(limit=1024)
+        reader.feed_data(data)
+        reader.feed_eof()
+        return await server.read_request(reader)
+    return asyncio.run(read())
+
+
+def test_reads_body_by_content_length():
+    request = _read(b'POST /borrow HTTP/1.1\r\nContent-Length: 17\r\n\r\n{"isbn": "12345"}')
+    assert request == ("POST", "/borrow", "HTTP/1.1", {"content-length": "17"}, b'{"isbn": "12345"}')
+
+
+@pytest.mark.parametrize("length", [b"abc", b"-1", b"+5", b"1.5", b"0x10", b"\xb2"])
+def test_invalid_content_length_is_a_bad_request(length):
+    with pytest.raises(server.HttpError) as error:
+        _read(b"POST /borrow HTTP/1.1\r\nContent-Length: " + length + b"\r\n\r\n{}")
+    assert error.value.status == 400
+
+
+def test_oversized_body_is_rejected():
+    with pytest.raises(server.HttpError) as error:
+        _read(f"POST /borrow HTTP/1.1\r\nContent-Length: {server.MAX_BODY + 1}\r\n\r\n".encode())
+    assert error.value.status == 413
+
+
+def test_overlong_header_line_is_a_bad_request():
+    with pytest.raises(server.HttpError) as error:
+        _read(b"GET /health HTTP/1.1\r\nX-Long: " + b"a" * 4096 + b"\r\n\r\n")
+    assert error.value.status == 400
+
+
+def test_connection_gets_a_400_response():
+    async def roundtrip():
+        srv = await asyncio.start_server(server.LibraryServer(None).handle_connection, "127.0.0.1", 0)
+        port = srv.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"POST /borrow HTTP/1.1\r\nContent-Length: -1\r\n\r\n")
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+        srv.close()
+        await srv.wait_closed()
+        return response
+    assert asyncio.run(roundtrip()).startswith(b"HTTP/1.1 400 ")
@@ -0,0 +1,103 @@
+# 后台任务执行器
+# 数据库操作在工作线程中执行，结果放入队列，由 Tk 主线程通过 root.after 定时取回并回调，
+# 避免慢查询或 SQLite 锁等待卡住界面。
+
+import queue
+from concurrent.futures import ThreadPoolExecutor
+
+from logger_config import logger
+
+
+class TaskRunner:
+    def __init__(self, root, max_workers=4, poll_interval=30, initializer=None):
+        self.root = root
+        self.poll_interval = poll_interval
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db-worker")
+        self.results = queue.Queue()
+        # 其他线程转交给主线程执行的回调 (callback, value)，例如变更事件
+        self.posted = queue.Queue()
+
+        # key -> 最新一次请求的序号，旧序号的结果直接丢弃(例如被新的搜索取代)
+        self.generations = {}
+        self.pending = 0
+        # 忙碌状态变化回调 on_busy(bool)，用于显示等待光标等
+        self.on_busy = None
+
+        # 初始化任务(例如建表、迁移)在工作线程中执行，之后提交的任务会先等待它完成，
+        # 界面不必等初始化结束就可以显示
+        self.ready = self.executor.submit(initializer) if initializer else None
+
+        self.root.after(self.poll_interval, self._poll)
+
+    def submit(self, fn, on_success=None, on_error=None, key=None):
+        """
+        在工作线程中执行 fn(session)，完成后在主线程调用 on_success(结果) 或 on_error(异常)。
+        fn 应返回普通数据(元组、字典等)而非仍依赖会话的 ORM 对象。
+        相同 key 的新任务提交后，尚未返回的旧任务会被取消或忽略其结果。
+        只能在主线程调用。
+        """
+        generation = None
+        if key is not None:
+            generation = self.generations.get(key, 0) + 1
+            self.generations[key] = generation
+
+        self.pending += 1
+        if self.pending == 1 and self.on_busy:
+            self.on_busy(True)
+        self.executor.submit(self._run, fn, on_success, on_error, key, generation)
+
+    def _is_current(self, key, generation):
+        return key is None or self.generations.get(key) == generation
+
+    def _run(self, fn, on_success, on_error, key, generation):
+        if not self._is_current(key, generation):
+            # 排队期间已被新请求取代，不再执行
+            self.results.put((None, None, key, generation))
+            return
+
+        # 每个任务使用工作线程自己的会话，结束后释放连接并清空 identity map
+        try:
+            if self.ready:
+                self.ready.result()     # 初始化失败时，异常交给 on_error 处理
+            import db                   # SQLAlchemy 导入较慢，推迟到第一次执行任务时
+            with db.session_scope() as session:
+                value = fn(session)
+            self.results.put((on_success, value, key, generation))
+        except Exception as e:
+            logger.error(f"Background task failed: {e}")
+            self.results.put((on_error, e, key, generation))
+
+    def post(self, callback, value):
+        """可在任意线程调用：在主线程的下一次轮询中执行 callback(value)"""
+        self.posted.put((callback, value))
+
+    def _poll(self):
+        while True:
+            try:
+                callback, value = self.posted.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                callback(value)
+            except Exception as e:
+                logger.error(f"Posted callback failed: {e}")
+
+        while True:
+            try:
+                callback, value, key, generation = self.results.get_nowait()
+            except queue.Empty:
+                break
+
+            self.pending -= 1
+            if self.pending == 0 and self.on_busy:
+                self.on_busy(False)
+            if callback and self._is_current(key, generation):
+                try:
+                    callback(value)
+                except Exception as e:
+                    logger.error(f"Task callback failed: {e}")
+
+        self.root.after(self.poll_interval, self._poll)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)